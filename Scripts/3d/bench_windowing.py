@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_windowing.py — Compara o caminho float (load_pixels + to_uint8) com o
+caminho LUT (build_window_lut + to_uint8_lut) do dicom2png.py.
+
+Gera quadros sintéticos de CT (12/16 bits) com rescale, janela e MONOCHROME1,
+mede o tempo dos dois caminhos e verifica se as saídas são idênticas.
+
+Uso:
+  python bench_windowing.py [--frames 50] [--size 512] [--seed 0]
+
+Sobre a igualdade bit a bit: a transformação por pixel e a tabela uint8 usam
+exatamente as mesmas operações do caminho float; a única fonte possível de
+divergência são os percentis 2/98, que o caminho LUT interpola a partir do
+histograma em float64. Se o np.percentile interpolar em float32, os limites
+da janela podem diferir no último ulp e, raramente, um pixel no limiar de
+arredondamento muda de 1 nível. O relatório mostra a fração de pixels iguais
+e a maior diferença encontrada.
+"""
+
+import argparse, time
+import numpy as np
+from pydicom.dataset import Dataset
+
+from dicom2png import (apply_modality_voi, is_monochrome1, to_uint8,
+                       build_window_lut, to_uint8_lut)
+
+CASES = {
+    # nome: (dtype bruto, bits, slope, intercept, janela (centro, largura) ou None, fotometria)
+    "ct_int16_rescale":  (np.int16,  12, 1.0, -1024.0, None,          "MONOCHROME2"),
+    "ct_uint16_window":  (np.uint16, 12, 1.0, -1024.0, (40.0, 400.0), "MONOCHROME2"),
+    "ct_uint16_raw":     (np.uint16, 16, 1.0,     0.0, None,          "MONOCHROME2"),
+    "cr_uint16_mono1":   (np.uint16, 12, 1.0,     0.0, None,          "MONOCHROME1"),
+}
+
+def make_ds(bits, slope, inter, window, photometric, signed):
+    ds = Dataset()
+    ds.BitsStored = bits
+    ds.BitsAllocated = 16
+    ds.PixelRepresentation = 1 if signed else 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.RescaleSlope = slope
+    ds.RescaleIntercept = inter
+    if window:
+        ds.WindowCenter, ds.WindowWidth = window
+    return ds
+
+def make_frames(dtype, bits, n, size, rng):
+    # "Anatomia" suave + ruído, ocupando boa parte da faixa de bits
+    yy, xx = np.mgrid[0:size, 0:size] / float(size)
+    base = (np.sin(6*xx) * np.cos(4*yy) + 1.0) * (2**(bits-2))
+    frames = base[None] + rng.normal(0, 2**(bits-6), size=(n, size, size))
+    lo = -(2**(bits-1)) if np.dtype(dtype).kind == "i" else 0
+    return np.clip(frames + (0 if lo < 0 else 2**(bits-3)), lo, 2**bits-1).astype(dtype)
+
+def float_path(raw, ds):
+    # Mesmo que load_pixels(), mas a partir de um array já decodificado
+    arr = apply_modality_voi(raw, ds)
+    if is_monochrome1(ds):
+        arr = arr.max()-arr
+    return [to_uint8(arr[i]) for i in range(arr.shape[0])]
+
+def lut_path(raw, ds):
+    lut = build_window_lut(raw, ds)
+    return [to_uint8_lut(raw[i], lut) for i in range(raw.shape[0])]
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark: janela float vs. histograma/LUT.")
+    ap.add_argument("--frames", type=int, default=50)
+    ap.add_argument("--size", type=int, default=512)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'caso':20s} {'float (ms/q)':>13s} {'lut (ms/q)':>11s} {'speedup':>8s} {'iguais':>9s} {'max|d|':>7s}")
+    for name, (dtype, bits, slope, inter, window, phot) in CASES.items():
+        ds = make_ds(bits, slope, inter, window, phot, np.dtype(dtype).kind == "i")
+        raw = make_frames(dtype, bits, args.frames, args.size, rng)
+
+        t0 = time.perf_counter(); ref = float_path(raw, ds); t_float = time.perf_counter() - t0
+        t0 = time.perf_counter(); out = lut_path(raw, ds);   t_lut = time.perf_counter() - t0
+
+        ref, out = np.stack(ref), np.stack(out)
+        diff = np.abs(ref.astype(np.int16) - out.astype(np.int16))
+        same = float(np.mean(diff == 0))
+        ms = lambda t: 1000.0 * t / args.frames
+        print(f"{name:20s} {ms(t_float):13.2f} {ms(t_lut):11.2f} {t_float/max(t_lut,1e-9):7.1f}x {same:9.4%} {int(diff.max()):7d}")
+
+if __name__ == "__main__":
+    main()
@@ -12,20 +12,48 @@ Novidades:
 - Nomes "slug" seguros (sem espaços/especiais).
 - Mantém todas as opções anteriores (--only-mods, --frames, --clahe, etc).
 - **NOVO:** Filtro para apagar subdiretórios com mais de 150 imagens.
+- Passo prévio só de cabeçalhos (header_prefilter): filtros e limite de
+  imagens por série aplicados antes de decodificar qualquer pixel.
+- Variantes (variants): várias janelas/CLAHE/empacotamento RGB a partir de
+  uma única decodificação, mais sidecar opcional em HU (hu_sidecar).
+- Saída em volume (output_format="volume"): um .npy + .json por série, em
+  <pasta de saída>/<SeriesUID6>.
+- Modo série (mode="series"): fatias ordenadas, janela única por série e
+  nomes com prefixo de ordem.
+- Conversão incremental (manifest): um manifesto JSONL na saída registra
+  tamanho/mtime, SOPInstanceUID, hash das opções, PNGs gerados e motivo de
+  descarte de cada arquivo; reexecuções só processam o que mudou.
+- Varredura em fluxo: cada pasta de paciente é enviada ao pool assim que
+  termina de ser listada, com no máximo max_in_flight tarefas pendentes.
+- Índice de cabeçalhos (header_index): o passo de cabeçalhos consulta o
+  índice SQLite de dicom_index.py em vez de reabrir cada arquivo.
 
 Requisitos:
   pip install pydicom pillow numpy
   (opcional) pip install opencv-python
 """
 
-import argparse, os, sys, concurrent.futures as cf, re
+import argparse, os, sys, concurrent.futures as cf, re, json, hashlib, threading, time, io
+from contextlib import nullcontext
+from collections import Counter, defaultdict
 from pathlib import Path
 import numpy as np
 from PIL import Image
 import pydicom
 from pydicom.pixel_data_handlers.util import apply_voi_lut
+try:
+    # pydicom >= 3: decodificação quadro a quadro direto do arquivo
+    from pydicom.pixels import iter_pixels, pixel_array as decode_frame
+    HAS_FRAME_DECODE = True
+except Exception:
+    HAS_FRAME_DECODE = False
 import shutil # Adicionado para exclusão de diretórios
 
+# Módulos compartilhados ficam em Scripts/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from volume_store import write_volume
+import dicom_index
+
 # --- CONFIGURAÇÕES DO USUÁRIO ---
 # Defina seus caminhos e opções aqui
 # Substitua pelos seus caminhos reais!
@@ -39,13 +67,47 @@ CODED_OPTIONS = {
     "clahe": True,              # Aplicar melhoria de contraste (requer opencv-python)
     "frames": "all",         # Qual quadro salvar (first, middle, last, all)
     "max_size": 1024,           # Redimensionar o lado maior (0 para desativar)
-    "workers": 4,               # Número de threads
+    # "float" (percentis + aritmética float) ou "lut" (histograma + tabela, só
+    # para dados inteiros de até 16 bits; demais caem no caminho float)
+    "windowing": "float",
+    # Multi-frame: decodifica um quadro por vez em vez do pixel_array inteiro
+    # (requer pydicom >= 3; sem ele, cai na decodificação completa)
+    "stream_frames": True,
+    # "file": cada DICOM é uma tarefa independente.
+    # "series": agrupa por SeriesInstanceUID, ordena por InstanceNumber /
+    # ImagePositionPatient, usa uma janela única para a pilha e grava os
+    # PNGs com prefixo de ordem (0000_, 0001_, ...)
+    "mode": "file",
+    # Várias saídas a partir de uma única decodificação (só no modo "file").
+    # Vazio = saída única de sempre. Cada variante vira uma árvore própria em
+    # <output>/<nome>/...; a primeira é a referência do filtro de qualidade.
+    #   {"name": "auto"}                                 -> pipeline padrão (VOI + percentis)
+    #   {"name": "osso", "window": (500, 2000)}          -> janela fixa (centro, largura) em HU
+    #   {"name": "partes_moles", "window": (40, 400), "clahe": False}
+    #   {"name": "rgb3", "pack": [(40, 400), (500, 2000), (-600, 1500)]}  -> 3 janelas nos canais RGB
+    "variants": [],
+    # Sidecar com os valores brutos (HU) de cada arquivo em <output>/_hu/...:
+    # None, "float16" ou "int16"; permite rejanelar sem decodificar o DICOM
+    "hu_sidecar": None,
+    # "png": uma imagem por fatia. "volume": um .npy (uint8) + índice .json por
+    # série, <pasta>/<SeriesUID6>.npy, mapeável em memória (implica
+    # mode="series"; ver volume_store.py
+    # para leitura e conversão de/para pastas de PNG)
+    "output_format": "png",
+    # Relatório JSON de tempo por etapa (p50/p95) e descartes por motivo;
+    # caminho relativo à saída, ou None para desativar a instrumentação
+    "stats_report": None,  # ex: "conversion_report.json"
+    "workers": 4,               # Número de workers (threads ou processos)
+    "executor": "process",      # "process" (escala com núcleos) ou "thread"
+    "chunk_size": 32,           # Arquivos por tarefa submetida ao pool
+    "max_in_flight": 0,         # Tarefas pendentes no pool (0 = 4 x workers)
     "min_entropy": 1.5,         # Filtrar imagens muito escuras/uniformes
     "drop_derived": False,
     # ADICIONE ESTAS QUATRO LINHAS (Parâmetros de Qualidade/Filtro):
     "min_nonblack_pct": 0.05, # Mínimo de pixels não-pretos (evita imagens totalmente pretas)
     "min_p2p": 10,            # Mínimo contraste (Peak-to-Peak)
     "min_var": 50,            # Mínima variância do pixel (evita imagens uniformes)
+    "log_quality": False,     # Imprime as métricas dos quadros reprovados
     
     # ADICIONE ESTA LINHA (Configuração de Cor):
     "rgb": True,             # Se deve forçar imagens de saída para RGB (False = monocromático, se a fonte for)
@@ -53,6 +115,17 @@ CODED_OPTIONS = {
     
     # NOVO: Limite de imagens para exclusão de subdiretório
     "max_images_per_series": 200, 
+    # Passo prévio só de cabeçalhos: aplica os filtros e descarta séries acima
+    # do limite antes de decodificar pixels (a limpeza final continua valendo)
+    "header_prefilter": True,
+    # Manifesto persistente na saída: reexecuções pulam arquivos inalterados
+    # e retomam de onde uma execução interrompida parou
+    "manifest": True,
+    # Índice SQLite de cabeçalhos (dicom_index.py) compartilhado com as outras
+    # ferramentas; None = lê os cabeçalhos dos arquivos. Com refresh=False o
+    # índice é usado como está (sem varrer a entrada para atualizá-lo)
+    "header_index": None,  # ex: "/dados/dicom_index.sqlite"
+    "header_index_refresh": True,
 }
 # --- FIM DAS CONFIGURAÇÕES DO USUÁRIO ---
 
@@ -69,6 +142,74 @@ def short_uid(u):
     u = str(u or "")
     return u[-6:] if len(u) >= 6 else u
 
+# ---------- instrumentação ----------
+STAGES = ("read", "decode", "voi", "to_uint8", "clahe", "resize", "quality", "png_encode", "write")
+# Histograma logarítmico de durações (1 µs .. ~100 s): agregável entre
+# workers sem guardar cada amostra; p50/p95 têm a resolução de um bin (~5%)
+_BINS_PER_DECADE = 50
+_NBINS = 8 * _BINS_PER_DECADE
+
+class StageStats:
+    """Tempo por etapa acumulado em histogramas; mesclável entre workers."""
+    def __init__(self):
+        self.hist = {s: [0]*_NBINS for s in STAGES}
+        self.total = {s: 0.0 for s in STAGES}
+
+    def add(self, stage, dt):
+        b = int((np.log10(max(dt, 1e-6)) + 6.0) * _BINS_PER_DECADE)
+        self.hist[stage][min(max(b, 0), _NBINS-1)] += 1
+        self.total[stage] += dt
+
+    def time(self, stage):
+        return _StageTimer(self, stage)
+
+    def merge(self, other):
+        for st in STAGES:
+            self.hist[st] = [a+b for a, b in zip(self.hist[st], other.hist[st])]
+            self.total[st] += other.total[st]
+
+    def _quantile(self, stage, q):
+        h = self.hist[stage]
+        n = sum(h)
+        acc = 0
+        for b, c in enumerate(h):
+            acc += c
+            if acc >= q*n:
+                # centro geométrico do bin
+                return 10 ** ((b + 0.5) / _BINS_PER_DECADE - 6.0)
+        return 0.0
+
+    def summary(self):
+        out = {}
+        for st in STAGES:
+            n = sum(self.hist[st])
+            if not n:
+                continue
+            out[st] = {"count": n, "total_s": round(self.total[st], 3),
+                       "mean_ms": round(1000*self.total[st]/n, 3),
+                       "p50_ms": round(1000*self._quantile(st, 0.50), 3),
+                       "p95_ms": round(1000*self._quantile(st, 0.95), 3)}
+        return out
+
+class _StageTimer:
+    __slots__ = ("stats", "stage", "t0")
+    def __init__(self, stats, stage):
+        self.stats, self.stage = stats, stage
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+    def __exit__(self, *exc):
+        self.stats.add(self.stage, time.perf_counter() - self.t0)
+
+class _NoStats:
+    """Substituto sem custo quando a instrumentação está desligada."""
+    def time(self, stage):
+        return nullcontext()
+
+NO_STATS = _NoStats()
+
+def new_stats(args):
+    return StageStats() if getattr(args, "stats_report", None) else None
+
 # ---------- filtros/normalização ----------
 try:
     import cv2
@@ -84,8 +225,12 @@ NOT_IMAGE_SOP_PREFIXES = {
     "1.2.840.10008.5.1.4.1.1.104",
 }
 
-def looks_like_non_image(ds):
-    if "PixelData" not in ds: return True
+def looks_like_non_image(ds, header_only=False):
+    # Lido com stop_before_pixels, o dataset não tem PixelData: usa Rows como
+    # indício de que o objeto carrega um módulo de imagem
+    if header_only:
+        if "Rows" not in ds: return True
+    elif "PixelData" not in ds: return True
     sop = str(getattr(ds,"SOPClassUID","") or "")
     return any(sop.startswith(pref) for pref in NOT_IMAGE_SOP_PREFIXES)
 
@@ -97,50 +242,157 @@ def modality_allowed(ds, only_mods):
     if not only_mods: return True
     return str(getattr(ds,"Modality","") or "").upper() in only_mods
 
-def load_pixels(ds):
-    arr = ds.pixel_array
+def apply_rescale(arr, ds):
     slope = float(getattr(ds,"RescaleSlope",1.0) or 1.0)
     inter = float(getattr(ds,"RescaleIntercept",0.0) or 0.0)
     if slope!=1.0 or inter!=0.0:
         arr = arr.astype(np.float32)*slope + inter
+    return arr
+
+def apply_modality_voi(arr, ds):
+    # Rescale + VOI LUT/janela: transformação ponto a ponto (sem dependência
+    # entre pixels), o que permite tabelá-la no caminho "lut"
+    arr = apply_rescale(arr, ds)
     try:
         arr = apply_voi_lut(arr, ds)
     except Exception:
         pass
-    if str(getattr(ds,"PhotometricInterpretation","")).upper()=="MONOCHROME1":
+    return arr
+
+def is_monochrome1(ds):
+    return str(getattr(ds,"PhotometricInterpretation","")).upper()=="MONOCHROME1"
+
+def transform_pixels(arr, ds):
+    arr = apply_modality_voi(arr, ds)
+    if is_monochrome1(ds):
         arr = arr.max()-arr
     return arr
 
+def load_pixels(ds):
+    return transform_pixels(ds.pixel_array, ds)
+
+def window_bounds(x):
+    lo,hi = np.percentile(x,2), np.percentile(x,98)
+    if hi<=lo:
+        lo,hi = float(np.min(x)), float(np.max(x))
+    if hi<=lo:
+        hi = lo + 1.0
+    return lo, hi
+
+def apply_window(x, lo, hi):
+    y = np.clip((x-lo)/(hi-lo),0,1)
+    return (y*255.0 + 0.5).astype(np.uint8)
+
 def to_uint8(img):
     def scale(x):
-        lo,hi = np.percentile(x,2), np.percentile(x,98)
-        if hi<=lo:
-            lo,hi = float(np.min(x)), float(np.max(x))
-        if hi<=lo:
-            hi = lo + 1.0
-        y = np.clip((x-lo)/(hi-lo),0,1)
-        return (y*255.0 + 0.5).astype(np.uint8)
+        return apply_window(x, *window_bounds(x))
     if img.ndim==2:
         return scale(img)
     if img.ndim==3:
         return np.stack([scale(img[...,c]) for c in range(img.shape[2])],axis=2)
     raise ValueError("Dimensão não suportada para to_uint8")
 
+# ---------- caminho rápido: janela por histograma + LUT ----------
+def lut_eligible(raw, ds):
+    """Dados inteiros de até 16 bits e um canal: o domínio cabe numa tabela."""
+    return (raw.dtype.kind in "iu" and raw.dtype.itemsize <= 2
+            and int(getattr(ds,"SamplesPerPixel",1) or 1) == 1)
+
+def build_window_lut(raw, ds):
+    """
+    Tabela a transformação de load_pixels() sobre o domínio [min, max] dos
+    valores brutos do arquivo (todos os quadros). A inversão MONOCHROME1 usa o
+    máximo dos valores transformados presentes, como arr.max() no caminho float.
+    """
+    off = int(raw.min())
+    size = int(raw.max()) - off + 1
+    domain = (np.arange(size, dtype=np.int64) + off).astype(raw.dtype)
+    vals = apply_modality_voi(domain, ds)
+    if is_monochrome1(ds):
+        present = np.bincount((raw.astype(np.int32) - off).ravel(), minlength=size) > 0
+        vals = vals[present].max() - vals
+    vals = np.asarray(vals)
+    order = np.argsort(vals, kind="stable")
+    # dtype que np.percentile devolveria para um array com o dtype de vals
+    pct_dtype = np.asarray(np.percentile(vals[:1], 2)).dtype
+    return {"off": off, "size": size, "vals": vals, "order": order,
+            "sorted": vals[order], "pct_dtype": pct_dtype}
+
+def _percentile_from_counts(lut, cum, n, q):
+    # Interpolação linear do np.percentile (método padrão) sobre as
+    # estatísticas de ordem obtidas do histograma acumulado
+    idx = q/100.0*(n-1)
+    k = int(np.floor(idx)); t = idx - k
+    a = float(lut["sorted"][np.searchsorted(cum, k, side="right")])
+    b = float(lut["sorted"][np.searchsorted(cum, min(k+1, n-1), side="right")])
+    v = a + (b-a)*t if t < 0.5 else b - (b-a)*(1-t)
+    return lut["pct_dtype"].type(v)
+
+def to_uint8_lut(raw_frame, lut):
+    """
+    Equivalente a to_uint8(quadro de load_pixels()) para um quadro bruto: dois
+    percentis por histograma (bincount) e uma única consulta à tabela uint8.
+    """
+    idx = raw_frame.astype(np.int32) - lut["off"]
+    counts = np.bincount(idx.ravel(), minlength=lut["size"])[lut["order"]]
+    cum = np.cumsum(counts)
+    n = int(cum[-1])
+    lo, hi = _percentile_from_counts(lut, cum, n, 2), _percentile_from_counts(lut, cum, n, 98)
+    if hi<=lo:
+        present = lut["sorted"][counts > 0]
+        lo,hi = float(present.min()), float(present.max())
+    if hi<=lo:
+        hi = lo + 1.0
+    y = np.clip((lut["vals"]-lo)/(hi-lo),0,1)
+    table = (y*255.0 + 0.5).astype(np.uint8)
+    return table[idx]
+
 def ensure_rgb(u8, force_rgb):
     if u8.ndim==2 and force_rgb:
         return np.stack([u8,u8,u8],axis=2)
     return u8
 
-def apply_clahe(u8, use):
+_tls = threading.local()
+
+def _clahe():
+    # Um objeto CLAHE por thread, reaproveitado entre imagens
+    clahe = getattr(_tls, "clahe", None)
+    if clahe is None:
+        clahe = _tls.clahe = cv2.createCLAHE(clipLimit=2.0,tileGridSize=(8,8))
+    return clahe
+
+_GRAY_LAB = None
+
+def _gray_lab_tables():
+    """
+    Tabelas do caminho LAB para cinza replicado em RGB: cinza -> L e
+    L (com a=b=128) -> RGB. Como tudo é por pixel, reproduzem exatamente
+    cvtColor(RGB2LAB) / cvtColor(LAB2RGB) sem a imagem de 3 canais.
+    """
+    global _GRAY_LAB
+    if _GRAY_LAB is None:
+        g = np.arange(256, dtype=np.uint8).reshape(1, 256)
+        to_l = cv2.cvtColor(np.dstack([g, g, g]), cv2.COLOR_RGB2LAB)[0, :, 0].copy()
+        mid = np.full_like(g, 128)
+        to_rgb = cv2.cvtColor(np.dstack([g, mid, mid]), cv2.COLOR_LAB2RGB)[0].copy()
+        _GRAY_LAB = (to_l, to_rgb)
+    return _GRAY_LAB
+
+def apply_clahe(u8, use, rgb=False):
+    """
+    CLAHE no canal único ou no L (LAB) de imagens coloridas. Com rgb=True, um
+    cinza sai como a imagem que a expansão para RGB + LAB daria (3 canais).
+    """
     if not use or not HAS_CV2:
         return u8
     if u8.ndim==2:
-        clahe=cv2.createCLAHE(clipLimit=2.0,tileGridSize=(8,8))
-        return clahe.apply(u8)
+        if not rgb:
+            return _clahe().apply(u8)
+        to_l, to_rgb = _gray_lab_tables()
+        return to_rgb[_clahe().apply(to_l[u8])]
     lab=cv2.cvtColor(u8,cv2.COLOR_RGB2LAB)
     l,a,b=cv2.split(lab)
-    clahe=cv2.createCLAHE(clipLimit=2.0,tileGridSize=(8,8))
-    l2=clahe.apply(l)
+    l2=_clahe().apply(l)
     return cv2.cvtColor(cv2.merge([l2,a,b]), cv2.COLOR_LAB2RGB)
 
 def entropy(u8):
@@ -159,8 +411,54 @@ def contrast(u8):
     g=u8 if u8.ndim==2 else (0.299*u8[...,0]+0.587*u8[...,1]+0.114*u8[...,2]).astype(np.uint8)
     return int(g.max()-g.min())
 
+_LEVELS = np.arange(256, dtype=np.float64)
+# Luma (truncada) de um cinza replicado em RGB: nem sempre é o próprio nível
+_GRAY_LUMA = (0.299*_LEVELS+0.587*_LEVELS+0.114*_LEVELS).astype(np.uint8)
+
+def quality_metrics(u8, a=None, b=None, c=None, d=None, th=5, rgb=False):
+    """
+    Calcula nonblack, entropy, contrast e var a partir de um único histograma
+    (uma passada sobre a imagem, sem cópias em float). Com limiares informados,
+    para no primeiro que falhar. rgb=True avalia um cinza como a imagem já
+    expandida para RGB (mesmas decisões de antes da expansão tardia).
+    Retorna (ok, métricas) — as métricas incluem apenas o que foi calculado.
+    """
+    if u8.ndim==2:
+        h=np.bincount(u8.ravel(),minlength=256)
+        hist=np.bincount(_GRAY_LUMA,weights=h,minlength=256).astype(np.int64) if rgb else h
+    else:
+        g=(0.299*u8[...,0]+0.587*u8[...,1]+0.114*u8[...,2]).astype(np.uint8)
+        hist=np.bincount(g.ravel(),minlength=256)
+        h=None
+    n=int(hist.sum())
+    m={}
+    if n<=0:
+        return False, m
+
+    m["nonblack"]=float(hist[th+1:].sum())/n
+    if a is not None and m["nonblack"]<a: return False, m
+
+    p=hist[hist>0]/float(n)
+    m["entropy"]=float(-(p*np.log2(p)).sum())
+    if b is not None and m["entropy"]<b: return False, m
+
+    nz=np.flatnonzero(hist)
+    m["contrast"]=int(nz[-1]-nz[0])
+    if c is not None and m["contrast"]<c: return False, m
+
+    # Variância pelos momentos do histograma dos níveis; imagens coloridas usam
+    # todos os canais, como o np.var original
+    if h is None:
+        h=np.bincount(u8.ravel(),minlength=256)
+    k=float(h.sum())
+    mean=float((h*_LEVELS).sum())/k
+    m["var"]=float((h*(_LEVELS-mean)**2).sum())/k
+    if d is not None and m["var"]<d: return False, m
+
+    return True, m
+
 def passes(u8, a,b,c,d):
-    return (nonblack(u8)>=a and entropy(u8)>=b and contrast(u8)>=c and float(np.var(u8.astype(np.float32)))>=d)
+    return quality_metrics(u8, a, b, c, d)[0]
 
 def resize_if_needed(u8,maxsz):
     if not maxsz or max(u8.shape[:2])<=maxsz: return u8
@@ -172,9 +470,16 @@ def resize_if_needed(u8,maxsz):
     im = im.resize((new_w,new_h), resample=Image.Resampling.LANCZOS)
     return np.asarray(im)
 
-def save_png(u8, path:Path):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    Image.fromarray(u8 if u8.ndim==2 else u8[...,:3]).save(path)
+def save_png(u8, path:Path, mkdir=True, st=NO_STATS):
+    # Codifica em memória e grava em seguida, para separar as duas etapas
+    with st.time("png_encode"):
+        buf = io.BytesIO()
+        Image.fromarray(u8 if u8.ndim==2 else u8[...,:3]).save(buf, format="PNG")
+    with st.time("write"):
+        if mkdir:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(buf.getbuffer())
 
 def choose_frames(arr, which):
     # arr: (H,W), (F,H,W) ou (F,H,W,C)
@@ -194,6 +499,170 @@ def choose_frames(arr, which):
         return [arr[i] for i in range(F)]
     return [np.squeeze(arr)]
 
+def number_of_frames(ds):
+    try:
+        return int(getattr(ds, "NumberOfFrames", 1) or 1)
+    except Exception:
+        return 1
+
+def iter_frames_lazy(p, ds, which):
+    """
+    Decodifica do arquivo apenas os quadros pedidos, um de cada vez: com
+    first/middle/last só o quadro escolhido; com "all", um por iteração.
+    """
+    nf = number_of_frames(ds)
+    idx = {"first": 0, "last": nf-1, "middle": nf//2}.get(which)
+    if idx is not None:
+        yield decode_frame(str(p), index=idx)
+    else:
+        yield from iter_pixels(str(p))
+
+def decode_frames(p, ds, args, st=NO_STATS):
+    """
+    Itera pares (quadro, lut) prontos para to_uint8/to_uint8_lut.
+
+    Arquivos multi-frame com stream_frames são decodificados quadro a quadro;
+    o pico de memória fica limitado a um quadro por worker. Nesse modo a
+    inversão MONOCHROME1 usa o máximo do próprio quadro — equivalente após a
+    janela por percentis, que é invariante a esse deslocamento.
+    """
+    use_lut = getattr(args, "windowing", "float") == "lut"
+    if getattr(args, "stream_frames", False) and HAS_FRAME_DECODE and number_of_frames(ds) > 1:
+        def gen():
+            frames = iter_frames_lazy(p, ds, args.frames)
+            while True:
+                with st.time("decode"):
+                    fr = next(frames, None)
+                if fr is None:
+                    return
+                with st.time("voi"):
+                    if use_lut and lut_eligible(fr, ds):
+                        item = fr, build_window_lut(fr, ds)
+                    else:
+                        item = transform_pixels(fr, ds), None
+                yield item
+        return gen()
+
+    # Decodificação completa; no caminho "lut" a transformação fica tabelada
+    # e os quadros seguem com valores brutos
+    with st.time("decode"):
+        arr = ds.pixel_array
+    with st.time("voi"):
+        if use_lut and lut_eligible(arr, ds):
+            lut = build_window_lut(arr, ds)
+            return ((fr, lut) for fr in choose_frames(arr, args.frames))
+        arr = transform_pixels(arr, ds)
+    return ((fr, None) for fr in choose_frames(arr, args.frames))
+
+def iter_raw_frames(p, ds, args):
+    """Quadros brutos (sem rescale/VOI) escolhidos por args.frames."""
+    if getattr(args, "stream_frames", False) and HAS_FRAME_DECODE and number_of_frames(ds) > 1:
+        return iter_frames_lazy(p, ds, args.frames)
+    return iter(choose_frames(ds.pixel_array, args.frames))
+
+# ---------- variantes de saída (uma decodificação, várias janelas) ----------
+def window_range(w):
+    c, width = float(w[0]), float(w[1])
+    return c - width/2.0, c + width/2.0
+
+def render_variant(v, fr, hu, ds, args, lut=None):
+    """
+    Gera o uint8 de uma variante a partir do quadro bruto e dos valores em HU.
+    "auto" segue o mesmo caminho da exportação principal (lut = tabela de
+    build_window_lut quando windowing == "lut"); janelas fixas, sozinhas ou
+    empacotadas, invertem o contraste em MONOCHROME1.
+    """
+    if v.get("pack"):
+        u8 = np.stack([apply_window(hu, *window_range(w)) for w in v["pack"][:3]], axis=2)
+    elif v.get("window") in (None, "auto"):
+        return to_uint8(transform_pixels(fr, ds)) if lut is None else to_uint8_lut(fr, lut)
+    else:
+        u8 = apply_window(hu, *window_range(v["window"]))
+    if is_monochrome1(ds):
+        u8 = 255 - u8
+    return u8
+
+def variant_dir(out_dir, args, name):
+    root = Path(args.output).resolve()
+    return root / slugify(name) / out_dir.relative_to(root)
+
+def open_hu_sidecar(p, ds, out_dir, args, n_frames):
+    from numpy.lib.format import open_memmap
+    root = Path(args.output).resolve()
+    path = root / "_hu" / out_dir.relative_to(root) / f"{p.stem}.npy"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shape = (n_frames, int(ds.Rows), int(ds.Columns))
+    return path, open_memmap(path, mode="w+", dtype=np.dtype(args.hu_sidecar), shape=shape)
+
+def export_variants(p, ds, out_dir, args, rec, st=NO_STATS):
+    """
+    Decodifica cada quadro uma vez e grava todas as variantes configuradas
+    (e, opcionalmente, o sidecar em HU). O filtro de qualidade é avaliado na
+    primeira variante e vale para todas, mantendo os conjuntos alinhados.
+    """
+    variants = args.variants
+    dirs = [variant_dir(out_dir, args, v["name"]) for v in variants]
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+    sidecar = None
+    if args.hu_sidecar:
+        n = number_of_frames(ds) if args.frames == "all" else 1
+        side_path, sidecar = open_hu_sidecar(p, ds, out_dir, args, n)
+
+    # Variante "auto" com windowing "lut": mesma tabela da exportação principal
+    # (uma por arquivo; no modo stream_frames, uma por quadro, como em decode_frames)
+    use_lut = (getattr(args, "windowing", "float") == "lut"
+               and any(not v.get("pack") and v.get("window") in (None, "auto") for v in variants))
+    streaming = getattr(args, "stream_frames", False) and HAS_FRAME_DECODE and number_of_frames(ds) > 1
+    file_lut = None
+    if use_lut and not streaming:
+        with st.time("voi"):
+            arr = ds.pixel_array
+            file_lut = build_window_lut(arr, ds) if lut_eligible(arr, ds) else None
+
+    frames = iter_raw_frames(p, ds, args)
+    i = -1
+    while True:
+        with st.time("decode"):
+            fr = next(frames, None)
+        if fr is None:
+            break
+        i += 1
+        with st.time("voi"):
+            hu = apply_rescale(fr, ds)
+            lut = file_lut
+            if use_lut and streaming and lut_eligible(fr, ds):
+                lut = build_window_lut(fr, ds)
+        if sidecar is not None and fr.ndim == 2:
+            with st.time("write"):
+                sidecar[i] = np.rint(hu) if sidecar.dtype.kind == "i" else hu
+        name = p.stem + (f"_f{i:04d}" if i>0 else "")
+        imgs = []
+        for v in variants:
+            with st.time("to_uint8"):
+                u8 = render_variant(v, fr, hu, ds, args, lut)
+            if not v.get("pack"):
+                with st.time("clahe"):
+                    u8 = apply_clahe(u8, v.get("clahe", args.clahe), args.rgb)
+            with st.time("resize"):
+                u8 = resize_if_needed(u8, args.max_size)
+            if not imgs:
+                with st.time("quality"):
+                    ok = quality_metrics(u8, args.min_nonblack_pct, args.min_entropy, args.min_p2p, args.min_var,
+                                         rgb=args.rgb)[0]
+                if not ok:
+                    break
+            imgs.append(ensure_rgb(u8, args.rgb))
+        for d, u8 in zip(dirs, imgs):
+            out_path = d / f"{name}.png"
+            save_png(u8, out_path, mkdir=False, st=st)
+            rec["outputs"].append(str(out_path))
+
+    if sidecar is not None:
+        sidecar.flush()
+        del sidecar
+        rec["outputs"].append(str(side_path))
+
 # ---------- separação por estudo/série ----------
 def out_subdir_for(ds, split_by: str):
     study_uid   = getattr(ds, "StudyInstanceUID", None)
@@ -226,73 +695,453 @@ def out_subdir_for(ds, split_by: str):
         base = f"{date_s}__{snum_s}__{srsdesc}__{seuid6}"
     return slugify(base, maxlen=120) or "UNSORTED"
 
+def out_dir_for(p, ds, args):
+    """Pasta de saída completa: <output>/<paciente>/<subpasta do estudo/série>."""
+    sub_metadata = out_subdir_for(ds, args.split_by)
+
+    try:
+        rel_parts = p.relative_to(Path(args.input).resolve()).parts
+        
+        # O Path a ser mantido deve ser a pasta imediatamente antes dos arquivos DICOM,
+        # que é onde esperamos a informação do paciente/estudo (ex: 'Feminino/26F')
+        if len(rel_parts) >= 2:
+            path_to_keep = Path(rel_parts[0]) / rel_parts[1]
+        elif len(rel_parts) == 1:
+            path_to_keep = Path(rel_parts[0])
+        else:
+            path_to_keep = Path(".")
+            
+    except Exception:
+        path_to_keep = Path(".")
+
+    return Path(args.output).resolve() / path_to_keep / sub_metadata
+
+def expected_frames(ds, which):
+    """Quantos PNGs um arquivo pode gerar, a partir apenas do cabeçalho."""
+    return number_of_frames(ds) if which == "all" else 1
+
 # ---------- pipeline ----------
 
-from pathlib import Path  # Ensure Path is imported if you're pasting this function alone
+def reject_reason(ds, args, only_mods, header_only=False):
+    """Filtros que dependem só do cabeçalho; devolve o motivo do descarte ou None."""
+    if looks_like_non_image(ds, header_only=header_only): return "non_image"
+    if not modality_allowed(ds, only_mods): return "modality"
 
-from pathlib import Path  # Ensure Path is imported at the top of your script
+    loc, der = is_localizer_or_derived(ds)
+    if args.drop_localizer and loc:
+        return "localizer"
+    return None
 
-def worker(p, rel, args, only_mods, drop_derived):
+def new_record():
+    return {"out_dir": None, "outputs": [], "reason": None, "sop": None, "frames": 0, "series": None}
+
+def header_worker(p, args, only_mods):
+    """
+    Lê apenas o cabeçalho (stop_before_pixels) e aplica os filtros baratos.
+    Retorna (out_dir, n_frames, motivo, series_uid); out_dir é None se o
+    arquivo foi descartado.
+    """
+    try:
+        ds = pydicom.dcmread(str(p), stop_before_pixels=True, force=True)
+    except Exception:
+        return None, 0, "read_error", None
+    return header_decision(p, ds, args, only_mods)
+
+def header_decision(p, ds, args, only_mods):
+    """Filtros e pasta de saída a partir de um cabeçalho já lido (arquivo ou índice)."""
+    reason = reject_reason(ds, args, only_mods, header_only=True)
+    if reason:
+        return None, 0, reason, None
+
+    series_uid = str(getattr(ds, "SeriesInstanceUID", "") or "") or None
+    return out_dir_for(p, ds, args), expected_frames(ds, args.frames), None, series_uid
+
+def header_chunk(items, args, only_mods):
+    """Versão em lote de header_worker() para o pool: lista de (p, rel, out_dir, n, motivo, série)."""
+    return [(p, rel) + header_worker(p, args, only_mods) for p, rel in items]
+
+def header_from_index(p, row, args, only_mods):
+    """Como header_worker(), mas com a linha do índice SQLite no lugar do arquivo."""
+    if not row["is_dicom"]:
+        return None, 0, "non_image", None
+    return header_decision(p, dicom_index.row_dataset(row), args, only_mods)
+
+
+def worker(p, rel, args, only_mods, drop_derived, stats=None):
     """
     Processa um único arquivo DICOM e salva os PNGs.
-    Retorna (sub_metadata, count) onde count é o número de imagens salvas.
+    Retorna um registro {"out_dir", "outputs", "reason", "sop", "frames"}:
+    outputs são os PNGs salvos e reason é None ou o nome do filtro que
+    descartou o arquivo.
     """
+    rec = new_record()
+    st = stats or NO_STATS
     try:
-        # Tenta ler o arquivo DICOM
-        ds=pydicom.dcmread(str(p), force=True)
+        # Tenta ler o arquivo DICOM; com stream_frames o PixelData fica
+        # adiado (defer_size) e os quadros são lidos do arquivo sob demanda
+        defer = "1 MB" if getattr(args, "stream_frames", False) and HAS_FRAME_DECODE else None
+        with st.time("read"):
+            ds=pydicom.dcmread(str(p), force=True, defer_size=defer)
     except Exception:
-        return None, 0
+        rec["reason"] = "read_error"; return rec
+
+    rec["sop"] = str(getattr(ds, "SOPInstanceUID", "") or "") or None
+    rec["series"] = str(getattr(ds, "SeriesInstanceUID", "") or "") or None
 
     # Checagens iniciais de validade
-    if looks_like_non_image(ds): return None, 0
-    if not modality_allowed(ds, only_mods): return None, 0
-    
-    loc, der = is_localizer_or_derived(ds)
-    
-    if args.drop_localizer and loc: 
-        return None, 0
+    rec["reason"] = reject_reason(ds, args, only_mods)
+    if rec["reason"]:
+        return rec
+
+    out_dir = out_dir_for(p, ds, args)
+
+    if getattr(args, "variants", None):
+        rec["out_dir"] = out_dir
+        rec["frames"] = expected_frames(ds, args.frames)
+        try:
+            export_variants(p, ds, out_dir, args, rec, st)
+        except Exception:
+            if not rec["outputs"]:
+                rec["reason"] = "decode_error"; return rec
+        if not any(o.endswith(".png") for o in rec["outputs"]):
+            rec["reason"] = "quality"
+        return rec
 
     try:
         # Carrega e aplica VOI LUT/Windowing/Rescale
-        arr = load_pixels(ds)
+        frames = decode_frames(p, ds, args, st)
     except Exception:
-        return None, 0
-
-    sub_metadata = out_subdir_for(ds, args.split_by)
+        rec["reason"] = "decode_error"; return rec
 
+    rec["out_dir"] = out_dir
+    rec["frames"] = expected_frames(ds, args.frames)
+    
     try:
-        rel_parts = p.relative_to(Path(args.input).resolve()).parts
-        
-        # O Path a ser mantido deve ser a pasta imediatamente antes dos arquivos DICOM,
-        # que é onde esperamos a informação do paciente/estudo (ex: 'Feminino/26F')
-        if len(rel_parts) >= 2:
-            path_to_keep = Path(rel_parts[0]) / rel_parts[1]
-        elif len(rel_parts) == 1:
-            path_to_keep = Path(rel_parts[0])
-        else:
-            path_to_keep = Path(".")
-            
+        for i, (fr, lut) in enumerate(frames):
+            # Resize e filtro de qualidade rodam no canal único (CLAHE com rgb
+            # já devolve os 3 canais do caminho LAB); a expansão para RGB
+            # acontece só para as imagens que serão salvas
+            with st.time("to_uint8"):
+                u8 = to_uint8(fr) if lut is None else to_uint8_lut(fr, lut)
+            with st.time("clahe"):
+                u8 = apply_clahe(u8, args.clahe, args.rgb)
+            with st.time("resize"):
+                u8 = resize_if_needed(u8, args.max_size)
+
+            with st.time("quality"):
+                ok, metrics = quality_metrics(u8, args.min_nonblack_pct, args.min_entropy, args.min_p2p, args.min_var,
+                                              rgb=args.rgb)
+            if not ok:
+                if getattr(args, "log_quality", False):
+                    print(f"[QUALIDADE] {p.name} f{i:04d}: " + " ".join(f"{k}={v:.3g}" for k, v in metrics.items()))
+                continue
+            u8 = ensure_rgb(u8, args.rgb)
+
+            name = p.stem + (f"_f{i:04d}" if i>0 else "")
+            out_path = out_dir / f"{name}.png"
+            save_png(u8, out_path, st=st)
+            rec["outputs"].append(str(out_path))
     except Exception:
-        path_to_keep = Path(".")
+        # Falha no meio de um multi-frame decodificado sob demanda: mantém o
+        # que já foi salvo
+        if not rec["outputs"]:
+            rec["reason"] = "decode_error"; return rec
         
-    saved = 0
-    out_dir = Path(args.output).resolve() / path_to_keep / sub_metadata
-    
-    for i, fr in enumerate(choose_frames(arr, args.frames)):
-        u8 = to_uint8(fr)
-        u8 = ensure_rgb(u8, args.rgb)
-        u8 = apply_clahe(u8, args.clahe)
-        u8 = resize_if_needed(u8, args.max_size)
+    # Sem nenhuma imagem salva, o arquivo conta como descartado pelo filtro de qualidade
+    if not rec["outputs"]:
+        rec["reason"] = "quality"
+    return rec
 
-        if not passes(u8, args.min_nonblack_pct, args.min_entropy, args.min_p2p, args.min_var):
+def slice_sort_key(ds, p):
+    """Ordem da fatia na série: InstanceNumber, depois posição ao longo da normal."""
+    try:
+        inst = int(getattr(ds, "InstanceNumber", None))
+    except Exception:
+        inst = float("inf")
+    pos = float("inf")
+    try:
+        iop = [float(v) for v in ds.ImageOrientationPatient]
+        ipp = [float(v) for v in ds.ImagePositionPatient]
+        pos = float(np.dot(np.cross(iop[:3], iop[3:]), ipp))
+    except Exception:
+        pass
+    return inst, pos, p.name
+
+def volume_base(out_dir, ds, p):
+    """
+    Nome-base do volume de uma série: <pasta de saída>/<SeriesUID6>. A pasta
+    pode ser de várias séries (split_by="study"); o nome do volume não.
+    """
+    return Path(out_dir) / (short_uid(getattr(ds, "SeriesInstanceUID", None)) or p.stem)
+
+def series_worker(items, args, only_mods, drop_derived):
+    """
+    Processa uma série inteira: lê e ordena as fatias, calcula uma única janela
+    (percentis 2/98) sobre a pilha e grava os PNGs com prefixo de ordem. A
+    pasta de saída é criada uma vez e o objeto CLAHE é reaproveitado.
+    Retorna o mesmo que process_chunk().
+    """
+    saved_per_dir = {}
+    drops = Counter()
+    records = []
+    loaded = []
+    stats = new_stats(args)
+    st = stats or NO_STATS
+    for p, rel in items:
+        rec = new_record()
+        try:
+            with st.time("read"):
+                ds = pydicom.dcmread(str(p), force=True)
+            rec["sop"] = str(getattr(ds, "SOPInstanceUID", "") or "") or None
+            rec["series"] = str(getattr(ds, "SeriesInstanceUID", "") or "") or None
+            rec["reason"] = reject_reason(ds, args, only_mods)
+        except Exception:
+            rec["reason"] = "read_error"
+        if not rec["reason"]:
+            try:
+                with st.time("decode"):
+                    arr = ds.pixel_array
+                with st.time("voi"):
+                    frames = choose_frames(apply_modality_voi(arr, ds), args.frames)
+                del arr
+            except Exception:
+                rec["reason"] = "decode_error"
+        if rec["reason"]:
+            drops[rec["reason"]] += 1
+            records.append(manifest_record(p, rec, args))
             continue
+        rec["out_dir"] = out_dir_for(p, ds, args)
+        rec["frames"] = expected_frames(ds, args.frames)
+        loaded.append((slice_sort_key(ds, p), p, ds, rec, frames))
+
+    loaded.sort(key=lambda t: t[0])
+    gray = [fr for _, _, _, _, frs in loaded for fr in frs if fr.ndim == 2]
+    if gray:
+        # MONOCHROME1 invertido com o máximo da pilha (como arr.max() num arquivo)
+        if any(is_monochrome1(ds) for _, _, ds, _, _ in loaded):
+            top = max(float(fr.max()) for fr in gray)
+            for t in loaded:
+                if is_monochrome1(t[2]):
+                    t[4][:] = [top - fr for fr in t[4]]
+            gray = [fr for _, _, _, _, frs in loaded for fr in frs if fr.ndim == 2]
+        lo, hi = window_bounds(np.concatenate([fr.ravel() for fr in gray]))
+        del gray
+
+    as_volume = getattr(args, "output_format", "png") == "volume"
+    vol_base = volume_base(loaded[0][3]["out_dir"], loaded[0][2], loaded[0][1]) if as_volume and loaded else None
+    vol_images, vol_slices = [], []
+    made = set()
+    for k, (_, p, ds, rec, frames) in enumerate(loaded):
+        out_dir = rec["out_dir"]
+        if out_dir not in made and not as_volume:
+            out_dir.mkdir(parents=True, exist_ok=True)
+            made.add(out_dir)
+        for i, fr in enumerate(frames):
+            with st.time("to_uint8"):
+                u8 = apply_window(fr, lo, hi) if fr.ndim == 2 else to_uint8(fr)
+            with st.time("clahe"):
+                u8 = apply_clahe(u8, args.clahe, args.rgb)
+            with st.time("resize"):
+                u8 = resize_if_needed(u8, args.max_size)
+            with st.time("quality"):
+                ok = quality_metrics(u8, args.min_nonblack_pct, args.min_entropy, args.min_p2p, args.min_var,
+                                     rgb=args.rgb)[0]
+            if not ok:
+                continue
+            u8 = ensure_rgb(u8, args.rgb)
+            name = f"{k:04d}_{p.stem}" + (f"_f{i:04d}" if i>0 else "")
+            if as_volume:
+                # Saída como "<volume>.npy#<fatia>" até o volume ser gravado
+                rec["outputs"].append(f"{vol_base}.npy#{len(vol_images)}")
+                vol_images.append(u8)
+                vol_slices.append({"name": name, "source": str(p), "frame": i,
+                                   "instance": getattr(ds, "InstanceNumber", None)})
+                continue
+            out_path = out_dir / f"{name}.png"
+            save_png(u8, out_path, mkdir=False, st=st)
+            rec["outputs"].append(str(out_path))
+        frames.clear()
+        if rec["outputs"]:
+            key = str(out_dir)
+            saved_per_dir[key] = saved_per_dir.get(key, 0) + len(rec["outputs"])
+        else:
+            rec["reason"] = "quality"
+            drops["quality"] += 1
+        records.append(manifest_record(p, rec, args))
+
+    if as_volume and vol_images:
+        ds0 = loaded[0][2]
+        with st.time("write"):
+            write_volume(vol_base, vol_images, vol_slices, meta={
+                "SeriesInstanceUID": getattr(ds0, "SeriesInstanceUID", None),
+                "SeriesDescription": getattr(ds0, "SeriesDescription", None),
+                "Modality": getattr(ds0, "Modality", None),
+            })
+    return saved_per_dir, drops, records, stats
+
+def process_chunk(items, args, only_mods, drop_derived):
+    """
+    Processa um lote de (path, rel) dentro de um worker (thread ou processo).
+    Retorna ({out_dir: count}, Counter(motivo), registros, StageStats|None)
+    para ser agregado no processo pai; os registros alimentam o manifesto.
+    """
+    saved_per_dir = {}
+    drops = Counter()
+    records = []
+    stats = new_stats(args)
+    for p, rel in items:
+        rec = worker(p, rel, args, only_mods, drop_derived, stats)
+        n = sum(1 for o in rec["outputs"] if o.endswith(".png"))
+        if rec["reason"]:
+            drops[rec["reason"]] += 1
+        if n > 0:
+            key = str(rec["out_dir"])
+            saved_per_dir[key] = saved_per_dir.get(key, 0) + n
+        records.append(manifest_record(p, rec, args))
+    return saved_per_dir, drops, records, stats
+
+# ---------- manifesto (conversão incremental) ----------
+MANIFEST_NAME = "manifest_dicom2png.jsonl"
+# Opções que não alteram o resultado e portanto não entram no hash
+_OPTS_NOT_HASHED = {"workers", "executor", "chunk_size", "max_in_flight", "header_index", "header_index_refresh", "manifest", "input", "log_quality", "stats_report"}
+
+def options_hash(args):
+    """Hash estável das opções que influenciam os PNGs gerados."""
+    opts = {k: v for k, v in sorted(vars(args).items()) if k not in _OPTS_NOT_HASHED}
+    blob = json.dumps(opts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()[:16]
+
+def file_signature(p):
+    st = os.stat(p)
+    return st.st_size, st.st_mtime_ns
+
+def manifest_record(p, rec, args):
+    try:
+        size, mtime = file_signature(p)
+    except OSError:
+        size, mtime = None, None
+    return {
+        "path": str(p),
+        "size": size,
+        "mtime_ns": mtime,
+        "sop": rec.get("sop"),
+        "series": rec.get("series"),
+        "opts": args.opts_hash,
+        "out_dir": str(rec["out_dir"]) if rec.get("out_dir") else None,
+        "frames": rec.get("frames", 0),
+        "outputs": rec.get("outputs", []),
+        "reason": rec.get("reason"),
+    }
+
+def load_manifest(path: Path):
+    """
+    Lê o manifesto (última entrada de cada arquivo prevalece). Uma linha final
+    truncada por uma execução interrompida é ignorada.
+    """
+    entries = {}
+    if not path.exists():
+        return entries
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            entries[r["path"]] = r
+    return entries
+
+def compact_manifest(path: Path, entries):
+    """Reescreve o manifesto com uma linha por arquivo (troca atômica)."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for r in entries.values():
+            f.write(json.dumps(r) + "\n")
+    os.replace(tmp, path)
+
+def append_manifest(fh, records):
+    """Acrescenta registros e força a escrita em disco (ponto de retomada)."""
+    for r in records:
+        fh.write(json.dumps(r) + "\n")
+    fh.flush()
+    os.fsync(fh.fileno())
+
+def is_up_to_date(entry, p, opts_hash):
+    if not entry or entry.get("opts") != opts_hash:
+        return False
+    try:
+        size, mtime = file_signature(p)
+    except OSError:
+        return False
+    return entry.get("size") == size and entry.get("mtime_ns") == mtime
+
+def remove_stale_outputs(entry):
+    """Apaga PNGs de uma execução anterior antes de reprocessar o arquivo."""
+    for o in (entry or {}).get("outputs", []):
+        try:
+            # Fatias de volume são registradas como "<volume>.npy#<k>"
+            Path(o.split("#", 1)[0]).unlink()
+        except OSError:
+            pass
+
+def walk_files(top):
+    """Arquivos sob top (recursivo), gerados à medida que são encontrados."""
+    try:
+        with os.scandir(top) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for e in entries:
+        try:
+            if e.is_dir(follow_symlinks=False):
+                yield from walk_files(e.path)
+            elif e.is_file() and e.name != MANIFEST_NAME:
+                yield Path(e.path)
+        except OSError:
+            continue
+
+def iter_file_groups(subfolder):
+    """
+    Gera listas de arquivos por pasta de paciente (filhos diretos de
+    subfolder), cada uma assim que termina de ser varrida; arquivos soltos em
+    subfolder formam um grupo próprio no fim.
+    """
+    loose = []
+    with os.scandir(subfolder) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for e in entries:
+        if e.is_dir(follow_symlinks=False):
+            files = list(walk_files(e.path))
+            if files:
+                yield files
+        elif e.is_file() and e.name != MANIFEST_NAME:
+            loose.append(Path(e.path))
+    if loose:
+        yield loose
+
+def iter_chunks(items, size):
+    """Agrupa um iterável em listas de até 'size' elementos."""
+    chunk = []
+    for it in items:
+        chunk.append(it)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _init_process_worker():
+    # Cada processo já é uma unidade de paralelismo: evita que o OpenCV
+    # abra suas próprias threads e dispute núcleos com os demais processos.
+    if HAS_CV2:
+        cv2.setNumThreads(1)
+
+def make_executor(args):
+    """Cria o pool compartilhado por todas as subpastas ("process" ou "thread")."""
+    n = max(1, int(args.workers))
+    if getattr(args, "executor", "thread") == "process":
+        return cf.ProcessPoolExecutor(max_workers=n, initializer=_init_process_worker)
+    return cf.ThreadPoolExecutor(max_workers=n)
 
-        name = p.stem + (f"_f{i:04d}" if i>0 else "")
-        save_png(u8, out_dir / f"{name}.png")
-        saved += 1
-        
-    # Retorna o sub_metadata (o nome da pasta da série/estudo) e a contagem
-    return out_dir, saved
 
 def cleanup_large_directories(output_root: Path, max_count: int):
     """
@@ -325,12 +1174,28 @@ def cleanup_large_directories(output_root: Path, max_count: int):
     print(f"[INFO] Diretórios excluídos pelo filtro de contagem: {deleted_dirs}")
     return deleted_dirs
 
+def write_stats_report(path: Path, args, stats, drop_counts, total_saved, wall_s):
+    """Grava o relatório de instrumentação (tempo por etapa + descartes)."""
+    report = {
+        "wall_s": round(wall_s, 3),
+        "images_saved": total_saved,
+        "images_per_s": round(total_saved / wall_s, 2) if wall_s > 0 else None,
+        "options": {k: getattr(args, k, None) for k in
+                    ("workers", "executor", "chunk_size", "mode", "windowing", "max_size",
+                     "frames", "clahe", "header_prefilter", "stream_frames")},
+        # Somas de tempo de todos os workers (podem exceder wall_s)
+        "stages": stats.summary(),
+        "drops": dict(drop_counts.most_common()),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[INFO] Relatório de instrumentação salvo em: {path}")
+
 def parse_args():
-    # Isso simula a leitura do argparse, mas usa os valores CODED_OPTIONS
-    class Args:
-        pass
-    
-    args = Args()
+    # Isso simula a leitura do argparse, mas usa os valores CODED_OPTIONS.
+    # Namespace (e não uma classe local) para que args seja serializável
+    # e possa ser enviado aos processos do pool.
+    args = argparse.Namespace()
     
     # Define as propriedades obrigatórias (Input/Output)
     args.input = CODED_INPUT_PATH
@@ -343,6 +1208,7 @@ def parse_args():
     # Adiciona as opções que não estão no CODED_OPTIONS mas são necessárias (ou inversas)
     args.keep_tree = False
     args.keep_derived = not args.drop_derived
+    args.opts_hash = options_hash(args)
             
     return args
 
@@ -364,37 +1230,231 @@ def main():
         print(f"[ERRO] Nenhum subfolder encontrado em {in_root}", file=sys.stderr)
         sys.exit(1)
 
+    t_start = time.perf_counter()
+    stage_stats = StageStats()
     total_saved = 0
-    # Dicionário para rastrear a contagem de imagens por diretório de saída
+    # Contagem de imagens por diretório de saída e de descartes por motivo,
+    # agregadas a partir dos resultados de cada worker
     series_counts = {}
-    
-    for subfolder in subfolders:
-        files = [p for p in subfolder.rglob("*") if p.is_file()]
-        print(f"[INFO] {len(files)} candidatos encontrados em {subfolder}")
-        
-        def pack(p):
+    drop_counts = Counter()
+
+    def pack(files, subfolder):
+        for p in files:
             try:
                 rel = p.parent.relative_to(subfolder) if args.keep_tree else Path(".")
             except Exception:
                 rel = Path(".")
-            return worker(p, rel, args, only_mods, drop_derived)
-            
-        with cf.ThreadPoolExecutor(max_workers=max(1,int(args.workers))) as ex:
-            # ex.map retorna (out_dir, count)
-            for out_dir, n in ex.map(pack, files):
-                if n > 0:
-                    total_saved += n
-                    # Não precisamos mais rastrear a contagem por série, pois a
-                    # contagem será feita no disco pela função cleanup_large_directories
-                    pass
-    
+            yield p, rel
+
+    chunk_size = max(1, int(getattr(args, "chunk_size", 1) or 1))
+
+    # Manifesto: carrega o estado anterior e separa os arquivos inalterados
+    manifest_path = out_root / MANIFEST_NAME
+    manifest = load_manifest(manifest_path) if args.manifest else {}
+    if manifest:
+        compact_manifest(manifest_path, manifest)
+    manifest_fh = manifest_path.open("a", encoding="utf-8") if args.manifest else None
+    def record(records):
+        if manifest_fh is not None and records:
+            append_manifest(manifest_fh, records)
+
+    # Índice de cabeçalhos: linhas por caminho; arquivos fora do índice
+    # (novos, com refresh desligado) seguem pelo pool como antes
+    index_rows = None
+    if getattr(args, "header_index", None):
+        if getattr(args, "header_index_refresh", True):
+            dicom_index.update_index(args.header_index, in_root, args.workers)
+        index_rows = {row["path"]: row for row in dicom_index.iter_rows(args.header_index, in_root, dicom_only=False)}
+        print(f"[INFO] {len(index_rows)} arquivos no índice de cabeçalhos")
+
+    def submit_headers(ex, items):
+        """Resultados do passo de cabeçalhos: listas prontas (índice) ou futures (pool)."""
+        sources = []
+        if index_rows is not None:
+            ready, missing = [], []
+            for p, rel in items:
+                row = index_rows.get(str(p))
+                if row is None:
+                    missing.append((p, rel))
+                else:
+                    ready.append((p, rel) + header_from_index(p, row, args, only_mods))
+            sources.append(ready)
+            items = missing
+        sources += [ex.submit(header_chunk, chunk, args, only_mods)
+                    for chunk in iter_chunks(items, chunk_size)]
+        return sources
+
+    def prefilter(sources, known_frames):
+        """
+        Passo de cabeçalhos: descarta arquivos pelos filtros e conta quadros por
+        pasta de saída, eliminando séries acima de max_images_per_series antes
+        de qualquer decodificação de pixels. known_frames traz os quadros de
+        arquivos pulados pelo manifesto.
+        """
+        kept = []
+        frames_per_dir = Counter(known_frames)
+        for res in sources:
+            dropped = []
+            for p, rel, out_dir, n, reason, series_uid in (res.result() if isinstance(res, cf.Future) else res):
+                if reason:
+                    drop_counts[reason] += 1
+                    dropped.append(manifest_record(p, {"reason": reason}, args))
+                    continue
+                frames_per_dir[out_dir] += n
+                kept.append((p, rel, out_dir, n, series_uid))
+            record(dropped)
+
+        too_large = {d for d, n in frames_per_dir.items() if n > args.max_images_per_series}
+        for d in sorted(too_large):
+            print(f"[FILTRO] Ignorando série: '{d.name}' ({frames_per_dir[d]} imagens > {args.max_images_per_series} limit)")
+        result = []
+        dropped = []
+        for p, rel, out_dir, n, series_uid in kept:
+            if out_dir in too_large:
+                drop_counts["series_too_large"] += 1
+                dropped.append(manifest_record(
+                    p, {"reason": "series_too_large", "out_dir": out_dir, "frames": n,
+                        "series": series_uid}, args))
+            else:
+                result.append((p, rel, out_dir, series_uid))
+        record(dropped)
+        return result
+
+    if getattr(args, "output_format", "png") == "volume":
+        args.mode = "series"
+    series_mode = getattr(args, "mode", "file") == "series"
+    if series_mode and getattr(args, "variants", None):
+        print("[AVISO] 'variants' só é suportado no modo 'file'; ignorando no modo 'series'.", file=sys.stderr)
+    # O modo série precisa do passo de cabeçalhos para agrupar os arquivos
+    use_headers = getattr(args, "header_prefilter", False) or series_mode
+    max_in_flight = int(getattr(args, "max_in_flight", 0) or 0) or 4 * max(1, int(args.workers))
+
+    counters = Counter()
+    pending = set()
+
+    def consume(fut):
+        nonlocal total_saved
+        saved_per_dir, drops, records, stats = fut.result()
+        record(records)
+        drop_counts.update(drops)
+        if stats is not None:
+            stage_stats.merge(stats)
+        for out_dir, n in saved_per_dir.items():
+            series_counts[out_dir] = series_counts.get(out_dir, 0) + n
+            total_saved += n
+
+    def submit_bounded(ex, fn, *task):
+        """Submete respeitando max_in_flight; consome resultados prontos para liberar espaço."""
+        nonlocal pending
+        while len(pending) >= max_in_flight:
+            done, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                consume(fut)
+        pending.add(ex.submit(fn, *task))
+
+    def split_skipped(files, subfolder):
+        """Separa arquivos inalterados (manifesto) dos que precisam ser processados."""
+        items = []
+        known_frames = Counter()
+        # Modo série: arquivos pulados, por série, para o caso de outra fatia
+        # da mesma série mudar (a janela é da pilha inteira)
+        skipped_by_series = defaultdict(list)
+        for p, rel in pack(files, subfolder):
+            entry = manifest.get(str(p))
+            if is_up_to_date(entry, p, args.opts_hash):
+                counters["skipped"] += 1
+                if entry.get("out_dir"):
+                    known_frames[Path(entry["out_dir"])] += entry.get("frames", 0)
+                    if series_mode and entry.get("series"):
+                        skipped_by_series[(Path(entry["out_dir"]), entry["series"])].append((p, rel, entry))
+                continue
+            remove_stale_outputs(entry)
+            items.append((p, rel))
+        return items, known_frames, skipped_by_series
+
+    def start_group(ex, files, subfolder):
+        """Primeira metade de um grupo: manifesto e submissão dos cabeçalhos."""
+        items, known_frames, skipped_by_series = split_skipped(files, subfolder)
+        header_futs = submit_headers(ex, items) if use_headers else None
+        return items, header_futs, known_frames, skipped_by_series
+
+    def finish_group(ex, group):
+        """Segunda metade: filtro por série (cabeçalhos prontos) e submissão da conversão."""
+        items, header_futs, known_frames, skipped_by_series = group
+        if header_futs is not None:
+            items = prefilter(header_futs, known_frames)
+            counters["approved"] += len(items)
+        else:
+            items = [(p, rel, None, None) for p, rel in items]
+
+        if series_mode:
+            groups = defaultdict(list)
+            for p, rel, out_dir, series_uid in items:
+                groups[(out_dir, series_uid or str(p))].append((p, rel))
+            for key, members in groups.items():
+                # Série com alguma fatia nova/alterada: reprocessa a série toda
+                for p, rel, entry in skipped_by_series.get(key, []):
+                    remove_stale_outputs(entry)
+                    members.append((p, rel))
+                submit_bounded(ex, series_worker, members, args, only_mods, drop_derived)
+            counters["series"] += len(groups)
+        else:
+            for chunk in iter_chunks(((p, rel) for p, rel, _, _ in items), chunk_size):
+                submit_bounded(ex, process_chunk, chunk, args, only_mods, drop_derived)
+
+    # Pipeline com um único pool: a varredura segue pasta de paciente por pasta
+    # de paciente (uma série nunca cruza essa fronteira, então a contagem por
+    # série de um grupo é final quando ele termina de ser varrido). Enquanto o
+    # grupo atual é varrido, os cabeçalhos do anterior são lidos e as
+    # conversões dos já filtrados rodam; max_in_flight limita as tarefas
+    # pendentes (backpressure sobre a varredura).
+    with make_executor(args) as ex:
+        prev = None
+        for subfolder in subfolders:
+            n_files = 0
+            for files in iter_file_groups(subfolder):
+                n_files += len(files)
+                group = start_group(ex, files, subfolder)
+                if prev is not None:
+                    finish_group(ex, prev)
+                prev = group
+            print(f"[INFO] {n_files} candidatos encontrados em {subfolder}")
+        if prev is not None:
+            finish_group(ex, prev)
+
+        for fut in cf.as_completed(pending):
+            consume(fut)
+
+    if manifest:
+        print(f"[INFO] {counters['skipped']} arquivos inalterados desde a última execução (pulados)")
+    if use_headers:
+        print(f"[INFO] {counters['approved']} arquivos aprovados no filtro de cabeçalhos")
+    if series_mode:
+        print(f"[INFO] {counters['series']} séries processadas")
+
+    if manifest_fh is not None:
+        manifest_fh.close()
+
+    if drop_counts:
+        resumo = ", ".join(f"{k}={v}" for k, v in drop_counts.most_common())
+        print(f"[INFO] Arquivos descartados por motivo: {resumo}")
     print(f"[INFO] Imagens salvas (antes da limpeza): {total_saved}")
+    if getattr(args, "stats_report", None):
+        write_stats_report(out_root / args.stats_report, args, stage_stats, drop_counts,
+                           total_saved, time.perf_counter() - t_start)
     
     # ----------------------------------------------------
     # NOVO PASSO: Limpeza de diretórios grandes
     # ----------------------------------------------------
     print(f"[INFO] Executando filtro de limpeza: excluindo subdiretórios com mais de {args.max_images_per_series} imagens...")
-    cleanup_large_directories(out_root, args.max_images_per_series)
+    if getattr(args, "variants", None) and not series_mode:
+        # Cada variante é uma árvore própria com a mesma estrutura da saída padrão
+        for v in args.variants:
+            vroot = out_root / slugify(v["name"])
+            if vroot.is_dir():
+                cleanup_large_directories(vroot, args.max_images_per_series)
+    else:
+        cleanup_large_directories(out_root, args.max_images_per_series)
     
     print("[INFO] Concluído.")
 
@@ -11,9 +11,11 @@ diretório, preservando a estrutura de pastas.
 
 import os
 import sys
-import shutil
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from file_placement import Placer, format_counts
+
 # --- CONFIGURAÇÕES DO USUÁRIO ---
 # Caminho da pasta de entrada (limpa, após a conversão DICOM e filtro de 150 imagens)
 INPUT_PNG_ROOT = '/home/nexus/davi/3d/PNG'
@@ -27,13 +29,19 @@ MAP_FILE_NAME = 'frontal_map.txt'
 # Número de imagens a incluir ANTES e DEPOIS da imagem frontal (pivô)
 # (5 antes + 1 pivô + 5 depois = máximo de 11 imagens)
 FRONTAL_VIEWS_WINDOW = 5
+
+# Como colocar as imagens: "copy", "hardlink", "symlink", "reflink" ou "auto"
+# (ver file_placement.py)
+PLACEMENT_MODE = 'copy'
 # --- FIM DAS CONFIGURAÇÕES DO USUÁRIO ---
 
 
-def select_frontal_views_manual(source_root: Path, target_root: Path, window: int, map_file: Path):
+def select_frontal_views_manual(source_root: Path, target_root: Path, window: int, map_file: Path,
+                                mode: str = PLACEMENT_MODE):
     """
     Lê o arquivo de mapeamento, processa cada caminho pivô e copia a janela de imagens.
     """
+    placer = Placer(mode)
     source_root = source_root.resolve()
     target_root = target_root.resolve()
     target_root.mkdir(parents=True, exist_ok=True)
@@ -91,15 +99,19 @@ def select_frontal_views_manual(source_root: Path, target_root: Path, window: in
         # Ex: /PNG_FRONTAL_MANUAL/Feminino/26F/...
         relative_series_path = source_dir.relative_to(source_root)
         target_dir = target_root / relative_series_path
-        target_dir.mkdir(parents=True, exist_ok=True)
         
-        # 5. Copia os arquivos
+        # 5. Registra as cópias (executadas todas juntas no final)
         for p in files_to_copy:
-            shutil.copy2(p, target_dir / p.name)
-            copied_count += 1
+            placer.add(p, target_dir / p.name)
             
-        print(f"  [COPIADO] Série {relative_series_path}: {len(files_to_copy)} imagens copiadas.")
+        print(f"  [FILA] Série {relative_series_path}: {len(files_to_copy)} imagens.")
         
+    placed, errors = placer.run()
+    for src, dst, msg in errors:
+        print(f"[ERRO] Falha ao copiar {src}: {msg}")
+    copied_count = sum(placed.values()) - len(errors)
+    print(f"[INFO] Colocação: {format_counts(placed)}")
+
     print(f"\n[INFO] Séries processadas (baseado na lista manual): {processed_series}")
     print(f"[INFO] Total de imagens frontais copiadas para {target_root}: {copied_count}")
     return copied_count
@@ -114,7 +126,7 @@ def main():
             print(f"[ERRO] O diretório de entrada não existe: {source}", file=sys.stderr)
             sys.exit(1)
             
-        select_frontal_views_manual(source, target, FRONTAL_VIEWS_WINDOW, map_file)
+        select_frontal_views_manual(source, target, FRONTAL_VIEWS_WINDOW, map_file, PLACEMENT_MODE)
         
         print("\n[INFO] Seleção frontal concluída.")
         
@@ -1,6 +1,11 @@
 import os
+import sys
+from pathlib import Path
 import pydicom
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import dicom_index
+
 def check_dicom_metadata(root_dir, num_files_to_check=1):
     """
     Percorre os diretórios e exibe os metadados de alguns arquivos DICOM.
@@ -66,6 +71,28 @@ def check_dicom_metadata(root_dir, num_files_to_check=1):
     else:
         print("Verificação de metadados concluída.")
 
+def resumo_indice(db_path, root_dir, atualizar=True):
+    """
+    Resumo por série (instâncias, quadros, modalidade, descrição) a partir do
+    índice SQLite de cabeçalhos, sem abrir os arquivos DICOM.
+
+    Args:
+        db_path (str): Caminho do índice (ver dicom_index.py).
+        root_dir (str): O diretório raiz a ser resumido.
+        atualizar (bool): Atualiza o índice (só arquivos novos/alterados) antes da consulta.
+    """
+    if atualizar:
+        dicom_index.update_index(db_path, root_dir)
+    series = dicom_index.series_summary(db_path, root_dir)
+    print(f"Séries indexadas em {root_dir}: {len(series)}")
+    print("-" * 50)
+    for s in series:
+        print(f"  {s['dir']}")
+        print(f"    SeriesInstanceUID: {s['series']}")
+        print(f"    Modality: {s['modality']} | Instâncias: {s['instances']} | Quadros: {s['frames']}")
+        print(f"    SeriesDescription: {s['description']} | ImageType: {s['image_type']}")
+    print("-" * 50)
+
 if __name__ == "__main__":
     # Define o diretório raiz a ser verificado
     # **AVISO**: Mantenha o caminho original apenas se ele for válido no seu ambiente.
@@ -76,4 +103,7 @@ if __name__ == "__main__":
     # check_dicom_metadata(diretorio_raiz, num_files_to_check=2)
     
     # Usando o padrão de 1 arquivo para manter a compatibilidade
-    check_dicom_metadata(diretorio_raiz)
\ No newline at end of file
+    check_dicom_metadata(diretorio_raiz)
+
+    # Resumo de todas as séries via índice de cabeçalhos (rápido com o índice quente):
+    # resumo_indice('/home/nexus/davi/3d/dicom_index.sqlite', diretorio_raiz)
\ No newline at end of file
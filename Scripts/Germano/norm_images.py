@@ -1,31 +1,24 @@
 import sys
 from pathlib import Path
-from PIL import Image, ImageOps
+import numpy as np
+from PIL import Image
 
-def resize_with_padding(img: Image.Image, size=(512, 512), color=(0,0,0)):
-    img = img.convert("RGB")
-    img.thumbnail(size, Image.Resampling.LANCZOS)  # mantém proporção
-    dw, dh = size[0] - img.width, size[1] - img.height
-    padding = (dw//2, dh//2, dw - dw//2, dh - dh//2)
-    return ImageOps.expand(img, padding, fill=color)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_normalize import normalize, normalize_tree
 
-def process_dir(src_dir, dst_dir, size=(512,512), color=(0,0,0)):
-    src_dir, dst_dir = Path(src_dir), Path(dst_dir)
+def resize_with_padding(img: Image.Image, size=(512, 512), color=(0,0,0)):
+    img = np.asarray(img.convert("RGB"))[:, :, ::-1]  # RGB -> BGR do motor
+    out = normalize(img, size, "pad", color=color, upscale=False)  # mantém proporção, só reduz
+    return Image.fromarray(out[:, :, ::-1].copy())
 
+def process_dir(src_dir, dst_dir, size=(512,512), color=(0,0,0), recursive=True):
+    """Normaliza src_dir em dst_dir (mesma estrutura de subpastas; recursive=False: só a raiz)."""
     # cria o diretório de saída sempre, mesmo se não existir
-    dst_dir.mkdir(parents=True, exist_ok=True)
-
-    exts = {".png",".jpg",".jpeg",".bmp",".tif",".tiff"}
-
-    for p in src_dir.glob("*"):  # apenas arquivos da pasta raiz
-        if p.suffix.lower() in exts:
-            outp = dst_dir / p.name  # salva no novo diretório
-            im = Image.open(p)
-            out = resize_with_padding(im, size=size, color=color)
-            if outp.suffix.lower() in [".jpg", ".jpeg"]:
-                out.save(outp, quality=95)
-            else:
-                out.save(outp)
+    Path(dst_dir).mkdir(parents=True, exist_ok=True)
+    n, erros = normalize_tree(src_dir, dst_dir, size, "pad", color=color, upscale=False, recursive=recursive)
+    for src, msg in erros:
+        print(f"⚠️ {src}: {msg}")
+    return n
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
@@ -1,41 +1,26 @@
 import sys
 from pathlib import Path
+import numpy as np
 from PIL import Image
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_normalize import normalize, normalize_tree
+
 def resize_with_zoom(img: Image.Image, size=(512, 512), extra_zoom=1.0):
     """
     extra_zoom > 1.0 -> aplica mais zoom (corta mais bordas)
     """
-    img = img.convert("RGB")
-    w, h = img.size
-    tw, th = size
-
-    # escala para cobrir o alvo
-    scale = max(tw / w, th / h) * extra_zoom
-    new_w, new_h = int(round(w * scale)), int(round(h * scale))
-    img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-    # crop central
-    left = (new_w - tw) // 2
-    top = (new_h - th) // 2
-    right = left + tw
-    bottom = top + th
-    return img.crop((left, top, right, bottom))
-
-def process_dir(src_dir, dst_dir, size=(512,512), extra_zoom=1.0):
-    src_dir, dst_dir = Path(src_dir), Path(dst_dir)
-    dst_dir.mkdir(parents=True, exist_ok=True)
-    exts = {".png",".jpg",".jpeg",".bmp",".tif",".tiff"}
-
-    for p in src_dir.glob("*"):
-        if p.suffix.lower() in exts:
-            outp = dst_dir / p.name
-            im = Image.open(p)
-            out = resize_with_zoom(im, size=size, extra_zoom=extra_zoom)
-            if outp.suffix.lower() in [".jpg", ".jpeg"]:
-                out.save(outp, quality=95)
-            else:
-                out.save(outp)
+    img = np.asarray(img.convert("RGB"))[:, :, ::-1]  # RGB -> BGR do motor
+    out = normalize(img, size, "zoom", extra_zoom=extra_zoom)  # cobre o alvo + crop central
+    return Image.fromarray(out[:, :, ::-1].copy())
+
+def process_dir(src_dir, dst_dir, size=(512,512), extra_zoom=1.0, recursive=True):
+    """Aplica zoom + crop central em src_dir -> dst_dir (mesma estrutura de subpastas)."""
+    Path(dst_dir).mkdir(parents=True, exist_ok=True)
+    n, erros = normalize_tree(src_dir, dst_dir, size, "zoom", extra_zoom=extra_zoom, recursive=recursive)
+    for src, msg in erros:
+        print(f"⚠️ {src}: {msg}")
+    return n
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_nifti.py — Tempo x tamanho dos formatos de saída do converter_lote
+
+Regrava volumes já convertidos (.nii/.nii.gz) em cada formato/nível do
+converter_lote (nii, nii.gz do ITK, pgzip em blocos paralelos) e mede:
+  - tempo de gravação e tamanho no disco (razão contra o .nii sem compressão)
+  - tempo de leitura de volta com SimpleITK (o pgzip tem de ser legível)
+
+Uso:
+  python bench_nifti.py <pasta_ou_arquivo_nifti> [--max-volumes 4] [--threads 0]
+                        [--levels 1,6,9] [--csv resultado.csv]
+"""
+
+import argparse, csv, os, sys, tempfile, time
+from pathlib import Path
+
+try:
+    import SimpleITK as sitk
+except ImportError:
+    print("[ERRO] SimpleITK não instalado (pip install SimpleITK).", file=sys.stderr)
+    sys.exit(1)
+
+from converter_lote import escrever_atomico, extensao
+
+def variantes(niveis, threads):
+    """(rótulo, configuração de saída) na ordem do relatório."""
+    yield "nii", {"formato": "nii", "nivel": -1, "threads_gzip": 0}
+    for n in niveis:
+        yield f"nii.gz/{n}", {"formato": "nii.gz", "nivel": n, "threads_gzip": 0}
+    for n in niveis:
+        yield f"pgzip/{n}", {"formato": "pgzip", "nivel": n, "threads_gzip": threads}
+
+def listar_volumes(entrada, maximo):
+    entrada = Path(entrada)
+    if entrada.is_file():
+        return [entrada]
+    vols = sorted(p for p in entrada.rglob("*") if p.name.endswith((".nii", ".nii.gz")))
+    return vols[:maximo] if maximo > 0 else vols
+
+def main():
+    ap = argparse.ArgumentParser(description="Tempo x tamanho dos formatos NIfTI do converter_lote.")
+    ap.add_argument("input", help="Um .nii/.nii.gz ou uma pasta de saída do converter_lote.")
+    ap.add_argument("--max-volumes", type=int, default=4, help="Volumes usados (0 = todos).")
+    ap.add_argument("--levels", default="1,6,9", help="Níveis de compressão testados (default=1,6,9).")
+    ap.add_argument("--threads", type=int, default=0, help="Threads do pgzip (default=0: todos os núcleos).")
+    ap.add_argument("--csv", type=Path, default=None, help="Grava também as linhas em CSV.")
+    args = ap.parse_args()
+
+    vols = listar_volumes(args.input, args.max_volumes)
+    if not vols:
+        print(f"[ERRO] Nenhum .nii/.nii.gz em {args.input}", file=sys.stderr); sys.exit(1)
+    niveis = [int(n) for n in args.levels.split(",") if n.strip()]
+    threads = args.threads or os.cpu_count() or 1
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(threads)
+
+    imagens = [sitk.ReadImage(str(v)) for v in vols]
+    print(f"[INFO] {len(imagens)} volumes | pgzip com {threads} threads")
+
+    linhas = []
+    base_bytes = None
+    with tempfile.TemporaryDirectory(prefix="bench_nifti_") as tmp:
+        print(f"{'formato':12s} {'grava s':>8s} {'MB':>9s} {'razão':>6s} {'lê s':>7s}")
+        for rotulo, saida in variantes(niveis, threads):
+            t_grava = t_le = 0.0
+            nbytes = 0
+            for k, img in enumerate(imagens):
+                caminho = os.path.join(tmp, f"v{k}{extensao(saida['formato'])}")
+                t0 = time.perf_counter()
+                escrever_atomico(img, caminho, saida)
+                t_grava += time.perf_counter() - t0
+                nbytes += os.path.getsize(caminho)
+                t0 = time.perf_counter()
+                sitk.ReadImage(caminho)
+                t_le += time.perf_counter() - t0
+                os.unlink(caminho)
+            if base_bytes is None:
+                base_bytes = nbytes
+            linha = {"formato": rotulo, "write_s": round(t_grava, 3), "mb": round(nbytes / 1e6, 2),
+                     "ratio": round(nbytes / base_bytes, 3), "read_s": round(t_le, 3)}
+            linhas.append(linha)
+            print(f"{rotulo:12s} {t_grava:8.2f} {nbytes/1e6:9.1f} {linha['ratio']:6.2f} {t_le:7.2f}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(linhas[0]))
+            w.writeheader(); w.writerows(linhas)
+        print(f"[INFO] CSV gravado em {args.csv}")
+
+if __name__ == "__main__":
+    main()
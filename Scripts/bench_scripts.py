@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_scripts.py — Benchmark das ferramentas DICOM sobre dados sintéticos
+
+Gera (ou reutiliza) uma árvore de synthetic_dicom.py e roda cada script com
+cada conjunto de opções num processo separado, medindo:
+  - arquivos/s e MB/s de entrada
+  - pico de memória da árvore de processos: soma do RSS do script e de todos
+    os seus descendentes (workers dos pools), amostrada em /proc; e o pico do
+    maior processo isolado (ru_maxrss de os.wait4), que não soma os workers
+
+Os resultados são acrescentados a um JSON (uma entrada por caso, com a
+revisão do git), para comparar versões; --baseline imprime a razão contra
+um arquivo de resultados anterior.
+
+Uso:
+  python bench_scripts.py [--data /tmp/bench_dicom] [--patients 4] [--slices 60]
+                          [--size 512] [--results bench_results.json]
+                          [--baseline antigo.json] [--only dicom2png]
+"""
+
+import argparse, json, os, shutil, subprocess, sys, tempfile, time
+import importlib.util
+from datetime import datetime, timezone
+from pathlib import Path
+
+from synthetic_dicom import generate_tree
+
+SCRIPTS = Path(__file__).resolve().parent
+
+# Driver do dicom2png: as opções são definidas no topo do script (CODED_*)
+DICOM2PNG_DRIVER = """
+import json, sys
+sys.path.insert(0, {d3!r})
+import dicom2png as d
+d.CODED_INPUT_PATH, d.CODED_OUTPUT_PATH = {inp!r}, {out!r}
+d.CODED_OPTIONS.update(json.loads({opts!r}))
+d.main()
+"""
+
+# (nome do caso, script, opções)
+CASES = [
+    ("dicom2png/thread",      "dicom2png", {"executor": "thread"}),
+    ("dicom2png/process",     "dicom2png", {"executor": "process"}),
+    ("dicom2png/process+lut", "dicom2png", {"executor": "process", "windowing": "lut"}),
+    ("dicom2png/no-stream",   "dicom2png", {"executor": "process", "stream_frames": False}),
+    ("dicom2png/series",      "dicom2png", {"executor": "process", "mode": "series"}),
+    ("separar_axial_3d/copy",    "separar_axial_3d", []),
+    ("separar_axial_3d/symlink", "separar_axial_3d", ["--symlink"]),
+    ("converter_lote/default",   "converter_lote", []),
+    ("converter_lote/nii",       "converter_lote", ["--format", "nii"]),
+    ("converter_lote/gz1",       "converter_lote", ["--format", "nii.gz", "--level", "1"]),
+    ("converter_lote/pgzip",     "converter_lote", ["--format", "pgzip"]),
+]
+
+def command_for(script, opts, inp, out):
+    if script == "dicom2png":
+        # Sem manifesto: cada caso converte a árvore inteira
+        opts = dict({"manifest": False}, **opts)
+        code = DICOM2PNG_DRIVER.format(d3=str(SCRIPTS / "3d"), inp=str(inp), out=str(out),
+                                       opts=json.dumps(opts))
+        return [sys.executable, "-c", code]
+    if script == "separar_axial_3d":
+        return [sys.executable, str(SCRIPTS / "separar_axial_3d.py"), "-i", str(inp), "-o", str(out)] + list(opts)
+    if script == "converter_lote":
+        return [sys.executable, str(SCRIPTS / "converter_lote.py"), str(inp), str(out)] + list(opts)
+    raise ValueError(script)
+
+def available(script):
+    need = {"converter_lote": "SimpleITK"}.get(script)
+    return need is None or importlib.util.find_spec(need) is not None
+
+RSS_SAMPLE_S = 0.05
+
+def _children(pid):
+    """Filhos diretos de pid (Linux, /proc/<pid>/task/*/children)."""
+    kids = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                kids.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return kids
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def tree_rss_mb(pid):
+    """RSS somado de pid e de todos os descendentes, em MB (0 sem /proc)."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += _rss_kb(p)
+        stack.extend(_children(p))
+    return total / 1024.0
+
+def run_measured(cmd):
+    """
+    Executa e devolve (wall_s, pico_rss_arvore_mb, pico_rss_maior_processo_mb,
+    returncode). O pico da árvore é amostrado a cada RSS_SAMPLE_S (picos mais
+    curtos que isso podem escapar); sem /proc ele vale None.
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    has_proc = os.path.isdir(f"/proc/{proc.pid}")
+    tree_peak = 0.0
+    while True:
+        # WNOHANG: continua amostrando enquanto o script roda
+        pid, status, ru = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if has_proc:
+            tree_peak = max(tree_peak, tree_rss_mb(proc.pid))
+        time.sleep(RSS_SAMPLE_S)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss em KB no Linux: pico do maior processo (o script ou um filho já encerrado)
+    return wall, (tree_peak if has_proc else None), ru.ru_maxrss / 1024.0, proc.returncode
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "-C", str(SCRIPTS), "rev-parse", "--short", "HEAD"],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark das ferramentas DICOM sobre dados sintéticos.")
+    ap.add_argument("--data", type=Path, default=Path(tempfile.gettempdir()) / "bench_dicom",
+                    help="Árvore sintética (gerada se não existir).")
+    ap.add_argument("--patients", type=int, default=4)
+    ap.add_argument("--slices", type=int, default=60)
+    ap.add_argument("--size", type=int, default=512)
+    ap.add_argument("--vrt-frames", type=int, default=72)
+    ap.add_argument("--results", type=Path, default=Path("bench_results.json"))
+    ap.add_argument("--baseline", type=Path, default=None, help="Resultados anteriores para comparação.")
+    ap.add_argument("--only", default="", help="Filtra casos pelo prefixo do nome (ex: dicom2png).")
+    args = ap.parse_args()
+
+    if not args.data.exists():
+        print(f"[INFO] Gerando árvore sintética em {args.data} ...")
+        generate_tree(args.data, args.patients, args.slices, args.size, args.vrt_frames)
+    files = [p for p in args.data.rglob("*") if p.is_file()]
+    n_files, n_bytes = len(files), sum(p.stat().st_size for p in files)
+    print(f"[INFO] Entrada: {n_files} arquivos, {n_bytes/1e6:.1f} MB")
+
+    baseline = {}
+    if args.baseline and args.baseline.exists():
+        for r in json.loads(args.baseline.read_text(encoding="utf-8")):
+            baseline[r["case"]] = r
+
+    rev = git_rev()
+    stamp = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    results = []
+    print(f"{'caso':28s} {'arq/s':>9s} {'MB/s':>8s} {'RSS Σ MB':>9s} {'RSS máx':>8s} {'vs base':>8s}")
+    for name, script, opts in CASES:
+        if args.only and not name.startswith(args.only):
+            continue
+        if not available(script):
+            print(f"{name:28s} (pulado: dependência ausente)")
+            continue
+        out = Path(tempfile.mkdtemp(prefix="bench_out_"))
+        try:
+            wall, tree_rss, rss, rc = run_measured(command_for(script, opts, args.data, out))
+        finally:
+            shutil.rmtree(out, ignore_errors=True)
+        r = {"timestamp": stamp, "git_rev": rev, "case": name, "script": script, "options": opts,
+             "files": n_files, "bytes": n_bytes, "wall_s": round(wall, 3),
+             "files_per_s": round(n_files / wall, 2), "mb_per_s": round(n_bytes / 1e6 / wall, 2),
+             "peak_tree_rss_mb": None if tree_rss is None else round(tree_rss, 1),
+             "peak_rss_mb": round(rss, 1), "returncode": rc}
+        results.append(r)
+        ratio = ""
+        if name in baseline and baseline[name].get("files_per_s"):
+            ratio = f"{r['files_per_s'] / baseline[name]['files_per_s']:.2f}x"
+        flag = "" if rc == 0 else f"  [ERRO rc={rc}]"
+        tree = "-" if tree_rss is None else f"{tree_rss:.1f}"
+        print(f"{name:28s} {r['files_per_s']:9.1f} {r['mb_per_s']:8.1f} {tree:>9s} {r['peak_rss_mb']:8.1f} {ratio:>8s}{flag}")
+
+    previous = json.loads(args.results.read_text(encoding="utf-8")) if args.results.exists() else []
+    args.results.write_text(json.dumps(previous + results, indent=1), encoding="utf-8")
+    print(f"[INFO] Resultados acrescentados em {args.results}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+content_store.py — Armazém de imagens endereçado por conteúdo (opcional)
+
+Cada arquivo é hasheado uma vez (SHA-256, cache por caminho/tamanho/mtime
+num SQLite) e guardado uma única vez em <store>/objects/ab/<hash>; as
+variantes de dataset (dataset_yolo, Classes, ...) viram diretórios de
+hardlinks para esses objetos. Reconstruir ou criar mais uma variante só
+grava bytes de conteúdo novo.
+
+  - objetos somente leitura (0444): editar uma imagem dentro de uma variante
+    exige substituí-la, nunca altera as outras variantes
+  - gc: objetos sem nenhum hardlink fora do armazém (st_nlink == 1) são
+    apagados, junto com o cache de hash que apontava para eles
+  - du: por variante registrada, bytes lógicos, bytes no armazém, bytes
+    exclusivos (objetos que só ela usa) e bytes fora do armazém
+
+Usado por separa_dataset.py e padroniza_dataset.py (desligado por padrão)
+através de Placer(..., store=ContentStore(...)) em file_placement.py.
+Armazém e variantes precisam estar no mesmo sistema de arquivos; caso
+contrário, a colocação cai para cópia.
+
+Uso:
+  python content_store.py du <store>
+  python content_store.py gc <store> [--dry-run]
+  python content_store.py variants <store>
+"""
+
+import argparse, errno, hashlib, os, sqlite3, sys, threading
+from collections import defaultdict
+from file_placement import place
+
+DB_NAME = "store.sqlite"
+HASH_CHUNK = 1 << 20
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class ContentStore:
+    """
+    Armazém em root. link(src, dst) é seguro para várias threads (é o que o
+    Placer chama); close() grava o cache de hashes acumulado.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.objects = os.path.join(self.root, "objects")
+        os.makedirs(self.objects, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, DB_NAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT);
+            CREATE INDEX IF NOT EXISTS hashes_digest ON hashes(digest);
+            CREATE TABLE IF NOT EXISTS variants (name TEXT PRIMARY KEY, path TEXT);
+        """)
+        self._pending = []
+
+    def close(self):
+        with self._lock:
+            if self._pending:
+                self._db.executemany("INSERT OR REPLACE INTO hashes VALUES (?,?,?,?)", self._pending)
+                self._pending = []
+            self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- objetos -----
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def digest(self, path):
+        """Hash do arquivo, do cache se tamanho e mtime não mudaram."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, digest FROM hashes WHERE path=?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        d = file_digest(path)
+        with self._lock:
+            self._pending.append((path, st.st_size, st.st_mtime_ns, d))
+        return d
+
+    def ingest(self, src):
+        """Guarda src no armazém (se o conteúdo ainda não existe) e devolve o caminho do objeto."""
+        obj = self.object_path(self.digest(src))
+        if os.path.exists(obj):
+            return obj
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        tmp = f"{obj}.tmp{os.getpid()}_{threading.get_ident()}"
+        try:
+            place(src, tmp, "reflink")      # clone CoW quando possível, senão cópia
+            os.chmod(tmp, 0o444)
+            try:
+                os.link(tmp, obj)           # outra thread pode ter gravado o mesmo conteúdo
+            except FileExistsError:
+                pass
+        finally:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+        return obj
+
+    def link(self, src, dst):
+        """
+        Coloca src em dst como hardlink do objeto correspondente e devolve o
+        mecanismo usado ("store", ou "copy" se o destino está em outra partição).
+        """
+        obj = self.ingest(src)
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        try:
+            os.link(obj, dst)
+            return "store"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            place(obj, dst, "copy")
+            return "copy"
+
+    # ----- variantes -----
+    def register_variant(self, name, path):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO variants VALUES (?,?)", (name, os.path.abspath(path)))
+            self._db.commit()
+
+    def variants(self):
+        with self._lock:
+            return self._db.execute("SELECT name, path FROM variants ORDER BY name").fetchall()
+
+    def iter_objects(self):
+        for sub in os.scandir(self.objects):
+            if sub.is_dir():
+                for e in os.scandir(sub.path):
+                    if ".tmp" not in e.name:
+                        yield e
+
+    # ----- manutenção -----
+    def gc(self, dry_run=False):
+        """Apaga objetos sem hardlinks fora do armazém. Devolve (objetos, bytes)."""
+        n = nbytes = 0
+        dead = []
+        for e in self.iter_objects():
+            st = e.stat()
+            if st.st_nlink == 1:
+                n += 1; nbytes += st.st_size
+                dead.append(e.name)
+                if not dry_run:
+                    os.unlink(e.path)
+        if dead and not dry_run:
+            with self._lock:
+                self._db.executemany("DELETE FROM hashes WHERE digest=?", ((d,) for d in dead))
+                self._db.commit()
+        return n, nbytes
+
+    def usage(self):
+        """
+        Contabilidade por variante registrada: dict nome -> {files, logical,
+        in_store, exclusive, outside}, mais a entrada "(armazém)" com o total.
+        """
+        store_inodes = {}
+        total = 0
+        for e in self.iter_objects():
+            st = e.stat()
+            store_inodes[(st.st_dev, st.st_ino)] = st.st_size
+            total += st.st_size
+
+        users = defaultdict(set)          # inode do objeto -> variantes que o usam
+        report = {}
+        for name, path in self.variants():
+            r = {"files": 0, "logical": 0, "in_store": 0, "exclusive": 0, "outside": 0}
+            seen = set()
+            for dirpath, _, files in os.walk(path):
+                for fn in files:
+                    try:
+                        st = os.lstat(os.path.join(dirpath, fn))
+                    except OSError:
+                        continue
+                    key = (st.st_dev, st.st_ino)
+                    r["files"] += 1
+                    r["logical"] += st.st_size
+                    if key in store_inodes:
+                        if key not in seen:
+                            seen.add(key)
+                            r["in_store"] += st.st_size
+                            users[key].add(name)
+                    else:
+                        r["outside"] += st.st_size
+            report[name] = r
+        for key, names in users.items():
+            if len(names) == 1:
+                report[next(iter(names))]["exclusive"] += store_inodes[key]
+        report["(armazém)"] = {"files": len(store_inodes), "logical": total, "in_store": total,
+                               "exclusive": sum(s for k, s in store_inodes.items() if k not in users),
+                               "outside": 0}
+        return report
+
+def _mb(n):
+    return f"{n / 1e6:10.1f}"
+
+def main():
+    ap = argparse.ArgumentParser(description="Armazém de imagens endereçado por conteúdo (hardlinks).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name, hlp in (("du", "Uso de disco por variante."),
+                      ("gc", "Apaga objetos que nenhuma variante usa."),
+                      ("variants", "Lista as variantes registradas.")):
+        a = sub.add_parser(name, help=hlp)
+        a.add_argument("store")
+        if name == "gc":
+            a.add_argument("--dry-run", action="store_true", help="Só conta o que seria apagado.")
+    args = ap.parse_args()
+
+    if not os.path.isdir(os.path.join(args.store, "objects")):
+        print(f"[ERRO] Armazém não encontrado: {args.store}", file=sys.stderr); sys.exit(1)
+    with ContentStore(args.store) as store:
+        if args.cmd == "variants":
+            for name, path in store.variants():
+                print(f"{name}\t{path}")
+        elif args.cmd == "gc":
+            n, nbytes = store.gc(args.dry_run)
+            verbo = "seriam apagados" if args.dry_run else "apagados"
+            print(f"[OK] {n} objetos {verbo} ({nbytes / 1e6:.1f} MB)")
+        else:
+            print(f"{'variante':24s} {'arquivos':>9s} {'lógico MB':>10s} {'armazém MB':>10s} "
+                  f"{'exclus. MB':>10s} {'fora MB':>10s}")
+            for name, r in store.usage().items():
+                print(f"{name:24s} {r['files']:9d} {_mb(r['logical'])} {_mb(r['in_store'])} "
+                      f"{_mb(r['exclusive'])} {_mb(r['outside'])}")
+
+if __name__ == "__main__":
+    main()
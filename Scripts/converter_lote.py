@@ -1,55 +1,217 @@
 #(miranha): código para converter imagens dicom em nifti
 
 import SimpleITK as sitk
+import argparse
+import concurrent.futures as cf
+import json
 import os
 import sys
+import time
+import zlib
+import dicom_index
 
-def converter_serie_dicom(serie_dir, diretorio_saida):
+# Manifesto na pasta de saída: para cada pasta convertida, os NIfTIs gerados
+# e a assinatura da entrada (nº de arquivos e maior mtime)
+MANIFESTO = "converter_lote_manifest.json"
+# O manifesto é regravado a cada SALVAR_A_CADA pastas ou SALVAR_SEGUNDOS (e no fim),
+# não a cada pasta: regravar o JSON inteiro por pasta é O(n²) em árvores grandes
+SALVAR_A_CADA = 200
+SALVAR_SEGUNDOS = 30.0
+
+# Formatos de saída:
+#   "nii"    sem compressão (permite leitura mapeada em memória)
+#   "nii.gz" gzip do próprio SimpleITK/ITK, um núcleo, nível configurável
+#   "pgzip"  .nii.gz comprimido em blocos em paralelo (membros gzip concatenados,
+#            legível por gzip/nibabel/ITK como um .nii.gz comum)
+FORMATOS = ("nii", "nii.gz", "pgzip")
+SAIDA_PADRAO = {"formato": "nii.gz", "nivel": -1, "threads_gzip": 0}
+BLOCO_GZIP = 4 << 20  # 4 MiB por membro gzip
+
+def extensao(formato):
+    return ".nii" if formato == "nii" else ".nii.gz"
+
+def assinatura_entrada(serie_dir):
+    """(nº de arquivos, maior mtime_ns) da pasta; só stat, sem abrir os DICOMs."""
+    n, mtime = 0, 0
+    with os.scandir(serie_dir) as it:
+        for e in it:
+            if e.is_file():
+                n += 1
+                mtime = max(mtime, e.stat().st_mtime_ns)
+    return n, mtime
+
+def carregar_manifesto(diretorio_saida):
+    caminho = os.path.join(diretorio_saida, MANIFESTO)
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def salvar_manifesto(diretorio_saida, manifesto):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)."""
+    caminho = os.path.join(diretorio_saida, MANIFESTO)
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=1)
+    os.replace(tmp, caminho)
+
+def esta_atualizado(entrada, assinatura, diretorio_saida, formato="nii.gz"):
+    """As saídas existem, no mesmo formato, e foram geradas a partir da mesma assinatura de entrada."""
+    if not entrada or "saidas" not in entrada or [entrada.get("n"), entrada.get("mtime_ns")] != list(assinatura):
+        return False
+    if extensao(entrada.get("formato", "nii.gz")) != extensao(formato):
+        return False
+    return all(os.path.isfile(os.path.join(diretorio_saida, s)) for s in entrada["saidas"])
+
+def nome_saida(serie_dir, series_uid, formato="nii.gz"):
+    # ---- Lógica para criar um nome de arquivo único e informativo ----
+    # Pega o nome da pasta do paciente (ex: "1F"): a pasta acima da pasta da série
+    caminho_paciente = os.path.dirname(os.path.normpath(serie_dir))
+    paciente_id = os.path.basename(caminho_paciente)
+
+    # Paciente + SeriesInstanceUID: único mesmo com várias séries na mesma pasta
+    uid = "".join(ch if ch.isalnum() or ch in "._-" else "_" for ch in series_uid)
+    return f"{paciente_id}_{uid}{extensao(formato)}"
+
+def gzip_paralelo(origem, destino, nivel=6, threads=0, bloco=BLOCO_GZIP):
+    """
+    Comprime origem em destino com vários núcleos: cada bloco vira um membro
+    gzip independente (o zlib libera o GIL, então threads bastam) e os
+    membros são concatenados em ordem, o que o formato gzip permite.
+    """
+    threads = threads or os.cpu_count() or 1
+    nivel = 6 if nivel is None or nivel < 0 else nivel
+
+    def comprimir(dados):
+        c = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # wbits=31: cabeçalho gzip
+        return c.compress(dados) + c.flush()
+
+    def blocos(f):
+        while True:
+            dados = f.read(bloco)
+            if not dados:
+                return
+            yield dados
+
+    with open(origem, "rb") as fi, open(destino, "wb") as fo, \
+            cf.ThreadPoolExecutor(max_workers=threads) as ex:
+        # Janela limitada de blocos em voo para não carregar o volume inteiro
+        pendentes = []
+        for dados in blocos(fi):
+            pendentes.append(ex.submit(comprimir, dados))
+            if len(pendentes) >= 2 * threads:
+                fo.write(pendentes.pop(0).result())
+        for fut in pendentes:
+            fo.write(fut.result())
+
+def escrever_atomico(image, caminho, saida=SAIDA_PADRAO):
+    """
+    Grava em um temporário na mesma pasta e renomeia: uma execução
+    interrompida nunca deixa um volume truncado com o nome final.
+    """
+    pasta, nome = os.path.split(caminho)
+    tmp = os.path.join(pasta, f".tmp{os.getpid()}_{nome}")  # mantém a extensão
+    bruto = tmp[:-3] if tmp.endswith(".gz") else None        # .nii intermediário do pgzip
+    try:
+        if saida["formato"] == "nii":
+            sitk.WriteImage(image, tmp, False)
+        elif saida["formato"] == "nii.gz":
+            sitk.WriteImage(image, tmp, True, saida["nivel"])
+        else:
+            sitk.WriteImage(image, bruto, False)
+            gzip_paralelo(bruto, tmp, saida["nivel"], saida["threads_gzip"])
+        os.replace(tmp, caminho)
+    finally:
+        for t in (tmp, bruto):
+            if t and os.path.exists(t):
+                os.unlink(t)
+
+def converter_serie_dicom(serie_dir, series_uid, dicom_names, diretorio_saida, saida=SAIDA_PADRAO):
     """
-    Tenta converter uma única série DICOM. Se for bem-sucedido, salva como NIfTI.
-    Se a pasta não contiver uma série válida, ignora silenciosamente.
+    Converte uma série DICOM (arquivos já listados e ordenados) e salva como NIfTI.
 
     Args:
-        serie_dir (str): O caminho para a pasta que pode conter os arquivos DICOM.
+        serie_dir (str): A pasta de onde vêm os arquivos (usada no nome de saída).
+        series_uid (str): SeriesInstanceUID da série.
+        dicom_names (list): Arquivos da série, em ordem geométrica.
         diretorio_saida (str): A pasta principal onde todos os NIfTIs serão salvos.
+        saida (dict): Formato de saída ({"formato", "nivel", "threads_gzip"}, ver FORMATOS).
+
+    Returns:
+        str | None: Nome do arquivo gerado (relativo a diretorio_saida), ou None em caso de erro.
     """
     reader = sitk.ImageSeriesReader()
     try:
-        # Tenta obter os nomes dos arquivos da série DICOM na pasta
-        dicom_names = reader.GetGDCMSeriesFileNames(serie_dir)
-        if not dicom_names:
-            # Se a lista estiver vazia, não é uma série DICOM válida.
-            return
-
-        reader.SetFileNames(dicom_names)
+        # Sem GetGDCMSeriesFileNames: a lista vem da varredura única da pasta
+        reader.SetFileNames(list(dicom_names))
         image = reader.Execute()
 
-        # ---- Lógica para criar um nome de arquivo único e informativo ----
-        # Pega o nome da pasta da série (ex: "42100000")
-        serie_id = os.path.basename(os.path.normpath(serie_dir))
-        
-        # Pega o nome da pasta do paciente (ex: "1F")
-        caminho_paciente = os.path.dirname(serie_dir)
-        paciente_id = os.path.basename(os.path.normpath(caminho_paciente))
-
-        # Cria um nome de arquivo combinado para garantir que seja único
-        nome_arquivo_saida = f"{paciente_id}_{serie_id}.nii.gz"
+        nome_arquivo_saida = nome_saida(serie_dir, series_uid, saida["formato"])
         caminho_arquivo_saida = os.path.join(diretorio_saida, nome_arquivo_saida)
 
-        print(f"  [SUCESSO] Convertendo '{serie_dir}' para '{caminho_arquivo_saida}'")
-        sitk.WriteImage(image, caminho_arquivo_saida)
+        print(f"  [SUCESSO] Convertendo '{serie_dir}' ({series_uid}, {len(dicom_names)} arquivos) para '{caminho_arquivo_saida}'", flush=True)
+        escrever_atomico(image, caminho_arquivo_saida, saida)
+        return nome_arquivo_saida
 
     except Exception as e:
-        # Se ocorrer qualquer erro (ex: pasta com arquivos misturados), informa e continua
-        print(f"  [AVISO] Não foi possível processar '{serie_dir}'. Não parece ser uma série DICOM válida. Erro: {e}")
+        # Se ocorrer qualquer erro (ex: série incompleta/corrompida), informa e continua
+        print(f"  [AVISO] Não foi possível processar a série {series_uid} de '{serie_dir}'. Erro: {e}", flush=True)
+        return None
+
+def converter_pasta(serie_dir, diretorio_saida, series=None, saida=SAIDA_PADRAO):
+    """
+    Converte todas as séries de uma pasta. series ({uid: [arquivos]}) pode vir
+    do índice; sem ele, a pasta é lida uma única vez (só os cabeçalhos) e os
+    arquivos são agrupados por SeriesInstanceUID.
+
+    Returns:
+        tuple: (saídas geradas, nº de séries com erro)
+    """
+    if series is None:
+        series = dicom_index.group_series(dicom_index.read_dir_rows(serie_dir))
+    saidas, falhas = [], 0
+    for uid, arquivos in sorted(series.items()):
+        gerado = converter_serie_dicom(serie_dir, uid, arquivos, diretorio_saida, saida)
+        if gerado:
+            saidas.append(gerado)
+        else:
+            falhas += 1
+    return saidas, falhas
+
+def _iniciar_processo(threads):
+    """Inicializador do pool: limita as threads do SimpleITK em cada processo."""
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(threads)
+
+def pastas_candidatas(diretorio_raiz, indice=None, atualizar=True):
+    """
+    Pastas que podem conter séries DICOM, como pares (pasta, séries). Sem
+    índice: toda pasta com arquivos (mesmo com subpastas), séries=None (a
+    pasta é lida na conversão). Com o índice SQLite (dicom_index.py): as
+    séries de cada pasta já vêm agrupadas e ordenadas, sem abrir arquivos.
+    """
+    if indice:
+        if atualizar:
+            dicom_index.update_index(indice, diretorio_raiz)
+        return sorted(dicom_index.series_by_dir(indice, diretorio_raiz).items())
+    # os.walk() é perfeito para isso: ele percorre a árvore de diretórios
+    # 'root' é a pasta atual, 'dirs' são as subpastas, 'files' são os arquivos
+    return [(root, None) for root, dirs, files in os.walk(diretorio_raiz) if files]
 
-def main(diretorio_raiz, diretorio_saida):
+def main(diretorio_raiz, diretorio_saida, indice=None, atualizar_indice=True,
+         workers=1, threads=0, forcar=False, saida=SAIDA_PADRAO):
     """
     Função principal que varre o diretório raiz em busca de séries DICOM para converter.
 
     Args:
         diretorio_raiz (str): A pasta principal para iniciar a busca (ex: 'data/Feminino_separado/transversal').
         diretorio_saida (str): A pasta onde todos os arquivos NIfTI convertidos serão salvos.
+        indice (str): Índice SQLite de cabeçalhos (opcional) usado para localizar as séries.
+        atualizar_indice (bool): Atualiza o índice antes de consultá-lo.
+        workers (int): Pastas convertidas em paralelo (processos); 1 = sequencial.
+        threads (int): Threads do SimpleITK por processo (0 = núcleos / workers).
+        forcar (bool): Reconverte mesmo as pastas cujas saídas estão atualizadas.
+        saida (dict): Formato de saída ({"formato", "nivel", "threads_gzip"}, ver FORMATOS).
     """
     # Cria o diretório de saída, se ele não existir
     os.makedirs(diretorio_saida, exist_ok=True)
@@ -57,13 +219,57 @@ def main(diretorio_raiz, diretorio_saida):
     print(f"Os arquivos NIfTI serão salvos em: '{diretorio_saida}'")
     print("-" * 30)
 
-    # os.walk() é perfeito para isso: ele percorre a árvore de diretórios
-    # 'root' é a pasta atual, 'dirs' são as subpastas, 'files' são os arquivos
-    for root, dirs, files in os.walk(diretorio_raiz):
-        # Uma boa heurística: uma pasta de série DICOM geralmente contém arquivos, mas não outras subpastas.
-        if files and not dirs:
-            # Encontramos uma pasta que parece ser uma série DICOM. Tentamos convertê-la.
-            converter_serie_dicom(root, diretorio_saida)
+    workers = max(1, workers)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    # O gzip em blocos divide os mesmos núcleos que o SimpleITK
+    saida = dict(saida, threads_gzip=saida.get("threads_gzip") or threads)
+    manifesto = {} if forcar else carregar_manifesto(diretorio_saida)
+
+    # Séries inalteradas desde a última conversão são puladas
+    pendentes, pulados = [], 0
+    for root, series in pastas_candidatas(diretorio_raiz, indice, atualizar_indice):
+        chave = os.path.abspath(root)
+        assinatura = assinatura_entrada(root)
+        if esta_atualizado(manifesto.get(chave), assinatura, diretorio_saida, saida["formato"]):
+            pulados += 1
+            continue
+        pendentes.append((root, series, chave, assinatura))
+    print(f"Pastas a converter: {len(pendentes)} | atualizadas (puladas): {pulados}")
+
+    total = 0
+    sujas, ultimo_salvo = 0, time.monotonic()
+    def registrar(chave, assinatura, resultado):
+        nonlocal total, sujas, ultimo_salvo
+        saidas, falhas = resultado
+        total += len(saidas)
+        # Pastas com falha não entram no manifesto e são tentadas de novo na próxima execução;
+        # pastas sem nenhuma série DICOM entram (com saidas=[]) e não são relidas
+        if not falhas:
+            manifesto[chave] = {"saidas": saidas, "n": assinatura[0], "mtime_ns": assinatura[1],
+                                "formato": saida["formato"]}
+            sujas += 1
+            if sujas >= SALVAR_A_CADA or time.monotonic() - ultimo_salvo >= SALVAR_SEGUNDOS:
+                salvar_manifesto(diretorio_saida, manifesto)
+                sujas, ultimo_salvo = 0, time.monotonic()
+
+    try:
+        if workers == 1:
+            _iniciar_processo(threads)
+            for root, series, chave, assinatura in pendentes:
+                # Encontramos uma pasta com arquivos. Tentamos converter cada série dela.
+                registrar(chave, assinatura, converter_pasta(root, diretorio_saida, series, saida))
+        else:
+            with cf.ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_processo,
+                                        initargs=(threads,)) as ex:
+                futuros = {ex.submit(converter_pasta, root, diretorio_saida, series, saida): (chave, assinatura)
+                           for root, series, chave, assinatura in pendentes}
+                for fut in cf.as_completed(futuros):
+                    registrar(*futuros[fut], fut.result())
+    finally:
+        # Também em caso de erro/interrupção: o que já foi convertido não é refeito
+        if sujas:
+            salvar_manifesto(diretorio_saida, manifesto)
+    print(f"Séries convertidas nesta execução: {total}")
 
     print("-" * 30)
     print("Processo de conversão em lote concluído!")
@@ -71,17 +277,29 @@ def main(diretorio_raiz, diretorio_saida):
 
 if __name__ == "__main__":
     # O script espera 2 argumentos: <pasta_de_entrada> <pasta_de_saida>
-    if len(sys.argv) != 3:
-        print("Uso: python scripts/converter_lote.py <caminho_para_pasta_de_entrada> <caminho_para_pasta_de_saida>")
-        print("\nExemplo:")
-        print("python scripts/converter_lote.py data/Feminino_separado/transversal nifti_output/feminino_transversal")
-        sys.exit(1)
+    ap = argparse.ArgumentParser(
+        description="Converte todas as séries DICOM de uma árvore para NIfTI.",
+        epilog="Exemplo: python scripts/converter_lote.py data/Feminino_separado/transversal nifti_output/feminino_transversal")
+    ap.add_argument("input_dir", help="Pasta de entrada (varrida recursivamente).")
+    ap.add_argument("output_dir", help="Pasta de saída dos NIfTIs.")
+    ap.add_argument("--index", metavar="DB", help="Índice SQLite de cabeçalhos (dicom_index.py) para localizar as séries.")
+    ap.add_argument("--index-no-refresh", action="store_true", help="Com --index: consulta o índice sem varrer a árvore.")
+    ap.add_argument("--workers", type=int, default=1, help="Pastas convertidas em paralelo, um processo cada (default=1).")
+    ap.add_argument("--threads", type=int, default=0, help="Threads do SimpleITK por processo (default=0: núcleos / workers).")
+    ap.add_argument("--force", action="store_true", help="Reconverte tudo, ignorando o manifesto de saídas atualizadas.")
+    ap.add_argument("--format", choices=FORMATOS, default="nii.gz",
+                    help="nii (sem compressão, mapeável), nii.gz (gzip do ITK) ou pgzip (.nii.gz em blocos paralelos). Default=nii.gz.")
+    ap.add_argument("--level", type=int, default=-1, help="Nível de compressão 1-9 (default=-1: padrão da biblioteca).")
+    ap.add_argument("--gzip-threads", type=int, default=0, help="Threads do pgzip (default=0: as mesmas do SimpleITK).")
+    cli = ap.parse_args()
 
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
+    input_dir = cli.input_dir
+    output_dir = cli.output_dir
 
     if not os.path.isdir(input_dir):
         print(f"ERRO: O diretório de entrada '{input_dir}' não foi encontrado.")
         sys.exit(1)
 
-    main(input_dir, output_dir)
+    main(input_dir, output_dir, cli.index, not cli.index_no_refresh,
+         cli.workers, cli.threads, cli.force,
+         {"formato": cli.format, "nivel": cli.level, "threads_gzip": cli.gzip_threads})
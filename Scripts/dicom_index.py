@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+dicom_index.py — Índice persistente (SQLite) dos cabeçalhos DICOM do acervo
+
+Cada arquivo sob a raiz vira uma linha com caminho, tamanho/mtime, UIDs,
+geometria, modalidade, ImageType, parte do corpo, sexo e número de quadros.
+A atualização é incremental: só arquivos novos ou com tamanho/mtime
+diferentes são relidos (em paralelo, só as tags de INDEX_COLUMNS) e linhas
+de arquivos que sumiram são removidas. Arquivos não-DICOM também ficam
+registrados (is_dicom=0) para não serem reabertos a cada execução.
+
+Usado por separar_axial_3d.py, 3d/dicom2png.py, 3d/verify.py e
+converter_lote.py (opção de índice em cada um); com o índice quente, a
+separação/filtragem consulta o banco em vez de reler o acervo.
+
+Uso:
+  python dicom_index.py update <raiz> [--db dicom_index.sqlite] [--workers N]
+  python dicom_index.py series <raiz> [--db dicom_index.sqlite]
+"""
+
+import argparse, json, os, sqlite3, sys, time
+import concurrent.futures as cf
+import pydicom
+from pydicom.dataset import Dataset
+
+DEFAULT_DB = "dicom_index.sqlite"
+SCHEMA_VERSION = 1
+
+# (coluna, keyword DICOM, tipo): "str", "int", "float" ou "multi" (lista em JSON)
+INDEX_COLUMNS = [
+    ("sop_class_uid",      "SOPClassUID",             "str"),
+    ("sop_instance_uid",   "SOPInstanceUID",          "str"),
+    ("study_instance_uid", "StudyInstanceUID",        "str"),
+    ("series_instance_uid","SeriesInstanceUID",       "str"),
+    ("series_number",      "SeriesNumber",            "int"),
+    ("instance_number",    "InstanceNumber",          "int"),
+    ("modality",           "Modality",                "str"),
+    ("image_type",         "ImageType",               "multi"),
+    ("series_description", "SeriesDescription",       "str"),
+    ("protocol_name",      "ProtocolName",            "str"),
+    ("study_description",  "StudyDescription",        "str"),
+    ("study_date",         "StudyDate",               "str"),
+    ("body_part",          "BodyPartExamined",        "str"),
+    ("patient_sex",        "PatientSex",              "str"),
+    ("patient_id",         "PatientID",               "str"),
+    ("number_of_frames",   "NumberOfFrames",          "int"),
+    ("rows",               "Rows",                    "int"),
+    ("columns",            "Columns",                 "int"),
+    ("orientation",        "ImageOrientationPatient", "multi"),
+    ("position",           "ImagePositionPatient",    "multi"),
+    ("slice_thickness",    "SliceThickness",          "float"),
+    ("photometric",        "PhotometricInterpretation","str"),
+]
+INDEX_TAGS = [kw for _, kw, _ in INDEX_COLUMNS]
+_COLS = [c for c, _, _ in INDEX_COLUMNS]
+_ROW_COLS = ["path", "dir", "size", "mtime_ns", "is_dicom", "error"] + _COLS
+
+def looks_like_dicom(path) -> bool:
+    """"DICM" após o preâmbulo, ou primeiro elemento nos grupos 0x0002/0x0008 (arquivos sem preâmbulo)."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(132)
+    except OSError:
+        return False
+    if len(head) >= 132 and head[128:132] == b"DICM":
+        return True
+    return head[:2] in (b"\x08\x00", b"\x02\x00")
+
+def _encode(v, kind):
+    if v is None or v == "":
+        return None
+    try:
+        if kind == "int":
+            return int(v)
+        if kind == "float":
+            return float(v)
+        if kind == "multi":
+            vals = list(v) if not isinstance(v, (str, bytes)) else [v]
+            return json.dumps([float(x) if isinstance(x, float) else str(x) for x in vals])
+    except (TypeError, ValueError):
+        return None
+    return str(v)
+
+def read_row(path, size, mtime_ns):
+    """Lê o cabeçalho (só INDEX_TAGS) e devolve a tupla na ordem de _ROW_COLS."""
+    base = [path, os.path.dirname(path), size, mtime_ns]
+    if not looks_like_dicom(path):
+        return tuple(base + [0, "sem preâmbulo DICM"] + [None] * len(_COLS))
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True, force=True, specific_tags=INDEX_TAGS)
+        vals = [_encode(ds[kw].value if kw in ds else None, kind) for _, kw, kind in INDEX_COLUMNS]
+    except Exception as e:
+        return tuple(base + [0, str(e)[:200]] + [None] * len(_COLS))
+    return tuple(base + [1, None] + vals)
+
+def read_rows(items):
+    """Tarefa do pool: lote de (path, size, mtime_ns) -> linhas."""
+    return [read_row(*it) for it in items]
+
+# ---------- banco ----------
+def connect(db_path):
+    con = sqlite3.connect(str(db_path))
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    cols = ", ".join(f"{c} {'INTEGER' if k == 'int' else 'REAL' if k == 'float' else 'TEXT'}"
+                     for c, _, k in INDEX_COLUMNS)
+    con.executescript(f"""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER,
+            is_dicom INTEGER, error TEXT, {cols});
+        CREATE INDEX IF NOT EXISTS files_series ON files(series_instance_uid);
+        CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    con.execute("INSERT OR IGNORE INTO meta VALUES ('schema', ?)", (str(SCHEMA_VERSION),))
+    return con
+
+def _prefix_range(root):
+    """Limites [lo, hi) que cobrem, na ordem do índice, todos os caminhos sob root."""
+    lo = os.path.join(os.path.abspath(root), "")
+    return lo, lo[:-1] + chr(ord(os.sep) + 1)
+
+def _iter_stat(root, skip):
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            path = os.path.join(dirpath, fn)
+            if path in skip:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_size, st.st_mtime_ns
+
+def update_index(db_path, root, workers=None, chunk_size=256, verbose=True):
+    """
+    Sincroniza o índice com a árvore sob root. Retorna um dict com as
+    contagens new/changed/removed/unchanged.
+    """
+    root = os.path.abspath(root)
+    db_path = os.path.abspath(db_path)
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    con = connect(db_path)
+    lo, hi = _prefix_range(root)
+    known = {r[0]: (r[1], r[2]) for r in
+             con.execute("SELECT path, size, mtime_ns FROM files WHERE path >= ? AND path < ?", (lo, hi))}
+    skip = {db_path, db_path + "-wal", db_path + "-shm", db_path + "-journal"}
+
+    counts = {"new": 0, "changed": 0, "removed": 0, "unchanged": 0}
+    todo = []
+    for path, size, mtime_ns in _iter_stat(root, skip):
+        old = known.pop(path, None)
+        if old == (size, mtime_ns):
+            counts["unchanged"] += 1
+            continue
+        counts["new" if old is None else "changed"] += 1
+        todo.append((path, size, mtime_ns))
+
+    sql = f"INSERT OR REPLACE INTO files ({', '.join(_ROW_COLS)}) VALUES ({', '.join('?' * len(_ROW_COLS))})"
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        for c in chunks:
+            con.executemany(sql, read_rows(c))
+    else:
+        with cf.ProcessPoolExecutor(max_workers=workers) as ex:
+            for fut in cf.as_completed([ex.submit(read_rows, c) for c in chunks]):
+                con.executemany(sql, fut.result())
+    # O que sobrou em known não existe mais no disco
+    con.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in known))
+    counts["removed"] = len(known)
+    con.commit()
+    con.close()
+    if verbose:
+        print(f"[INFO] Índice {db_path}: novos={counts['new']} | alterados={counts['changed']} | "
+              f"removidos={counts['removed']} | inalterados={counts['unchanged']} "
+              f"({time.perf_counter() - t0:.1f}s)")
+    return counts
+
+# ---------- consultas ----------
+def iter_rows(db_path, root, dicom_only=True):
+    """Linhas (sqlite3.Row) de todos os arquivos indexados sob root, ordenadas por caminho."""
+    con = connect(db_path)
+    lo, hi = _prefix_range(root)
+    q = "SELECT * FROM files WHERE path >= ? AND path < ?" + (" AND is_dicom = 1" if dicom_only else "")
+    try:
+        yield from con.execute(q + " ORDER BY path", (lo, hi))
+    finally:
+        con.close()
+
+def row_dataset(row):
+    """Linha do índice -> Dataset pydicom só com as tags indexadas (mesma interface do dcmread)."""
+    ds = Dataset()
+    for col, kw, kind in INDEX_COLUMNS:
+        v = row[col]
+        if v is None:
+            continue
+        setattr(ds, kw, json.loads(v) if kind == "multi" else v)
+    return ds
+
+def series_members(db_path, root):
+    """{SeriesInstanceUID: [caminhos]} para os arquivos DICOM sob root."""
+    out = {}
+    for row in iter_rows(db_path, root):
+        out.setdefault(row["series_instance_uid"] or f"NO_SERIES__{row['path']}", []).append(row["path"])
+    return out
+
+def series_summary(db_path, root):
+    """Uma linha por série: UID, pasta, instâncias, quadros, modalidade, descrição e ImageType."""
+    con = connect(db_path)
+    lo, hi = _prefix_range(root)
+    try:
+        return con.execute("""
+            SELECT series_instance_uid AS series, MIN(dir) AS dir, COUNT(*) AS instances,
+                   SUM(COALESCE(number_of_frames, 1)) AS frames, MAX(modality) AS modality,
+                   MAX(series_description) AS description, MAX(image_type) AS image_type
+            FROM files WHERE path >= ? AND path < ? AND is_dicom = 1
+            GROUP BY series_instance_uid ORDER BY dir""", (lo, hi)).fetchall()
+    finally:
+        con.close()
+
+def series_dirs(db_path, root):
+    """Pastas que contêm ao menos um arquivo DICOM indexado."""
+    con = connect(db_path)
+    lo, hi = _prefix_range(root)
+    try:
+        return [r[0] for r in con.execute(
+            "SELECT DISTINCT dir FROM files WHERE path >= ? AND path < ? AND is_dicom = 1 ORDER BY dir", (lo, hi))]
+    finally:
+        con.close()
+
+def series_by_dir(db_path, root):
+    """{pasta: {SeriesInstanceUID: [caminhos em ordem geométrica]}} direto do índice."""
+    by_dir = {}
+    for row in iter_rows(db_path, root):
+        by_dir.setdefault(row["dir"], []).append(row)
+    return {d: group_series(rows) for d, rows in by_dir.items()}
+
+def read_dir_rows(d):
+    """Linhas (dicts, mesmo formato do índice) dos arquivos de uma pasta, lidas direto do disco."""
+    rows = []
+    with os.scandir(d) as it:
+        for e in it:
+            if e.is_file():
+                st = e.stat()
+                rows.append(dict(zip(_ROW_COLS, read_row(e.path, st.st_size, st.st_mtime_ns))))
+    return rows
+
+def _slice_key(row):
+    """Ordem geométrica: posição ao longo da normal (IOP x IPP), depois InstanceNumber e nome."""
+    pos = None
+    try:
+        iop = json.loads(row["orientation"]) if row["orientation"] else None
+        ipp = json.loads(row["position"]) if row["position"] else None
+        if iop and ipp and len(iop) == 6 and len(ipp) == 3:
+            r, c = [float(x) for x in iop[:3]], [float(x) for x in iop[3:]]
+            n = (r[1]*c[2] - r[2]*c[1], r[2]*c[0] - r[0]*c[2], r[0]*c[1] - r[1]*c[0])
+            pos = sum(float(p) * k for p, k in zip(ipp, n))
+    except (TypeError, ValueError):
+        pos = None
+    inst = row["instance_number"]
+    return (pos is None, pos or 0.0, inst is None, inst or 0, row["path"])
+
+def group_series(rows):
+    """
+    {SeriesInstanceUID: [caminhos]} com as fatias de cada série em ordem
+    geométrica (como o GDCM), a partir de linhas do índice ou de read_dir_rows().
+    Só entram objetos com imagem (Rows/Columns): SR, KO, PR e outros SOPs sem
+    pixels não viram séries (uma pasta só com eles não tem o que converter).
+    """
+    groups = {}
+    for row in rows:
+        if row["is_dicom"] and row["rows"] and row["columns"]:
+            groups.setdefault(row["series_instance_uid"] or f"NO_SERIES__{row['path']}", []).append(row)
+    return {uid: [r["path"] for r in sorted(rs, key=_slice_key)] for uid, rs in groups.items()}
+
+def main():
+    ap = argparse.ArgumentParser(description="Índice SQLite dos cabeçalhos DICOM (atualização incremental por mtime).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name, hlp in (("update", "Varre a raiz e atualiza o índice."),
+                      ("series", "Lista as séries indexadas sob a raiz.")):
+        a = sub.add_parser(name, help=hlp)
+        a.add_argument("root")
+        a.add_argument("--db", default=DEFAULT_DB, help=f"Arquivo do índice (default={DEFAULT_DB}).")
+        if name == "update":
+            a.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"[ERRO] Raiz não existe: {args.root}", file=sys.stderr); sys.exit(1)
+    if args.cmd == "update":
+        update_index(args.db, args.root, args.workers)
+    else:
+        rows = series_summary(args.db, args.root)
+        for r in rows:
+            print(f"{r['instances']:6d} inst | {r['frames']:6d} quadros | {r['modality'] or '-':3s} | "
+                  f"{r['description'] or '-'} | {r['dir']}")
+        print(f"[OK] séries={len(rows)}")
+
+if __name__ == "__main__":
+    main()
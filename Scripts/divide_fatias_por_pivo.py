@@ -1,6 +1,6 @@
 import os
-import shutil
 import re
+from file_placement import Placer, format_counts
 
 def carregar_alvos_txt(caminho_txt):
     """
@@ -35,8 +35,14 @@ def natural_key(text):
     return [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', text)]
 
 
-def copiar_com_vizinhos(base_dir, output_dir, alvos, X):
+def copiar_com_vizinhos(base_dir, output_dir, alvos, X, modo="copy"):
+    """
+    Copia cada alvo e seus X vizinhos (circular) de cada lado. modo: "copy",
+    "hardlink", "symlink", "reflink" ou "auto" (ver file_placement.py).
+    Destinos já existentes são mantidos.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    placer = Placer(modo, skip_existing=True)
 
     for alvo_rel in alvos:
         # Caminho completo para o arquivo alvo
@@ -52,7 +58,6 @@ def copiar_com_vizinhos(base_dir, output_dir, alvos, X):
         # Diretório de saída correspondente
         dir_relativo = os.path.relpath(dir_alvo, base_dir)
         dir_saida = os.path.join(output_dir, dir_relativo)
-        os.makedirs(dir_saida, exist_ok=True)
 
         # Lista de arquivos no diretório, ordenada naturalmente
         arquivos = sorted(os.listdir(dir_alvo), key=natural_key)
@@ -74,12 +79,14 @@ def copiar_com_vizinhos(base_dir, output_dir, alvos, X):
             nome_arquivo = arquivos[idx]
             src = os.path.join(dir_alvo, nome_arquivo)
             dst = os.path.join(dir_saida, nome_arquivo)
+            placer.add(src, dst)
 
-            if not os.path.exists(dst):
-                shutil.copy2(src, dst)
-
-        print(f"✅ Copiado {2*X+1} arquivos em {dir_alvo} (alvo: {nome_alvo})")
+        print(f"✅ {2*X+1} arquivos na fila em {dir_alvo} (alvo: {nome_alvo})")
 
+    colocados, erros = placer.run()
+    for src, dst, msg in erros:
+        print(f"⚠️ Falha em {src}: {msg}")
+    print(f"Colocação: {format_counts(colocados)}")
     print("\n🎯 Cópia completa para todos os diretórios.")
 
 
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+file_placement.py — Camada única de cópia/ligação de arquivos para os scripts de dataset
+
+Os scripts que montam variantes de dataset (separar_axial_3d, separar_dataset_yolov2,
+separa_dataset, padroniza_dataset, 3d/select_frontal, divide_fatias_por_pivo)
+registram pares origem -> destino num Placer e executam tudo de uma vez:
+
+  - modos: copy, hardlink, symlink, reflink, move e auto
+      reflink: clone copy-on-write (FICLONE) ou copy_file_range; sem suporte
+               no sistema de arquivos, cai para cópia
+      hardlink: cai para cópia entre partições (EXDEV) ou sem permissão
+      auto:    clone CoW (só FICLONE) -> hardlink -> cópia; nunca duplica os
+               dados quando o sistema de arquivos aceita links (ex.: ext4)
+  - diretórios de destino criados uma única vez (cache), antes da colocação
+  - pool de threads para sobrepor a E/S
+  - dry-run: o plano pode ser impresso, salvo (JSONL) e reexecutado depois
+  - store: com um ContentStore (content_store.py), cada destino vira hardlink
+    de um objeto endereçado por conteúdo, e o modo é ignorado
+
+Uso (reexecutar um plano salvo com --plan por algum dos scripts):
+  python file_placement.py replay plano.jsonl [--mode hardlink] [--workers 16]
+  python file_placement.py show   plano.jsonl
+"""
+
+import argparse, errno, json, os, shutil, sys
+import concurrent.futures as cf
+from collections import Counter
+
+MODES = ("copy", "hardlink", "symlink", "reflink", "move", "auto")
+FICLONE = 0x40049409  # _IOW(0x94, 9, int), linux/fs.h
+
+# Erros que significam "este mecanismo não serve aqui" (e não falha do arquivo)
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP,
+                    errno.EINVAL, errno.ENOSYS, errno.EMLINK, errno.ETXTBSY, errno.EBADF}
+
+def _reflink(src, dst, strict=False):
+    """
+    Clone copy-on-write; tenta FICLONE e depois copy_file_range (que o kernel
+    pode clonar, mas em ext4 copia os dados). strict: só FICLONE.
+    """
+    import fcntl
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS and e.errno != errno.ENOTTY:
+                raise
+            if strict or not hasattr(os, "copy_file_range"):
+                raise OSError(errno.EOPNOTSUPP, "reflink indisponível") from e
+            remaining = os.fstat(fs.fileno()).st_size
+            while remaining > 0:
+                n = os.copy_file_range(fs.fileno(), fd.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+    shutil.copystat(src, dst)
+
+def _clone(src, dst):
+    _reflink(src, dst, strict=True)
+
+def _copy(src, dst):
+    shutil.copy2(src, dst)
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+def _symlink(src, dst):
+    os.symlink(os.path.abspath(src), dst)
+
+def _move(src, dst):
+    shutil.move(src, dst)
+
+_CHAINS = {
+    "copy":     (("copy", _copy),),
+    "hardlink": (("hardlink", _hardlink), ("copy", _copy)),
+    "symlink":  (("symlink", _symlink), ("copy", _copy)),
+    "reflink":  (("reflink", _reflink), ("copy", _copy)),
+    "move":     (("move", _move),),
+    "auto":     (("reflink", _clone), ("hardlink", _hardlink), ("copy", _copy)),
+}
+
+def place(src, dst, mode="copy"):
+    """
+    Coloca um arquivo em dst (diretório pai já existente) e devolve o
+    mecanismo efetivamente usado. dst existente é substituído.
+    """
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    chain = _CHAINS[mode]
+    for k, (name, fn) in enumerate(chain):
+        try:
+            fn(src, dst)
+            return name
+        except OSError as e:
+            if k == len(chain) - 1 or e.errno not in _FALLBACK_ERRNOS | {errno.ENOTTY}:
+                raise
+            # Restos de uma tentativa parcial (ex.: reflink abriu dst)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+    raise AssertionError("cadeia de modos vazia")
+
+class Placer:
+    """
+    Plano de colocação: add() registra pares (origem, destino); run() cria os
+    diretórios e executa tudo num pool de threads. Com dry_run, run() só
+    devolve as contagens do que seria feito. Com store, as imagens passam
+    pelo armazém endereçado por conteúdo (ver content_store.py).
+    """
+    def __init__(self, mode="copy", workers=8, dry_run=False, skip_existing=False, store=None):
+        if mode not in MODES:
+            raise ValueError(f"Modo inválido: {mode} (use um de {', '.join(MODES)})")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.dry_run = dry_run
+        self.skip_existing = skip_existing
+        self.store = store
+        self.plan = []
+        self._slot = {}     # destino -> posição no plano (um destino aparece uma vez só)
+        self._dirs = set()
+
+    def __len__(self):
+        return len(self.plan)
+
+    def add(self, src, dst):
+        """
+        Registra src -> dst. Um destino repetido substitui a entrada anterior
+        (a última vence, como na execução sequencial): duas threads nunca
+        escrevem o mesmo destino.
+        """
+        src, dst = str(src), str(dst)
+        key = os.path.normpath(os.path.abspath(dst))
+        k = self._slot.get(key)
+        if k is None:
+            self._slot[key] = len(self.plan)
+            self.plan.append((src, dst))
+        else:
+            self.plan[k] = (src, dst)
+
+    # ----- plano -----
+    def print_plan(self, file=sys.stdout):
+        for src, dst in self.plan:
+            print(f"{self.mode}\t{src} -> {dst}", file=file)
+
+    def save_plan(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for src, dst in self.plan:
+                f.write(json.dumps({"mode": self.mode, "src": src, "dst": dst}, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def from_plan(cls, path, mode=None, **kw):
+        """Recarrega um plano salvo; mode sobrescreve o modo gravado."""
+        placer = None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                if placer is None:
+                    placer = cls(mode or rec.get("mode", "copy"), **kw)
+                placer.add(rec["src"], rec["dst"])
+        return placer or cls(mode or "copy", **kw)
+
+    # ----- execução -----
+    def _make_dirs(self):
+        """Cria cada diretório de destino uma única vez (pais antes dos filhos)."""
+        parents = {os.path.dirname(dst) for _, dst in self.plan} - self._dirs
+        for d in sorted(parents):
+            if d:
+                os.makedirs(d, exist_ok=True)
+        self._dirs |= parents
+
+    def _place_chunk(self, chunk):
+        counts, errors = Counter(), []
+        for src, dst in chunk:
+            if self.skip_existing and os.path.lexists(dst):
+                counts["skipped"] += 1
+                continue
+            try:
+                if self.store is not None:
+                    counts[self.store.link(src, dst)] += 1
+                else:
+                    counts[place(src, dst, self.mode)] += 1
+            except OSError as e:
+                counts["error"] += 1
+                errors.append((src, dst, str(e)))
+        return counts, errors
+
+    def run(self, chunk_size=64, progress_step=0):
+        """
+        Executa o plano. Retorna (contagens por mecanismo usado, lista de
+        erros (origem, destino, mensagem)); o plano é esvaziado. Com
+        progress_step > 0, imprime um ponto a cada progress_step arquivos.
+        """
+        if self.dry_run:
+            mode = "store" if self.store is not None else self.mode
+            counts = +Counter({f"{mode} (dry-run)": len(self.plan)})  # '+' descarta o zero
+            return counts, []
+        self._make_dirs()
+        chunks = [self.plan[i:i + chunk_size] for i in range(0, len(self.plan), chunk_size)]
+        counts, errors = Counter(), []
+        done = 0
+
+        def collect(results):
+            nonlocal done
+            for chunk, (c, e) in zip(chunks, results):
+                counts.update(c); errors.extend(e)
+                if progress_step > 0:
+                    dots = (done + len(chunk)) // progress_step - done // progress_step
+                    if dots:
+                        print("." * dots, end="", flush=True)
+                done += len(chunk)
+
+        if self.workers == 1 or len(chunks) <= 1:
+            collect(map(self._place_chunk, chunks))
+        else:
+            with cf.ThreadPoolExecutor(max_workers=self.workers) as ex:
+                collect(ex.map(self._place_chunk, chunks))
+        if self.store is not None:
+            self.store.close()      # grava o cache de hashes
+        self.plan = []
+        self._slot = {}
+        return counts, errors
+
+def format_counts(counts):
+    return " | ".join(f"{k}={v}" for k, v in sorted(counts.items())) or "nada a fazer"
+
+def main():
+    ap = argparse.ArgumentParser(description="Mostra ou reexecuta um plano de colocação salvo.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("replay", help="Executa um plano salvo.")
+    a.add_argument("plan")
+    a.add_argument("--mode", choices=MODES, help="Sobrescreve o modo gravado no plano.")
+    a.add_argument("--workers", type=int, default=8)
+    a.add_argument("--skip-existing", action="store_true", help="Não substitui destinos existentes.")
+    b = sub.add_parser("show", help="Imprime um plano salvo.")
+    b.add_argument("plan")
+    args = ap.parse_args()
+
+    if not os.path.isfile(args.plan):
+        print(f"[ERRO] Plano não encontrado: {args.plan}", file=sys.stderr); sys.exit(1)
+    if args.cmd == "show":
+        placer = Placer.from_plan(args.plan)
+        placer.print_plan()
+        print(f"[OK] {len(placer)} arquivos no plano ({placer.mode})")
+        return
+    placer = Placer.from_plan(args.plan, args.mode, workers=args.workers, skip_existing=args.skip_existing)
+    counts, errors = placer.run()
+    for src, dst, msg in errors:
+        print(f"[ERRO] {src} -> {dst}: {msg}", file=sys.stderr)
+    print(f"[OK] {format_counts(counts)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+image_normalize.py — Motor único de normalização de imagens (pad, zoom, resize)
+
+Usado por padding_and_resize.py, Germano/norm_images.py e Germano/zoom.py,
+que viram só configuração em cima dele:
+
+  - pad:    letterbox; a imagem é redimensionada primeiro e escrita direto
+            (cv2.resize com dst) no centro de um quadro já preenchido com a
+            cor de fundo, sem redimensionar a borda preta junto
+  - zoom:   escala para cobrir o alvo (x extra_zoom) e corte central; só a
+            região que sobra do corte é redimensionada. Com extra_zoom < 1
+            a imagem não cobre o alvo e sobra borda (cor de fundo)
+  - resize: redimensiona para o alvo, sem manter a proporção
+
+  - percorre a entrada recursivamente e mantém a estrutura de pastas
+  - pool de processos; cada worker reaproveita o quadro de saída entre imagens
+  - INTER_AREA para reduzir e LANCZOS para ampliar (como o PIL fazia)
+
+Uso:
+  python image_normalize.py <entrada> <saida> [--mode pad|zoom|resize] [--size 640]
+                            [--height H] [--zoom 1.2] [--no-upscale] [--flat]
+                            [--gray] [--color 0 0 0] [--workers N] [--skip-existing]
+"""
+
+import argparse, os, sys, time
+import concurrent.futures as cf
+from pathlib import Path
+import numpy as np
+import cv2
+
+MODES = ("pad", "zoom", "resize")
+IMG_EXTS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+JPEG_QUALITY = 95
+
+# Quadros de saída reaproveitados pelo worker: (altura, largura, canais) -> array
+_CANVAS = {}
+
+def _canvas(shape):
+    buf = _CANVAS.get(shape)
+    if buf is None:
+        buf = _CANVAS[shape] = np.empty(shape, dtype=np.uint8)
+    return buf
+
+def _interp(scale):
+    return cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LANCZOS4
+
+def _fill(out, color):
+    out[:] = color[::-1] if out.ndim == 3 else int(round(np.mean(color)))  # RGB -> BGR / cinza
+
+def _paste(out, img, x0, y0, nw, nh, scale):
+    """Redimensiona img para (nw, nh) direto na região de out que começa em (x0, y0)."""
+    roi = out[y0:y0 + nh, x0:x0 + nw]
+    res = cv2.resize(img, (nw, nh), dst=roi, interpolation=_interp(scale))
+    if not np.shares_memory(res, roi):
+        roi[:] = res
+
+def _zoom_axis(n, t, scale):
+    """
+    Um eixo do zoom: (início e tamanho na origem, início e tamanho no alvo).
+    Se a imagem escalada cobre o alvo, corte central; senão (extra_zoom < 1),
+    a imagem inteira fica centralizada e o resto é borda.
+    """
+    m = int(round(n * scale))
+    if m >= t:
+        c = t / scale
+        s0 = int(round((n - c) / 2))
+        return s0, max(1, min(n - s0, int(round(c)))), 0, t
+    return 0, n, -((m - t) // 2), max(1, m)
+
+def normalize(img, size, mode="pad", color=(0, 0, 0), extra_zoom=1.0, upscale=True):
+    """
+    Normaliza um array uint8 (H,W) ou (H,W,3) BGR para size=(largura, altura).
+    color é RGB (como nos scripts PIL). O resultado é um buffer reaproveitado
+    pelo processo: copie-o se precisar guardá-lo além da próxima chamada.
+    """
+    tw, th = size
+    h, w = img.shape[:2]
+    shape = (th, tw) + img.shape[2:]
+    out = _canvas(shape)
+
+    if mode == "resize":
+        cv2.resize(img, (tw, th), dst=out, interpolation=_interp(min(tw / w, th / h)))
+        return out
+
+    if mode == "zoom":
+        # Mesma escala em x e y; só a região da origem que sobrevive ao corte
+        # central é redimensionada
+        scale = max(tw / w, th / h) * extra_zoom
+        sx, cw, dx, nw = _zoom_axis(w, tw, scale)
+        sy, ch, dy, nh = _zoom_axis(h, th, scale)
+        if (nw, nh) != (tw, th):
+            _fill(out, color)
+        _paste(out, img[sy:sy + ch, sx:sx + cw], dx, dy, nw, nh, scale)
+        return out
+
+    if mode != "pad":
+        raise ValueError(f"Modo inválido: {mode} (use um de {', '.join(MODES)})")
+    scale = min(tw / w, th / h)
+    if not upscale:
+        scale = min(scale, 1.0)
+    nw, nh = max(1, min(tw, int(round(w * scale)))), max(1, min(th, int(round(h * scale))))
+    _fill(out, color)
+    _paste(out, img, (tw - nw) // 2, (th - nh) // 2, nw, nh, scale)
+    return out
+
+def save_image(path, img):
+    ext = Path(path).suffix.lower()
+    params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY] if ext in (".jpg", ".jpeg") else []
+    return cv2.imwrite(str(path), img, params)
+
+def plan_jobs(src_root, dst_root, recursive=True, skip_existing=False):
+    """Pares (origem, destino) mantendo a estrutura de src_root sob dst_root."""
+    src_root, dst_root = Path(src_root), Path(dst_root)
+    files = src_root.rglob("*") if recursive else src_root.glob("*")
+    jobs = []
+    for p in sorted(files):
+        if p.suffix.lower() in IMG_EXTS and p.is_file():
+            dst = dst_root / p.relative_to(src_root)
+            if skip_existing and dst.exists():
+                continue
+            jobs.append((str(p), str(dst)))
+    return jobs
+
+def _run_chunk(jobs, opts):
+    """Executa um lote no worker; devolve (n_ok, [(origem, erro)])."""
+    flag = cv2.IMREAD_GRAYSCALE if opts["gray"] else cv2.IMREAD_COLOR
+    ok, errors = 0, []
+    for src, dst in jobs:
+        img = cv2.imread(src, flag)
+        if img is None:
+            errors.append((src, "não foi possível ler a imagem"))
+            continue
+        try:
+            out = normalize(img, opts["size"], opts["mode"], opts["color"], opts["extra_zoom"], opts["upscale"])
+            if not save_image(dst, out):
+                errors.append((src, f"falha ao gravar {dst}"))
+                continue
+            ok += 1
+        except (cv2.error, ValueError) as e:
+            errors.append((src, str(e)))
+    return ok, errors
+
+def normalize_tree(src_root, dst_root, size=(640, 640), mode="pad", color=(0, 0, 0), extra_zoom=1.0,
+                   upscale=True, recursive=True, gray=False, workers=None, chunk_size=32,
+                   skip_existing=False):
+    """
+    Normaliza todas as imagens de src_root em dst_root (mesma estrutura).
+    size: (largura, altura). Retorna (n_ok, [(origem, erro)]).
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo inválido: {mode} (use um de {', '.join(MODES)})")
+    jobs = plan_jobs(src_root, dst_root, recursive, skip_existing)
+    # Diretórios de saída criados uma vez, antes do pool
+    for d in sorted({os.path.dirname(dst) for _, dst in jobs}):
+        os.makedirs(d, exist_ok=True)
+    opts = {"size": tuple(size), "mode": mode, "color": tuple(color), "extra_zoom": extra_zoom,
+            "upscale": upscale, "gray": gray}
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    n_ok, errors = 0, []
+    if workers == 1 or len(chunks) <= 1:
+        results = (_run_chunk(c, opts) for c in chunks)
+        for ok, errs in results:
+            n_ok += ok; errors.extend(errs)
+    else:
+        with cf.ProcessPoolExecutor(max_workers=workers) as ex:
+            for ok, errs in ex.map(_run_chunk, chunks, [opts] * len(chunks)):
+                n_ok += ok; errors.extend(errs)
+    return n_ok, errors
+
+def main():
+    ap = argparse.ArgumentParser(description="Normaliza imagens (pad/letterbox, zoom-crop ou resize) em paralelo.")
+    ap.add_argument("input", type=Path)
+    ap.add_argument("output", type=Path)
+    ap.add_argument("--mode", choices=MODES, default="pad", help="Default=pad.")
+    ap.add_argument("--size", type=int, default=640, help="Largura (e altura, sem --height). Default=640.")
+    ap.add_argument("--height", type=int, default=None)
+    ap.add_argument("--zoom", type=float, default=1.0, help="Zoom extra do modo zoom (>1 corta mais borda).")
+    ap.add_argument("--no-upscale", action="store_true", help="pad: nunca amplia imagens menores que o alvo.")
+    ap.add_argument("--flat", action="store_true", help="Só o primeiro nível da entrada (sem recursão).")
+    ap.add_argument("--gray", action="store_true", help="Lê e grava em tons de cinza (1 canal).")
+    ap.add_argument("--color", type=int, nargs=3, default=(0, 0, 0), metavar=("R", "G", "B"),
+                    help="Cor do preenchimento (pad, e zoom < 1).")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--skip-existing", action="store_true", help="Não refaz imagens já presentes na saída.")
+    args = ap.parse_args()
+
+    if not args.input.is_dir():
+        print(f"[ERRO] Entrada não existe: {args.input}", file=sys.stderr); sys.exit(1)
+    t0 = time.perf_counter()
+    n_ok, errors = normalize_tree(args.input, args.output, (args.size, args.height or args.size), args.mode,
+                                  args.color, args.zoom, not args.no_upscale, not args.flat, args.gray,
+                                  args.workers, skip_existing=args.skip_existing)
+    for src, msg in errors:
+        print(f"[AVISO] {src}: {msg}", file=sys.stderr)
+    dt = time.perf_counter() - t0
+    print(f"[OK] {n_ok} imagens ({args.mode}) em {dt:.1f}s | falhas={len(errors)} | saída={args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+nifti_sampler.py — Amostrador 2.5D sobre os volumes NIfTI do converter_lote
+
+Lê os volumes convertidos direto do disco, sem gerar PNGs:
+  - .nii sem compressão (converter_lote --format nii) é mapeado em memória;
+    .nii.gz é descomprimido uma vez para um cache de .nii brutos e mapeado dali
+  - fatias ou blocos de fatias ("slabs", 2.5D) axiais, coronais ou sagitais
+    por índice, como views do memmap (sem cópia)
+  - lotes float32 (B, slab, H, W) no tamanho alvo, com slope/intercept e
+    janela opcional; a cópia acontece só aí, direto no buffer do lote
+
+Os eixos são os do voxel (i=colunas, j=linhas, k=fatias da aquisição):
+axial = k, coronal = j, sagital = i, o que vale para as séries axiais que
+o separar_axial_3d entrega ao converter_lote. Só NIfTI-1 (o que o ITK grava).
+
+Uso (inspeção/benchmark):
+  python nifti_sampler.py <pasta_ou_nifti> [--axis axial|coronal|sagittal]
+                          [--slab 3] [--stride 1] [--size 256] [--batch 32]
+                          [--window -1000 1000] [--cache /tmp/nii_cache] [--batches 50]
+"""
+
+import argparse, gzip, hashlib, os, shutil, sys, time
+from pathlib import Path
+import numpy as np
+import cv2
+
+AXES = {"sagittal": 2, "coronal": 1, "axial": 0}  # eixo no array (k, j, i)
+
+# datatype NIfTI -> dtype numpy
+NIFTI_DTYPES = {2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64,
+                256: np.int8, 512: np.uint16, 768: np.uint32, 1024: np.int64, 1280: np.uint64}
+
+def read_header(path):
+    """
+    Campos do cabeçalho NIfTI-1 usados pelo amostrador: dim, pixdim, dtype,
+    vox_offset, scl_slope/scl_inter e a ordem de bytes. Aceita .nii ou .nii.gz.
+    """
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rb") as f:
+        raw = f.read(348)
+    if len(raw) < 348:
+        raise ValueError(f"Cabeçalho NIfTI truncado: {path}")
+    for endian in "<>":
+        if np.frombuffer(raw, endian + "i4", 1, 0)[0] == 348:
+            break
+    else:
+        raise ValueError(f"Não é NIfTI-1 (sizeof_hdr != 348): {path}")
+    if raw[344:348] not in (b"n+1\0", b"ni1\0"):
+        raise ValueError(f"Magic NIfTI-1 inválido: {path}")
+    if raw[344:348] == b"ni1\0":
+        raise ValueError(f"Par .hdr/.img não suportado: {path}")
+
+    dim = np.frombuffer(raw, endian + "i2", 8, 40)
+    datatype = int(np.frombuffer(raw, endian + "i2", 1, 70)[0])
+    if datatype not in NIFTI_DTYPES:
+        raise ValueError(f"datatype NIfTI {datatype} não suportado: {path}")
+    pixdim = np.frombuffer(raw, endian + "f4", 8, 76)
+    slope, inter = (float(v) for v in np.frombuffer(raw, endian + "f4", 2, 112))
+    ndim = int(dim[0])
+    if ndim < 3 or any(int(d) > 1 for d in dim[4:ndim + 1]):
+        raise ValueError(f"Esperado volume 3D, dim={list(dim[:ndim + 1])}: {path}")
+    return {
+        "shape": tuple(int(d) for d in dim[1:4]),              # (i, j, k)
+        "spacing": tuple(float(abs(s)) or 1.0 for s in pixdim[1:4]),
+        "dtype": np.dtype(NIFTI_DTYPES[datatype]).newbyteorder(endian),
+        "offset": int(np.frombuffer(raw, endian + "f4", 1, 108)[0]),
+        "slope": slope if slope != 0.0 and np.isfinite(slope) else 1.0,
+        "inter": inter if np.isfinite(inter) else 0.0,
+    }
+
+def raw_copy(path, cache_dir):
+    """
+    .nii mapeável para path: o próprio arquivo, ou (para .nii.gz) uma cópia
+    descomprimida em cache_dir, reaproveitada enquanto tamanho/mtime não mudam.
+    """
+    path = Path(path)
+    if not path.name.endswith(".gz"):
+        return path
+    if cache_dir is None:
+        raise ValueError(f"{path.name} é comprimido: informe um diretório de cache (ou use --format nii)")
+    st = path.stat()
+    key = hashlib.sha1(f"{path.resolve()}|{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()[:16]
+    dst = Path(cache_dir) / f"{path.name[:-len('.nii.gz')]}.{key}.nii"
+    if dst.exists():
+        return dst
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".tmp{os.getpid()}_{dst.name}")
+    try:
+        with gzip.open(path, "rb") as fi, open(tmp, "wb") as fo:
+            shutil.copyfileobj(fi, fo, 4 << 20)
+        os.replace(tmp, dst)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return dst
+
+def open_nifti(path, cache_dir=None):
+    """
+    Abre um volume como memmap somente leitura na ordem (k, j, i) — fatias
+    axiais contíguas — e devolve (array, cabeçalho).
+    """
+    raw = raw_copy(path, cache_dir)
+    hdr = read_header(raw)
+    # NIfTI grava i mais rápido (ordem Fortran); .T dá a view (k, j, i) em ordem C
+    vol = np.memmap(raw, dtype=hdr["dtype"], mode="r", offset=hdr["offset"],
+                    shape=hdr["shape"], order="F")
+    return vol.T, hdr
+
+def slab_view(vol, axis, start, slab=1):
+    """slab fatias consecutivas a partir de start ao longo de axis, (slab, H, W), sem cópia."""
+    a = AXES[axis]
+    return np.moveaxis(vol, a, 0)[start:start + slab]
+
+def plane_spacing(hdr, axis):
+    """Espaçamento (linha, coluna) em mm do plano de corte de axis."""
+    si, sj, sk = hdr["spacing"]
+    return {"axial": (sj, si), "coronal": (sk, si), "sagittal": (sk, sj)}[axis]
+
+class NiftiSampler:
+    """
+    Índice (volume, início do slab) sobre uma lista de NIfTIs. sampler[n]
+    devolve o slab como view do memmap; batches() monta lotes no tamanho alvo.
+    Os memmaps são abertos sob demanda em cada processo (o objeto pode ir
+    para workers de DataLoader sem levar os mapeamentos).
+    """
+    def __init__(self, paths, axis="axial", slab=1, stride=1, cache_dir=None):
+        if axis not in AXES:
+            raise ValueError(f"Eixo inválido: {axis} (use um de {', '.join(AXES)})")
+        self.paths = [Path(p) for p in paths]
+        self.axis, self.slab, self.stride = axis, max(1, int(slab)), max(1, int(stride))
+        self.cache_dir = cache_dir
+        self._vols = {}
+        self.headers = []
+        self.index = []   # (volume, início)
+        for v, p in enumerate(self.paths):
+            hdr = read_header(raw_copy(p, cache_dir))
+            self.headers.append(hdr)
+            n = hdr["shape"][::-1][AXES[axis]]          # extensão ao longo do eixo, em (k, j, i)
+            self.index.extend((v, s) for s in range(0, n - self.slab + 1, self.stride))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_vols"] = {}
+        return state
+
+    def __len__(self):
+        return len(self.index)
+
+    def volume(self, v):
+        if v not in self._vols:
+            self._vols[v] = open_nifti(self.paths[v], self.cache_dir)[0]
+        return self._vols[v]
+
+    def __getitem__(self, n):
+        v, start = self.index[n]
+        return slab_view(self.volume(v), self.axis, start, self.slab)
+
+    def describe(self, n):
+        v, start = self.index[n]
+        return {"path": str(self.paths[v]), "axis": self.axis, "start": start, "slab": self.slab}
+
+    def fill(self, out, n, window=None, keep_aspect=True):
+        """
+        Escreve o slab n em out (slab, H, W) float32: slope/intercept, janela
+        opcional para [0,1] e redimensionamento. Com keep_aspect, respeita o
+        espaçamento físico do plano e centraliza (o resto fica em 0).
+        """
+        v, _ = self.index[n]
+        hdr = self.headers[v]
+        src = self[n]
+        H, W = out.shape[1:]
+        h, w = src.shape[1:]
+        if keep_aspect:
+            sy, sx = plane_spacing(hdr, self.axis)
+            scale = min(H / (h * sy), W / (w * sx))
+            rh, rw = max(1, min(H, round(h * sy * scale))), max(1, min(W, round(w * sx * scale)))
+        else:
+            rh, rw = H, W
+        y0, x0 = (H - rh) // 2, (W - rw) // 2
+        out[:] = 0.0
+        for c in range(src.shape[0]):
+            # np.asarray força a leitura só desta fatia (views coronais/sagitais são estriadas)
+            plane = np.asarray(src[c], dtype=np.float32)
+            out[c, y0:y0 + rh, x0:x0 + rw] = cv2.resize(plane, (rw, rh), interpolation=cv2.INTER_AREA
+                                                        if rh < h else cv2.INTER_LINEAR)
+        region = out[:, y0:y0 + rh, x0:x0 + rw]
+        if hdr["slope"] != 1.0 or hdr["inter"] != 0.0:
+            region *= hdr["slope"]; region += hdr["inter"]
+        if window is not None:
+            lo, hi = window
+            np.clip(region, lo, hi, out=region)
+            region -= lo; region /= float(hi - lo)
+        return out
+
+    def batches(self, batch_size=32, size=256, window=None, shuffle=False, seed=0, keep_aspect=True):
+        """
+        Gera (lote float32 (B, slab, H, W), lista de describe()) no tamanho alvo.
+        size: int ou (H, W). O buffer é alocado uma vez por lote.
+        """
+        H, W = (size, size) if isinstance(size, int) else size
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        else:
+            # Em ordem, agrupa por volume: mantém o acesso sequencial no memmap
+            order = order[np.argsort([self.index[n][0] for n in order], kind="stable")]
+        for b in range(0, len(order), batch_size):
+            ids = order[b:b + batch_size]
+            batch = np.empty((len(ids), self.slab, H, W), dtype=np.float32)
+            for row, n in enumerate(ids):
+                self.fill(batch[row], int(n), window, keep_aspect)
+            yield batch, [self.describe(int(n)) for n in ids]
+
+def find_volumes(root):
+    root = Path(root)
+    if root.is_file():
+        return [root]
+    return sorted(p for p in root.rglob("*") if p.name.endswith((".nii", ".nii.gz"))
+                  and not p.name.startswith(".tmp"))
+
+def main():
+    ap = argparse.ArgumentParser(description="Amostrador 2.5D (memmap) sobre volumes NIfTI do converter_lote.")
+    ap.add_argument("input", help="Um .nii/.nii.gz ou uma pasta de saída do converter_lote.")
+    ap.add_argument("--axis", choices=list(AXES), default="axial")
+    ap.add_argument("--slab", type=int, default=1, help="Fatias consecutivas por amostra (2.5D). Default=1.")
+    ap.add_argument("--stride", type=int, default=1, help="Passo entre amostras ao longo do eixo. Default=1.")
+    ap.add_argument("--size", type=int, default=256, help="Lado do quadro de saída. Default=256.")
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("--window", type=float, nargs=2, metavar=("MIN", "MAX"), default=None,
+                    help="Janela (após slope/intercept) mapeada para [0,1].")
+    ap.add_argument("--cache", default=None, help="Cache de .nii brutos para entradas .nii.gz.")
+    ap.add_argument("--batches", type=int, default=20, help="Lotes lidos no benchmark (0 = todos).")
+    ap.add_argument("--shuffle", action="store_true")
+    args = ap.parse_args()
+
+    paths = find_volumes(args.input)
+    if args.cache:
+        cache = Path(args.cache).resolve()
+        paths = [p for p in paths if cache not in p.resolve().parents]
+    if not paths:
+        print(f"[ERRO] Nenhum .nii/.nii.gz em {args.input}", file=sys.stderr); sys.exit(1)
+    t0 = time.perf_counter()
+    try:
+        sampler = NiftiSampler(paths, args.axis, args.slab, args.stride, args.cache)
+    except ValueError as e:
+        print(f"[ERRO] {e}", file=sys.stderr); sys.exit(1)
+    print(f"[INFO] volumes={len(paths)} | amostras={len(sampler)} ({args.axis}, slab={args.slab}) "
+          f"| índice em {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    n_batches = n_samples = 0
+    for batch, _ in sampler.batches(args.batch, args.size, args.window, args.shuffle):
+        n_batches += 1; n_samples += len(batch)
+        if args.batches and n_batches >= args.batches:
+            break
+    dt = time.perf_counter() - t0
+    if n_samples:
+        print(f"[OK] lotes={n_batches} | amostras={n_samples} | {n_samples / dt:.1f} amostras/s "
+              f"| forma do lote={tuple(batch.shape)}")
+
+if __name__ == "__main__":
+    main()
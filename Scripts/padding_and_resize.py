@@ -3,6 +3,7 @@ import cv2
 import os
 import shutil
 from pathlib import Path
+from image_normalize import normalize, normalize_tree
 
 # --- CONFIGURAÇÕES ---
 INPUT_DIRS = [
@@ -13,40 +14,21 @@ INPUT_DIRS = [
 
 OUTPUT_DIR = "dataset_normalizado"
 TARGET_SIZE = 640
+WORKERS = os.cpu_count() or 1  # processos do pool de normalização
 
 
 # --- FUNÇÃO DE PROCESSAMENTO ---
 def pad_and_resize(image_path: str, target_size: int):
     """
     Lê uma imagem, adiciona padding para torná-la quadrada e redimensiona.
+    (Letterbox do image_normalize: redimensiona primeiro e centraliza num
+    quadro preto, sem redimensionar a borda.)
     """
-    try:
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"  - Aviso: Não foi possível ler a imagem {image_path}")
-            return None
-
-        h, w, _ = img.shape
-        max_dim = max(h, w)
-        pad_h = max_dim - h
-        pad_w = max_dim - w
-
-        padded_img = cv2.copyMakeBorder(
-            img,
-            top=pad_h // 2,
-            bottom=pad_h - (pad_h // 2),
-            left=pad_w // 2,
-            right=pad_w - (pad_w // 2),
-            borderType=cv2.BORDER_CONSTANT,
-            value=[0, 0, 0]
-        )
-
-        resized_img = cv2.resize(padded_img, (target_size, target_size), interpolation=cv2.INTER_AREA)
-        return resized_img
-
-    except Exception as e:
-        print(f"  - Erro ao processar {image_path}: {e}")
+    img = cv2.imread(image_path)
+    if img is None:
+        print(f"  - Aviso: Não foi possível ler a imagem {image_path}")
         return None
+    return normalize(img, (target_size, target_size), "pad").copy()
 
 
 # --- LÓGICA PRINCIPAL ---
@@ -68,21 +50,11 @@ def main():
 
         print(f"\n➡️  Processando diretório: '{input_path.name}'")
 
-        image_files = [p for p in input_path.rglob('*') if p.is_file()]
-        count = 0
-
-        for image_file in image_files:
-            if image_file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.bmp', '.tiff']:
-                processed_image = pad_and_resize(str(image_file), TARGET_SIZE)
-                if processed_image is not None:
-                    # Cria caminho relativo e mantém estrutura dentro do diretório de saída
-                    relative_path = image_file.relative_to(input_path)
-                    save_path = output_path / input_path.name / relative_path.parent
-                    save_path.mkdir(parents=True, exist_ok=True)
-
-                    full_save_path = save_path / image_file.name
-                    cv2.imwrite(str(full_save_path), processed_image)
-                    count += 1
+        # Mantém a estrutura original sob OUTPUT_DIR/<nome da pasta de entrada>
+        count, erros = normalize_tree(input_path, output_path / input_path.name,
+                                      (TARGET_SIZE, TARGET_SIZE), "pad", workers=WORKERS)
+        for src, msg in erros:
+            print(f"  - Aviso: {src}: {msg}")
 
         print(f"   ✅ Concluído: {count} imagens processadas e salvas mantendo estrutura original.")
 
@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 import os
-import shutil
+from file_placement import Placer, format_counts
+from content_store import ContentStore
 
-def consolidar_pastas(base_dir, output_dir="Classes"):
+def consolidar_pastas(base_dir, output_dir="Classes", modo="copy", workers=8, armazem=None):
     """
     Consolida os arquivos de A e B em W, X, Y e Z conforme a estrutura descrita.
+    modo: "copy", "hardlink", "symlink", "reflink" ou "auto" (ver file_placement.py).
+    armazem: pasta de um armazém endereçado por conteúdo (ver content_store.py);
+    se informada, output_dir vira uma variante de hardlinks e modo é ignorado.
     """
+    store = None
+    if armazem:
+        store = ContentStore(armazem)
+        store.register_variant(os.path.basename(os.path.normpath(output_dir)), output_dir)
+    placer = Placer(modo, workers=workers, store=store)
 
     # Caminhos base
     pasta_A = os.path.join(base_dir, "dataset_normalizado/Feminino")
@@ -35,8 +44,7 @@ def consolidar_pastas(base_dir, output_dir="Classes"):
                         # Calcula o caminho relativo a partir de "origem_base/subdir"
                         relative_path = os.path.relpath(caminho_arquivo, os.path.join(origem_base, subdir, nome_subpasta))
                         destino_final = os.path.join(destino_base, subdir, os.path.basename(caminho_arquivo))
-                        os.makedirs(os.path.dirname(destino_final), exist_ok=True)
-                        shutil.copy2(caminho_arquivo, destino_final)
+                        placer.add(caminho_arquivo, destino_final)
 
     # C de A -> W
     copiar_arquivos(pasta_A, "Crânio", destinos["Cranio Feminino"])
@@ -47,6 +55,10 @@ def consolidar_pastas(base_dir, output_dir="Classes"):
     # D de B -> Z
     copiar_arquivos(pasta_B, "Pelve", destinos["Pelve Masculina"])
 
+    colocados, erros = placer.run()
+    for src, dst, msg in erros:
+        print(f"⚠️ Falha em {src}: {msg}")
+    print(f"Colocação: {format_counts(colocados)}")
     print(f"✅ Consolidação concluída! Pastas criadas em: {os.path.abspath(output_dir)}")
 
 
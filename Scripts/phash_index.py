@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+phash_index.py — Índice de hashes perceptuais para achar quase-duplicatas entre splits
+
+Fatias adjacentes, quadros de rotação, janelas do divide_fatias_por_pivo e
+saídas do data_augmentation são quase idênticas; quando o split não é
+estritamente por paciente (ex.: separa_dataset por subpasta), elas vazam
+de train para val/test. Este script:
+
+  - calcula um hash perceptual de 64 bits por imagem (pHash por DCT ou
+    dHash por gradiente) em paralelo, num pool de processos
+  - guarda os hashes num SQLite incremental (só relê arquivos com
+    tamanho/mtime novos), como o dicom_index.py
+  - busca vizinhos com distância de Hamming <= raio por multi-index hashing:
+    o hash é cortado em raio+1 pedaços e, pelo princípio da casa dos pombos,
+    dois hashes próximos coincidem exatamente em pelo menos um pedaço; só os
+    candidatos de um mesmo balde são comparados (nada de todos-contra-todos)
+  - agrupa os pares em clusters (union-find) e relata os que cruzam splits
+
+O split e a classe vêm do caminho: <raiz>/<split>/<classe>/... (layout do
+YOLO classify); fora desse layout, o primeiro nível é tratado como split.
+
+Uso:
+  python phash_index.py <raiz_dataset> [--db phash_index.sqlite] [--hash phash|dhash]
+                        [--radius 6] [--workers N] [--report vazamentos.csv]
+"""
+
+import argparse, csv, os, sqlite3, sys, time
+import concurrent.futures as cf
+from collections import Counter, defaultdict
+import numpy as np
+import cv2
+
+DEFAULT_DB = "phash_index.sqlite"
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+SPLITS = ("train", "val", "test", "holdout")
+HASHES = ("phash", "dhash")
+
+# ---------- hashes ----------
+def _bits_to_int(bits):
+    return int(np.packbits(bits.astype(np.uint8).ravel()).view(">u8")[0])
+
+def phash(gray):
+    """pHash: DCT 32x32, bloco 8x8 de baixa frequência comparado com a mediana."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))   # ignora o termo DC
+
+def dhash(gray):
+    """dHash: sinal do gradiente horizontal numa miniatura 9x8."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+def hash_chunk(items, kind):
+    """[(path, size, mtime_ns)] -> [(path, size, mtime_ns, hash | None)] (roda no pool)."""
+    fn = phash if kind == "phash" else dhash
+    out = []
+    for path, size, mtime_ns in items:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        h = None if gray is None else fn(gray)
+        out.append((path, size, mtime_ns, h))
+    return out
+
+def _signed(h):
+    """SQLite guarda INTEGER com sinal: 64 bits sem sinal <-> com sinal."""
+    return h - (1 << 64) if h is not None and h >= 1 << 63 else h
+
+# ---------- índice ----------
+def connect(db_path):
+    con = sqlite3.connect(str(db_path))
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS images (
+            path TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER, hash INTEGER,
+            PRIMARY KEY (path, kind));
+    """)
+    return con
+
+def iter_images(root):
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            if os.path.splitext(fn)[1].lower() in IMG_EXTS:
+                p = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                yield p, st.st_size, st.st_mtime_ns
+
+def update_index(db_path, root, kind="phash", workers=None, chunk_size=256):
+    """Hasheia só as imagens novas/alteradas sob root; remove as que sumiram. Devolve (novas, total)."""
+    root = os.path.abspath(root)
+    con = connect(db_path)
+    prefix = os.path.join(root, "")
+    known = {p: (s, m) for p, s, m in con.execute(
+        "SELECT path, size, mtime_ns FROM images WHERE kind=? AND path >= ? AND path < ?",
+        (kind, prefix, prefix[:-1] + chr(ord(os.sep) + 1)))}
+    todo, seen = [], set()
+    for p, size, mtime_ns in iter_images(root):
+        seen.add(p)
+        if known.get(p) != (size, mtime_ns):
+            todo.append((p, size, mtime_ns))
+    gone = [(p, kind) for p in known if p not in seen]
+    if gone:
+        con.executemany("DELETE FROM images WHERE path=? AND kind=?", gone)
+
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    with cf.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as ex:
+        for rows in ex.map(hash_chunk, chunks, [kind] * len(chunks)):
+            con.executemany("INSERT OR REPLACE INTO images VALUES (?,?,?,?,?)",
+                            [(p, kind, s, m, _signed(h)) for p, s, m, h in rows])
+    con.commit()
+    con.close()
+    return len(todo), len(seen)
+
+def load_hashes(db_path, root, kind="phash"):
+    """(caminhos, hashes uint64) das imagens legíveis sob root."""
+    prefix = os.path.join(os.path.abspath(root), "")
+    con = connect(db_path)
+    rows = con.execute("SELECT path, hash FROM images WHERE kind=? AND hash IS NOT NULL "
+                       "AND path >= ? AND path < ? ORDER BY path",
+                       (kind, prefix, prefix[:-1] + chr(ord(os.sep) + 1))).fetchall()
+    con.close()
+    paths = [p for p, _ in rows]
+    hashes = np.array([h & ((1 << 64) - 1) for _, h in rows], dtype=np.uint64)
+    return paths, hashes
+
+# ---------- busca por raio de Hamming (multi-index hashing) ----------
+if hasattr(np, "bitwise_count"):
+    def popcount(x):
+        return np.bitwise_count(x)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    def popcount(x):
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        return _POP8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+class MultiIndex:
+    """
+    Tabelas de pedaços de bits sobre hashes únicos de 64 bits. pairs() e
+    query() devolvem exatamente os pares/vizinhos com distância <= radius.
+    """
+    def __init__(self, hashes, radius):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.radius = int(radius)
+        m = min(64, self.radius + 1)
+        edges = np.linspace(0, 64, m + 1).astype(int)
+        self.chunks = [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+        self.tables = []
+        for a, b in self.chunks:
+            keys = self._key(self.hashes, a, b)
+            order = np.argsort(keys, kind="stable")
+            self.tables.append((keys[order], order))
+
+    @staticmethod
+    def _key(h, a, b):
+        mask = np.uint64((1 << (b - a)) - 1)
+        return (h >> np.uint64(64 - b)) & mask
+
+    def query(self, h, radius=None):
+        """Índices dos hashes a distância <= radius de h (exato para radius <= self.radius)."""
+        radius = self.radius if radius is None else min(radius, self.radius)
+        cand = []
+        h = np.uint64(h)
+        for (a, b), (keys, order) in zip(self.chunks, self.tables):
+            k = self._key(h, a, b)
+            lo, hi = np.searchsorted(keys, k, "left"), np.searchsorted(keys, k, "right")
+            cand.append(order[lo:hi])
+        cand = np.unique(np.concatenate(cand)) if cand else np.empty(0, dtype=np.int64)
+        return cand[popcount(self.hashes[cand] ^ h) <= radius]
+
+    def pairs(self, block_elems=1 << 22):
+        """
+        Gera arrays (i, j), i < j, com distância <= radius (um par pode sair
+        por mais de uma tabela). Baldes grandes são comparados em blocos de
+        até block_elems distâncias, para limitar a memória.
+        """
+        for keys, order in self.tables:
+            bounds = np.flatnonzero(np.diff(keys)) + 1
+            for grp in np.split(order, bounds):
+                if len(grp) < 2:
+                    continue
+                grp = np.sort(grp)
+                hs = self.hashes[grp]
+                step = max(1, block_elems // len(grp))
+                for s in range(0, len(grp), step):
+                    block = hs[s:s + step, None] ^ hs[None, s:]
+                    ii, jj = np.nonzero(popcount(block) <= self.radius)
+                    keep = ii < jj
+                    yield grp[ii[keep] + s], grp[jj[keep] + s]
+
+# ---------- clusters e relatório ----------
+def split_of(path, root):
+    parts = os.path.relpath(path, root).split(os.sep)
+    if len(parts) >= 3 and parts[0] in SPLITS:
+        return parts[0], parts[1]
+    return parts[0] if len(parts) > 1 else "", parts[1] if len(parts) > 2 else ""
+
+def clusters(n, pairs):
+    """Componentes conexos (union-find) dos pares gerados por MultiIndex.pairs()."""
+    parent = list(range(n))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for ii, jj in pairs:
+        for i, j in zip(ii.tolist(), jj.tolist()):
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+    groups = defaultdict(list)
+    for i in range(n):
+        groups[find(i)].append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+def find_leaks(paths, hashes, root, radius):
+    """
+    Clusters de quase-duplicatas que cruzam splits: lista de listas de
+    (caminho, split, classe, hash). Hashes idênticos são colapsados antes da busca.
+    """
+    uniq, inverse = np.unique(hashes, return_inverse=True)
+    index = MultiIndex(uniq, radius)
+    members = defaultdict(list)
+    for k, u in enumerate(inverse.ravel()):
+        members[int(u)].append(k)
+    groups = clusters(len(uniq), index.pairs())
+    clustered = {u for g in groups for u in g}
+    groups += [[u] for u, m in members.items() if len(m) > 1 and u not in clustered]  # só duplicatas exatas
+    leaks = []
+    for g in groups:
+        files = [k for u in g for k in members[u]]
+        rows = [(paths[k], *split_of(paths[k], root), f"{int(hashes[k]):016x}") for k in files]
+        if len({r[1] for r in rows}) > 1:
+            leaks.append(rows)
+    return leaks
+
+def write_report(path, leaks):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["cluster", "splits", "path", "split", "class", "hash"])
+        for c, rows in enumerate(leaks):
+            splits = "+".join(sorted({r[1] for r in rows}))
+            for r in rows:
+                w.writerow([c, splits, *r])
+
+def main():
+    ap = argparse.ArgumentParser(description="Quase-duplicatas entre splits por hash perceptual (multi-index hashing).")
+    ap.add_argument("root", help="Raiz do dataset (<split>/<classe>/...).")
+    ap.add_argument("--db", default=DEFAULT_DB, help=f"Índice de hashes (default={DEFAULT_DB}).")
+    ap.add_argument("--hash", choices=HASHES, default="phash", help="Tipo de hash (default=phash).")
+    ap.add_argument("--radius", type=int, default=6, help="Distância de Hamming máxima (default=6 de 64 bits).")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--report", default=None, help="CSV com os clusters que cruzam splits.")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"[ERRO] Raiz não existe: {args.root}", file=sys.stderr); sys.exit(1)
+    root = os.path.abspath(args.root)
+
+    t0 = time.perf_counter()
+    novas, total = update_index(args.db, root, args.hash, args.workers)
+    print(f"[INFO] Índice: {total} imagens ({novas} hasheadas agora) em {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    paths, hashes = load_hashes(args.db, root, args.hash)
+    leaks = find_leaks(paths, hashes, root, args.radius)
+    print(f"[INFO] Busca (raio {args.radius}) em {time.perf_counter() - t0:.1f}s")
+
+    por_combo = defaultdict(Counter)   # splits do cluster -> {clusters, imagens por split}
+    for rows in leaks:
+        combo = "+".join(sorted({r[1] for r in rows}))
+        por_combo[combo]["clusters"] += 1
+        por_combo[combo].update(r[1] for r in rows)
+    print(f"[OK] clusters entre splits: {len(leaks)} | imagens envolvidas: {sum(len(r) for r in leaks)}")
+    for combo, c in sorted(por_combo.items()):
+        detalhe = " ".join(f"{s}={c[s]}" for s in combo.split("+"))
+        print(f"  {combo}: {c['clusters']} clusters ({detalhe})")
+    if args.report:
+        write_report(args.report, leaks)
+        print(f"[INFO] Relatório em {args.report}")
+
+if __name__ == "__main__":
+    main()
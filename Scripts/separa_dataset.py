@@ -1,6 +1,8 @@
 import os
 import shutil
 import random
+from file_placement import Placer, format_counts
+from content_store import ContentStore
 
 # Pastas originais (classes)
 input_dirs = [
@@ -26,6 +28,19 @@ test_ratio = 0.15
 # Extensões válidas
 valid_ext = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
 
+# Como colocar as imagens nos splits: "copy", "hardlink", "symlink", "reflink"
+# ou "auto" (ver file_placement.py); links montam o dataset sem copiar bytes
+modo_colocacao = "copy"
+
+# Armazém endereçado por conteúdo (opcional): com um caminho aqui, cada imagem
+# é guardada uma vez no armazém e o split vira hardlinks para ela (ver
+# content_store.py; "python content_store.py du/gc <armazém>" para manutenção)
+armazem = None  # ex.: "image_store"
+store = ContentStore(armazem) if armazem else None
+if store:
+    store.register_variant(out_base, out_base)
+placer = Placer(modo_colocacao, workers=8, store=store)
+
 # --- Cria a estrutura de pastas de destino usando apenas o nome da classe ---
 for split in splits:
     for cls_path in input_dirs:
@@ -59,7 +74,7 @@ for cls_path in input_dirs:
         log.write("TEST:\n")
         log.write("\n".join(test_dirs) + "\n")
 
-    # Função auxiliar para copiar todos os arquivos de um subdir para a pasta de destino
+    # Função auxiliar para registrar no plano todos os arquivos de um subdir
     def copiar_subdirs_arquivos(subdir_list, split_name):
         dst_class_dir = os.path.join(out_base, split_name, class_name)
         for sd in subdir_list:
@@ -67,7 +82,7 @@ for cls_path in input_dirs:
             for root, _, files in os.walk(src_dir):
                 for f in files:
                     if f.lower().endswith(valid_ext):
-                        shutil.copy(os.path.join(root, f), os.path.join(dst_class_dir, f))
+                        placer.add(os.path.join(root, f), os.path.join(dst_class_dir, f))
 
     # Copiar arquivos
     copiar_subdirs_arquivos(train_dirs, "train")
@@ -76,4 +91,9 @@ for cls_path in input_dirs:
 
     print(f"✅ Classe '{class_name}': {n_train} dirs treino, {n_val} dirs validação, {n_test} dirs teste. Log: {log_file}")
 
+# Copia (ou liga) tudo de uma vez, em paralelo
+colocados, erros = placer.run()
+for src, dst, msg in erros:
+    print(f"⚠️ Falha em {src}: {msg}")
+print(f"\nColocação: {format_counts(colocados)}")
 print("\nEstrutura pronta em:", out_base)
\ No newline at end of file
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, sys, argparse, shutil, unicodedata
+import os, sys, argparse, csv, unicodedata
+import concurrent.futures as cf
 from collections import defaultdict
+from types import SimpleNamespace
 import numpy as np
 import re
 import pydicom
 from pydicom.errors import InvalidDicomError
+import dicom_index
+from file_placement import Placer, format_counts
 
 AXIAL_THR = 0.85  # quão “próximo do eixo Z” para considerar axial
 
@@ -16,16 +20,103 @@ def norm_txt(s: str) -> str:
     s = unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("ASCII")
     return " ".join(s.lower().split())
 
-def read_meta_fast(path):
+# Únicas tags usadas por series_key / is_true_3d / plane_axial / classify_series
+SCAN_TAGS = ["SOPClassUID", "SeriesInstanceUID", "ImageType", "SeriesDescription",
+             "ProtocolName", "NumberOfFrames", "ImageOrientationPatient", "ImagePositionPatient"]
+
+def looks_like_dicom(path) -> bool:
+    """
+    Checagem barata antes de chamar o pydicom: "DICM" após o preâmbulo de 128
+    bytes, ou (arquivos antigos sem preâmbulo) o primeiro elemento já no
+    grupo 0x0008 em little endian.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(132)
+    except OSError:
+        return False
+    if len(head) >= 132 and head[128:132] == b"DICM":
+        return True
+    return head[:2] in (b"\x08\x00", b"\x02\x00")
+
+def read_meta_fast(path, tags=SCAN_TAGS):
+    if not looks_like_dicom(path):
+        return None, "sem preâmbulo DICM"
     try:
-        ds = pydicom.dcmread(path, stop_before_pixels=True, force=True)
+        ds = pydicom.dcmread(path, stop_before_pixels=True, force=True, specific_tags=tags)
         _ = ds.get((0x0008, 0x0016))  # SOPClassUID (sanity check)
         return ds, None
     except Exception as e:
         return None, str(e)
 
-def series_key(ds):
-    return getattr(ds, "SeriesInstanceUID", None) or f"NO_SERIES__{id(ds)}"
+def _plain(v):
+    """Valor de elemento pydicom -> tipo Python simples (barato de serializar entre processos)."""
+    if isinstance(v, (list, tuple)) or type(v).__name__ == "MultiValue":
+        return [_plain(x) for x in v]
+    if isinstance(v, float):
+        return float(v)
+    if isinstance(v, int):
+        return int(v)
+    return str(v)
+
+def header_meta(ds):
+    """Só as tags de SCAN_TAGS, num objeto leve com a mesma interface de atributos do Dataset."""
+    return SimpleNamespace(**{t: _plain(ds[t].value) for t in SCAN_TAGS
+                              if t in ds and ds[t].value is not None})
+
+def scan_chunk(paths):
+    """Tarefa do pool: [(path, meta | None)] para um lote de arquivos."""
+    out = []
+    for path in paths:
+        ds, _ = read_meta_fast(path)
+        out.append((path, header_meta(ds) if ds is not None else None))
+    return out
+
+def iter_paths(root):
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            yield os.path.join(dirpath, fn)
+
+def iter_chunks(items, size):
+    chunk = []
+    for it in items:
+        chunk.append(it)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def scan_headers(root, workers, chunk_size=256):
+    """
+    Lê em paralelo (processos) os cabeçalhos de todos os arquivos sob root.
+    Gera (path, meta) à medida que os lotes terminam; arquivos não-DICOM não
+    aparecem.
+    """
+    if workers <= 1:
+        for chunk in iter_chunks(iter_paths(root), chunk_size):
+            yield from ((p, m) for p, m in scan_chunk(chunk) if m is not None)
+        return
+    with cf.ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = set()
+        for chunk in iter_chunks(iter_paths(root), chunk_size):
+            pending.add(ex.submit(scan_chunk, chunk))
+            if len(pending) >= 4 * workers:
+                done, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+                for fut in done:
+                    yield from ((p, m) for p, m in fut.result() if m is not None)
+        for fut in cf.as_completed(pending):
+            yield from ((p, m) for p, m in fut.result() if m is not None)
+
+def index_headers(db_path, root, workers, refresh=True):
+    """Mesma saída de scan_headers(), mas a partir do índice SQLite (dicom_index.py)."""
+    if refresh:
+        dicom_index.update_index(db_path, root, workers)
+    for row in dicom_index.iter_rows(db_path, root):
+        yield row["path"], dicom_index.row_dataset(row)
+
+def series_key(ds, path=None):
+    return getattr(ds, "SeriesInstanceUID", None) or f"NO_SERIES__{path or id(ds)}"
 
 def collect_text(ds):
     parts = [
@@ -84,17 +175,11 @@ def is_true_3d(ds) -> bool:
 
 def ensure_dir(p): os.makedirs(p, exist_ok=True)
 
-def place_file(src, dst, args):
-    if args.dry_run:
-        return
-    if args.move:
-        shutil.move(src, dst)
-    elif args.hardlink:
-        os.link(src, dst)
-    elif args.symlink:
-        os.symlink(src, dst)
-    else:
-        shutil.copy2(src, dst)
+def placement_mode(args) -> str:
+    for mode in ("move", "hardlink", "symlink", "reflink"):
+        if getattr(args, mode):
+            return mode
+    return "copy"
 
 def classify_series(rep_ds, num_files=None) -> str:
     # Se for 3D por sinais fortes, classifica 3D
@@ -114,6 +199,139 @@ def classify_series(rep_ds, num_files=None) -> str:
     # fallback conservador (sem pistas contrárias): transversal
     return "transversal"
 
+# ---------- classificação geométrica (todas as instâncias da série) ----------
+ROT_MIN_DEG = 5.0       # ângulo mínimo entre orientações para contar como distintas
+ROT_MIN_ORIENT = 3      # orientações distintas (coplanares) que caracterizam um giro VRT/RADIAL
+COPLANAR_EPS = 0.02     # menor autovalor de E[n nᵀ] abaixo disso: normais num mesmo plano
+
+def _floats(v, n):
+    try:
+        out = [float(x) for x in v]
+        return out if len(out) == n else [np.nan] * n
+    except (TypeError, ValueError):
+        return [np.nan] * n
+
+class GeometryTable:
+    """
+    Tabela de cabeçalhos por instância (série, IOP, IPP, quadros), acumulada
+    durante a varredura; classify() processa todas as séries de uma vez.
+    """
+    def __init__(self):
+        self.sids, self.iop, self.ipp, self.frames = [], [], [], []
+
+    def add(self, sid, ds):
+        self.sids.append(sid)
+        self.iop.append(_floats(getattr(ds, "ImageOrientationPatient", None) or (), 6))
+        self.ipp.append(_floats(getattr(ds, "ImagePositionPatient", None) or (), 3))
+        try:
+            self.frames.append(int(getattr(ds, "NumberOfFrames", 1) or 1))
+        except (TypeError, ValueError):
+            self.frames.append(1)
+
+    def classify(self):
+        """
+        Métricas por série, vetorizadas sobre todas as instâncias:
+          axial_frac     fração de instâncias com normal ~ Z
+          agreement      maior autovalor de E[n nᵀ] (1 = todas as normais iguais, a menos do sinal)
+          max_angle      maior ângulo (graus) entre uma normal e o eixo principal da série
+          n_orient       orientações distintas (grade de ROT_MIN_DEG)
+          coplanar       normais distintas num mesmo plano (giro em torno de um eixo)
+          spacing, spacing_cv, dup_pos   espaçamento médio ao longo do eixo, seu CV e posições repetidas
+          rotating       assinatura de giro VRT/RADIAL: >= ROT_MIN_ORIENT orientações coplanares
+        Retorna {sid: dict(métricas)}.
+        """
+        if not self.sids:
+            return {}
+        uniq, inv = np.unique(np.array(self.sids, dtype=object).astype(str), return_inverse=True)
+        S = len(uniq)
+        iop = np.asarray(self.iop, dtype=float)
+        ipp = np.asarray(self.ipp, dtype=float)
+        frames = np.asarray(self.frames, dtype=np.int64)
+
+        n = np.cross(iop[:, :3], iop[:, 3:])
+        nn = np.linalg.norm(n, axis=1)
+        valid = np.isfinite(nn) & (nn > 1e-6)
+        n = np.where(valid[:, None], n / np.where(valid, nn, 1.0)[:, None], 0.0)
+        cnt = np.bincount(inv, weights=valid, minlength=S)
+        safe = np.maximum(cnt, 1)
+
+        axial_frac = np.bincount(inv, weights=valid & (np.abs(n[:, 2]) >= AXIAL_THR), minlength=S) / safe
+
+        # E[n nᵀ] por série: invariante ao sinal da normal
+        outer = (n[:, :, None] * n[:, None, :]).reshape(-1, 9)
+        M = np.stack([np.bincount(inv, weights=outer[:, k], minlength=S) for k in range(9)], axis=1)
+        M = (M / safe[:, None]).reshape(S, 3, 3)
+        evals, evecs = np.linalg.eigh(M)
+        axis = evecs[:, :, 2]                              # eixo principal (maior autovalor)
+        agreement = evals[:, 2]
+        # Normais espalhadas (2º autovalor relevante) mas contidas num plano
+        coplanar = (evals[:, 0] < COPLANAR_EPS) & (evals[:, 1] > COPLANAR_EPS) & (cnt >= 3)
+
+        cosang = np.clip(np.abs(np.einsum("ij,ij->i", n, axis[inv])), 0.0, 1.0)
+        ang = np.where(valid, np.degrees(np.arccos(cosang)), 0.0)
+        max_angle = np.zeros(S)
+        np.maximum.at(max_angle, inv, ang)
+
+        # Orientações distintas: normal com sinal canônico, quantizada numa grade ~ROT_MIN_DEG
+        sign = np.where(n[np.arange(len(n)), np.argmax(np.abs(n), axis=1)] < 0, -1.0, 1.0)
+        q = np.round(n * sign[:, None] / np.radians(ROT_MIN_DEG)).astype(np.int64)
+        keys = np.unique(np.column_stack([inv, q])[valid], axis=0)
+        n_orient = np.bincount(keys[:, 0], minlength=S) if len(keys) else np.zeros(S, dtype=np.int64)
+
+        # Espaçamento ao longo do eixo principal (projeção de IPP), ordenado por série
+        proj = np.einsum("ij,ij->i", ipp, axis[inv])
+        okp = np.isfinite(proj) & valid
+        order = np.lexsort((proj, inv))[okp[np.lexsort((proj, inv))]]
+        d = np.diff(proj[order])
+        same = inv[order][1:] == inv[order][:-1]
+        d, ds_ = np.abs(d[same]), inv[order][1:][same]
+        nd = np.bincount(ds_, minlength=S)
+        spacing = np.bincount(ds_, weights=d, minlength=S) / np.maximum(nd, 1)
+        var = np.bincount(ds_, weights=d * d, minlength=S) / np.maximum(nd, 1) - spacing ** 2
+        spacing_cv = np.sqrt(np.maximum(var, 0.0)) / np.where(spacing > 1e-6, spacing, np.nan)
+        dup_pos = np.bincount(ds_, weights=d < 1e-3, minlength=S)
+
+        max_frames = np.zeros(S, dtype=np.int64)
+        np.maximum.at(max_frames, inv, frames)
+        n_inst = np.bincount(inv, minlength=S)
+
+        rotating = coplanar & (n_orient >= ROT_MIN_ORIENT)
+        out = {}
+        for k, sid in enumerate(uniq):
+            out[sid] = {
+                "instances": int(n_inst[k]), "max_frames": int(max_frames[k]),
+                "axial_frac": round(float(axial_frac[k]), 3), "agreement": round(float(agreement[k]), 3),
+                "max_angle": round(float(max_angle[k]), 1), "n_orient": int(n_orient[k]),
+                "coplanar": bool(coplanar[k]),
+                "spacing": round(float(spacing[k]), 3) if nd[k] else None,
+                "spacing_cv": round(float(spacing_cv[k]), 3) if nd[k] and np.isfinite(spacing_cv[k]) else None,
+                "dup_pos": int(dup_pos[k]), "rotating": bool(rotating[k]),
+            }
+        return out
+
+def classify_geometry(rep_ds, geo) -> tuple[str, str]:
+    """Categoria e motivo a partir das métricas de GeometryTable.classify() e do representante."""
+    if geo["max_frames"] > 1:
+        return "3d", "multiframe"
+    if is_true_3d(rep_ds):
+        return "3d", "tokens"
+    if geo["rotating"]:
+        return "3d", "rotacao"
+    if geo["axial_frac"] >= 0.5:
+        return "transversal", "axial"
+    return "transversal", "fallback"
+
+REPORT_FIELDS = ["series", "category", "reason", "instances", "max_frames", "axial_frac", "agreement",
+                 "max_angle", "n_orient", "coplanar", "spacing", "spacing_cv", "dup_pos", "rotating",
+                 "description", "first_file"]
+
+def write_report(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        w.writeheader()
+        for r in rows:
+            w.writerow(r)
+
 def main():
     ap = argparse.ArgumentParser(description="Separa DICOMs em 2 classes: transversal e 3D, preservando a árvore original.")
     ap.add_argument("-i","--input", required=True, help="Pasta raiz com DICOMs (scan recursivo).")
@@ -122,8 +340,17 @@ def main():
     g.add_argument("--move", action="store_true", help="Mover arquivos (mesmo FS).")
     g.add_argument("--hardlink", action="store_true", help="Hardlinks (mesma partição).")
     g.add_argument("--symlink", action="store_true", help="Symlinks (atalhos).")
+    g.add_argument("--reflink", action="store_true", help="Clones copy-on-write (btrfs/XFS); cai para cópia se não suportado.")
     ap.add_argument("--dry-run", action="store_true", help="Não escreve; apenas imprime o que faria.")
+    ap.add_argument("--plan", metavar="ARQ", help="Salva o plano de colocação (JSONL) para reexecutar com file_placement.py replay.")
+    ap.add_argument("--io-workers", type=int, default=8, help="Threads de E/S na colocação dos arquivos (default=8).")
     ap.add_argument("--progress-step", type=int, default=1000, help="Quantos arquivos por ponto de progresso (default=1000).")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processos para a leitura de cabeçalhos (default=núcleos; 1 = serial).")
+    ap.add_argument("--index", metavar="DB", help="Usa (e atualiza) o índice SQLite de cabeçalhos em vez de reler todos os arquivos.")
+    ap.add_argument("--index-no-refresh", action="store_true", help="Com --index: consulta o índice sem varrer a árvore.")
+    ap.add_argument("--classify", choices=["geometry", "rep"], default="geometry",
+                    help="geometry: usa IOP/IPP/quadros de todas as instâncias; rep: só o primeiro cabeçalho (comportamento antigo).")
+    ap.add_argument("--report", metavar="CSV", help="Relatório por série (métricas geométricas, categoria e motivo).")
     args = ap.parse_args()
 
     in_root = os.path.abspath(args.input)
@@ -132,48 +359,62 @@ def main():
     ensure_dir(os.path.join(out_root, "transversal"))
     ensure_dir(os.path.join(out_root, "3d"))
 
-    # Agrupar por série
-    series = defaultdict(lambda: {"files": [], "rep": None})
-    for root, _, files in os.walk(in_root):
-        for fn in files:
-            path = os.path.join(root, fn)
-            ds, err = read_meta_fast(path)
-            if ds is None:
-                continue
-            sid = series_key(ds)
-            s = series[sid]
-            s["files"].append(path)
-            if s["rep"] is None:
-                s["rep"] = ds
+    # Agrupar por série (leitura paralela, só as tags de SCAN_TAGS)
+    # Os lotes chegam fora de ordem: o representante é o menor caminho da série
+    series = defaultdict(lambda: {"files": [], "rep": None, "rep_path": None})
+    table = GeometryTable()
+    headers = (index_headers(args.index, in_root, args.workers, not args.index_no_refresh)
+               if args.index else scan_headers(in_root, args.workers))
+    for path, ds in headers:
+        sid = series_key(ds, path)
+        s = series[sid]
+        s["files"].append(path)
+        table.add(sid, ds)
+        if s["rep"] is None or path < s["rep_path"]:
+            s["rep"], s["rep_path"] = ds, path
 
     counts = {"transversal": 0, "3d": 0}
-    processed = 0
+    placer = Placer(placement_mode(args), workers=args.io_workers, dry_run=args.dry_run)
+    category = {}
 
     print("[PROCESSO] executando...", end="", flush=True)
 
+    geometry = table.classify() if args.classify == "geometry" else {}
+    reasons = defaultdict(int)
+    report = []
+
     for sid, entry in series.items():
         rep = entry["rep"]
-        cat = "transversal" if rep is None else classify_series(rep)
+        if args.classify == "geometry":
+            cat, reason = classify_geometry(rep, geometry[str(sid)])
+        else:
+            cat, reason = ("transversal" if rep is None else classify_series(rep)), "rep"
+        reasons[f"{cat}:{reason}"] += 1
+        report.append(dict(geometry.get(str(sid), {}), series=sid, category=cat, reason=reason,
+                           instances=len(entry["files"]), description=getattr(rep, "SeriesDescription", ""),
+                           first_file=entry["rep_path"]))
 
         for src in entry["files"]:
             rel_dir = os.path.relpath(os.path.dirname(src), start=in_root)
-            dest_dir = os.path.join(out_root, cat, rel_dir)
-            try:
-                ensure_dir(dest_dir)
-            except OSError as e:
-                # continua silenciosamente, mas registra erro mínimo
-                print(f"\n[ERRO] criar {dest_dir}: {e}", file=sys.stderr)
-                continue
-
-            dst = os.path.join(dest_dir, os.path.basename(src))
-            try:
-                place_file(src, dst, args)
-                counts[cat] += 1
-                processed += 1
-                if processed % max(1, args.progress_step) == 0:
-                    print(".", end="", flush=True)
-            except OSError as e:
-                print(f"\n[WARN] Falha ao processar {src}: {e}", file=sys.stderr)
+            dst = os.path.join(out_root, cat, rel_dir, os.path.basename(src))
+            placer.add(src, dst)
+            category[dst] = cat
+            counts[cat] += 1
+
+    print("\n[INFO] séries por categoria/motivo: " + " | ".join(f"{k}={v}" for k, v in sorted(reasons.items())))
+    if args.report:
+        write_report(args.report, sorted(report, key=lambda r: (r["category"], r["first_file"] or "")))
+        print(f"[INFO] relatório por série: {args.report}")
+    if args.plan:
+        placer.save_plan(args.plan)
+    if args.dry_run:
+        print()
+        placer.print_plan()
+    placed, errors = placer.run(progress_step=args.progress_step)
+    for src, dst, msg in errors:
+        print(f"\n[WARN] Falha ao processar {src}: {msg}", file=sys.stderr)
+        counts[category[dst]] -= 1
+    print(f"\n[INFO] colocação: {format_counts(placed)}")
 
     total = counts["transversal"] + counts["3d"]
     print(f"\n[OK] finalizado. imagens: total={total} | transversal={counts['transversal']} | 3d={counts['3d']}")
@@ -33,23 +33,32 @@ and creating a 'holdout' set of patients fully excluded from train/val/test.
 
 Usage:
   python prep_yolo_by_patient.py --root /path/in --out /path/out \
-      --val 0.15 --test 0.15 --holdout 0.05 --seed 42 [--copy]
+      --val 0.15 --test 0.15 --holdout 0.05 --seed 42 [--mode hardlink | --copy]
 
 Notes:
-- By default creates symlinks to save disk space. Use --copy to physically copy files.
+- By default the split is a link farm (--mode auto: reflink, then hardlink, then copy;
+  see file_placement.py), so a new split costs almost no extra disk. Use --copy
+  (or --mode copy) for independent files; --dry-run/--plan print or save the plan.
+- Placement runs on a thread pool (--io-workers); the output directories are created
+  once per split/class before it starts. Planning and placement times are reported.
 - File names are prefixed with the patient id to avoid collisions.
 - A manifest.csv is saved in the output with per-patient counts and split assignment.
+- --incremental reads the existing manifest.csv and applies only the difference:
+  patients whose split changed are moved (rename, same inode), new patients are
+  placed, removed patients are deleted, everyone else is left untouched.
+  --stable keeps existing patients in their previous split (only new ones are drawn).
 """
 
 import argparse
 import os
 import sys
-import shutil
 import random
 from pathlib import Path
 from collections import defaultdict
 import csv
 import hashlib
+import time
+from file_placement import MODES, Placer, format_counts
 
 IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
 
@@ -138,12 +147,41 @@ def stratified_split_by_patient(patients, class_names, val_ratio, test_ratio, ho
 
     return patient_split
 
-def copy_file(src: Path, dst: Path):
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(src, dst)
+SPLITS = ("train", "val", "test", "holdout")
+
+def read_manifest(path: Path):
+    """manifest.csv de uma execução anterior -> dict[(cls, patient)] = split (vazio se não existir)."""
+    if not path.is_file():
+        return {}
+    with path.open(newline="", encoding="utf-8") as f:
+        return {(r["class"], r["patient"]): r["split"] for r in csv.DictReader(f) if r.get("split") in SPLITS}
+
+def scan_output(out_root: Path):
+    """
+    Imagens já presentes na saída, agrupadas pelo paciente do nome
+    (<pid>__<hash>__<idx>.<ext>): dict[(cls, patient)] -> dict[nome] = {splits}.
+    Um mesmo nome pode estar em mais de um split (cópias antigas); todas contam.
+    """
+    found = defaultdict(lambda: defaultdict(set))
+    for split in SPLITS:
+        split_dir = out_root / split
+        if not split_dir.is_dir():
+            continue
+        for cls_entry in os.scandir(split_dir):
+            if not cls_entry.is_dir():
+                continue
+            for e in os.scandir(cls_entry.path):
+                parts = e.name.rsplit("__", 2)
+                if len(parts) == 3:
+                    found[(cls_entry.name, parts[0])][e.name].add(split)
+    return found
+
+def copy_file(src: Path, dst: Path, placer: Placer):
+    """Registra a cópia no plano; diretórios e E/S ficam com placer.run()."""
+    placer.add(src, dst)
 
 def build_output_structure(out_root: Path, class_names):
-    for split in ("train", "val", "test", "holdout"):
+    for split in SPLITS:
         for cls in class_names:
             (out_root / split / cls).mkdir(parents=True, exist_ok=True)
 
@@ -156,7 +194,7 @@ def make_unique_name(src: Path, pid: str, idx: int) -> str:
     return f"{pid}__{h}__{idx:04d}{src.suffix.lower()}"
 
 def main():
-    ap = argparse.ArgumentParser(description="Prepare YOLO classification dataset by patient (with holdout), copying files (no symlinks).")
+    ap = argparse.ArgumentParser(description="Prepare YOLO classification dataset by patient (with holdout), linking or copying files.")
     ap.add_argument("--root", type=Path, required=True, help="Diretório raiz do dataset original.")
     ap.add_argument("--out",  type=Path, required=True, help="Diretório de saída para o dataset YOLO.")
     ap.add_argument("--val", type=float, default=0.15, help="Proporção de pacientes para validação (por classe).")
@@ -164,6 +202,16 @@ def main():
     ap.add_argument("--holdout", type=float, default=0.05, help="Proporção de pacientes para holdout (por classe).")
     ap.add_argument("--seed", type=int, default=42, help="Seed para aleatoriedade.")
     ap.add_argument("--flatten", action="store_true", help="Achatar: salvar imagens diretamente na pasta da classe (mantendo unicidade por hash).")
+    ap.add_argument("--mode", choices=MODES, default="auto",
+                    help="Como colocar as imagens no split (default=auto: reflink -> hardlink -> cópia).")
+    ap.add_argument("--copy", action="store_true", help="Atalho para --mode copy (arquivos independentes).")
+    ap.add_argument("--io-workers", type=int, default=8, help="Threads de E/S na colocação (default=8).")
+    ap.add_argument("--dry-run", action="store_true", help="Não escreve imagens; imprime o plano.")
+    ap.add_argument("--plan", type=Path, help="Salva o plano de colocação (JSONL) para reexecutar com file_placement.py replay.")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Aplica só a diferença contra o manifest.csv existente na saída.")
+    ap.add_argument("--stable", action="store_true",
+                    help="Com --incremental: pacientes já existentes mantêm o split anterior.")
     args = ap.parse_args()
 
     if args.val < 0 or args.test < 0 or args.holdout < 0:
@@ -171,26 +219,65 @@ def main():
     if args.val + args.test + args.holdout >= 1.0:
         raise SystemExit("A soma val+test+holdout deve ser < 1.0 para sobrar pacientes em 'train'.")
 
+    if args.copy:
+        args.mode = "copy"
+    if args.stable:
+        args.incremental = True
+
+    t0 = time.perf_counter()
     patients, class_names = collect_patients(args.root)
+    t_scan = time.perf_counter() - t0
+    t0 = time.perf_counter()
     patient_split = stratified_split_by_patient(
         patients, class_names, args.val, args.test, args.holdout, args.seed
     )
 
-    build_output_structure(args.out, class_names)
+    previous, existing = {}, {}
+    if args.incremental:
+        previous = read_manifest(args.out / "manifest.csv")
+        if not previous:
+            print("[AVISO] --incremental sem manifest.csv anterior: gerando o split completo.", file=sys.stderr)
+        else:
+            existing = scan_output(args.out)
+        if args.stable:
+            patient_split = {k: previous.get(k, v) for k, v in patient_split.items()}
+
+    if not args.dry_run:
+        build_output_structure(args.out, class_names)
+    placer = Placer(args.mode, workers=args.io_workers, dry_run=args.dry_run)
+    # Pacientes que mudaram de split: rename dentro da saída (mesmo inode/links)
+    mover = Placer("move", workers=args.io_workers, dry_run=args.dry_run)
+    stale = []          # arquivos da saída que não pertencem mais ao split atual
+    changes = defaultdict(int)
 
     manifest_rows = []
-    per_split_counts = {s: defaultdict(int) for s in ("train","val","test","holdout")}
+    per_split_counts = {s: defaultdict(int) for s in SPLITS}
     total_images = 0
 
     for (cls, pid), imgs in patients.items():
         split = patient_split[(cls, pid)]
         base = args.out / split / cls
+        have = dict(existing.get((cls, pid), {}))
 
         for idx, img in enumerate(imgs):
             # nome único e estável por caminho + índice
             dst_name = make_unique_name(img, pid, idx)
             dst = base / dst_name
-            copy_file(img, dst)
+            old_splits = have.pop(dst_name, set())
+            if split in old_splits:
+                old_splits = old_splits - {split}       # já está no lugar; o resto é sobra
+            elif old_splits:
+                src_split = min(old_splits)
+                mover.add(args.out / src_split / cls / dst_name, dst)
+                old_splits = old_splits - {src_split}
+            else:
+                copy_file(img, dst, placer)
+            stale.extend(args.out / s / cls / dst_name for s in old_splits)
+        stale.extend(args.out / s / cls / name for name, splits in have.items() for s in splits)
+
+        if args.incremental and previous:
+            old = previous.get((cls, pid))
+            changes["novo" if old is None else "igual" if old == split else "movido"] += 1
 
         n_imgs = len(imgs)
         total_images += n_imgs
@@ -202,6 +289,45 @@ def main():
             "num_images": n_imgs
         })
 
+    # Pacientes que saíram da entrada
+    for key, names in existing.items():
+        if key not in patients:
+            stale.extend(args.out / s / key[0] / name for name, splits in names.items() for s in splits)
+            changes["removido"] += 1 if key in previous else 0
+
+    t_plan = time.perf_counter() - t0
+    if args.plan:
+        placer.save_plan(args.plan)
+    if args.dry_run:
+        mover.print_plan()
+        placer.print_plan()
+        for p in stale:
+            print(f"remove\t{p}")
+    t0 = time.perf_counter()
+    moved, errors = mover.run()
+    placed, place_errors = placer.run()
+    placed.update(moved)
+    errors.extend(place_errors)
+    if stale and not args.dry_run:
+        for p in stale:
+            try:
+                os.unlink(p)
+                placed["removed"] += 1
+            except OSError as e:
+                errors.append((p, "-", str(e)))
+    elif stale:
+        placed["remove (dry-run)"] += len(stale)
+    t_place = time.perf_counter() - t0
+    if changes:
+        print("Incremental: " + " | ".join(f"{k}={v}" for k, v in sorted(changes.items())) + " pacientes")
+    for src, dst, msg in errors:
+        print(f"[ERRO] {src} -> {dst}: {msg}", file=sys.stderr)
+    print(f"Colocação: {format_counts(placed)}")
+    print(f"Tempo: varredura {t_scan:.2f}s | planejamento {t_plan:.2f}s | colocação {t_place:.2f}s "
+          f"({args.io_workers} threads, modo {args.mode})")
+    if args.dry_run:
+        return
+
     manifest_path = args.out / "manifest.csv"
     with manifest_path.open("w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=["class","patient","split","num_images"])
@@ -211,8 +337,8 @@ def main():
 
     print("\n=== RESUMO ===")
     print(f"Saída: {args.out}")
-    print(f"Total de imagens copiadas: {total_images}")
-    for split in ("train","val","test","holdout"):
+    print(f"Total de imagens colocadas: {total_images}")
+    for split in SPLITS:
         tot_split = sum(per_split_counts[split].values())
         print(f" {split.upper():7s}: {tot_split:6d} imagens  ", end="")
         for cls in class_names:
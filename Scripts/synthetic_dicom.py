@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+synthetic_dicom.py — Gera árvores DICOM sintéticas (sem dados de pacientes)
+
+Produz a mesma organização dos nossos arquivos reais, para medir as
+ferramentas de conversão/separação em qualquer máquina:
+
+  <raiz>/
+    Feminino/1F/<série>/IM0000 ...
+    Masculino/2M/<série>/IM0000 ...
+
+Cada paciente recebe:
+  - série CT axial (int16, RescaleIntercept=-1024, janela informada)
+  - série CR/DX MONOCHROME1 (uint16)
+  - objeto multi-frame VRT (quadros com rotação simulada)
+  - localizer (ImageType LOCALIZER)
+  - documento SR (SOP class não-imagem, sem PixelData)
+
+Uso:
+  python synthetic_dicom.py <pasta_saida> [--patients 4] [--slices 60] [--size 512]
+                            [--vrt-frames 72] [--seed 0]
+"""
+
+import argparse
+from pathlib import Path
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+CT_IMAGE = "1.2.840.10008.5.1.4.1.1.2"
+ENHANCED_CT = "1.2.840.10008.5.1.4.1.1.2.1"
+CR_IMAGE = "1.2.840.10008.5.1.4.1.1.1"
+BASIC_TEXT_SR = "1.2.840.10008.5.1.4.1.1.88.11"
+
+def _base_dataset(sop_class, study_uid, series_uid, sex, series_number, desc, modality):
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = sop_class
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = sop_class
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.PatientID = "SYNTH"
+    ds.PatientName = "SINTETICO^PACIENTE"
+    ds.PatientSex = sex
+    ds.StudyDate = "20250101"
+    ds.StudyDescription = "ESTUDO SINTETICO"
+    ds.SeriesNumber = series_number
+    ds.SeriesDescription = desc
+    ds.ProtocolName = desc
+    ds.Modality = modality
+    ds.BodyPartExamined = "HEAD"
+    return ds
+
+def _set_pixels(ds, arr, signed, photometric="MONOCHROME2", bits=12):
+    ds.Rows, ds.Columns = arr.shape[-2:]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = 16
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 1 if signed else 0
+    ds.PixelData = arr.astype(np.int16 if signed else np.uint16).tobytes()
+
+def _phantom(size, z, rng):
+    """Corte "anatômico": elipse de tecido com osso na borda + ruído (valores brutos 12 bits)."""
+    yy, xx = np.mgrid[-1:1:size*1j, -1:1:size*1j]
+    r = np.sqrt((xx/0.8)**2 + (yy/(0.9 - 0.2*abs(z)))**2)
+    img = np.where(r < 1.0, 1064.0, 24.0)            # tecido ~40 HU, ar ~-1000 HU
+    img = np.where((r > 0.92) & (r < 1.0), 1900.0, img)  # "osso"
+    img += rng.normal(0, 12, size=img.shape)
+    return np.clip(img, 0, 4095)
+
+def _save(ds, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ds.save_as(path, enforce_file_format=True)
+
+def write_ct_series(dst, study_uid, sex, n, size, rng):
+    series_uid = generate_uid()
+    for i in range(n):
+        ds = _base_dataset(CT_IMAGE, study_uid, series_uid, sex, 2, "AXIAL 1.0 H30s", "CT")
+        ds.ImageType = ["ORIGINAL", "PRIMARY", "AXIAL"]
+        ds.InstanceNumber = i + 1
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [0.0, 0.0, float(i)]
+        ds.SliceThickness = 1.0
+        ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+        ds.WindowCenter, ds.WindowWidth = 40, 400
+        _set_pixels(ds, _phantom(size, 2.0*i/max(1, n-1) - 1.0, rng), signed=True)
+        _save(ds, dst / f"IM{i:04d}")
+
+def write_mono1(dst, study_uid, sex, size, rng):
+    ds = _base_dataset(CR_IMAGE, study_uid, generate_uid(), sex, 3, "CRANIO PA", "CR")
+    ds.ImageType = ["ORIGINAL", "PRIMARY"]
+    ds.InstanceNumber = 1
+    _set_pixels(ds, 4095 - _phantom(size, 0.0, rng), signed=False, photometric="MONOCHROME1")
+    _save(ds, dst / "IM0000")
+
+def write_vrt(dst, study_uid, sex, frames, size, rng):
+    ds = _base_dataset(ENHANCED_CT, study_uid, generate_uid(), sex, 4, "VRT RADIAL", "CT")
+    ds.ImageType = ["DERIVED", "SECONDARY", "VRT"]
+    ds.InstanceNumber = 1
+    ds.NumberOfFrames = frames
+    ds.RescaleSlope, ds.RescaleIntercept = 1, 0
+    stack = np.stack([np.roll(_phantom(size, 0.0, rng), k * size // max(1, frames), axis=1)
+                      for k in range(frames)])
+    _set_pixels(ds, stack, signed=False)
+    _save(ds, dst / "IM0000")
+
+def write_localizer(dst, study_uid, sex, size, rng):
+    ds = _base_dataset(CT_IMAGE, study_uid, generate_uid(), sex, 1, "TOPOGRAMA", "CT")
+    ds.ImageType = ["ORIGINAL", "PRIMARY", "LOCALIZER"]
+    ds.InstanceNumber = 1
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 0, -1]
+    ds.ImagePositionPatient = [0.0, 0.0, 0.0]
+    ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+    _set_pixels(ds, _phantom(size, 0.0, rng), signed=True)
+    _save(ds, dst / "IM0000")
+
+def write_sr(dst, study_uid, sex):
+    ds = _base_dataset(BASIC_TEXT_SR, study_uid, generate_uid(), sex, 99, "DOSE REPORT", "SR")
+    ds.InstanceNumber = 1
+    _save(ds, dst / "SR0000")
+
+def generate_tree(root, patients=4, slices=60, size=512, vrt_frames=72, seed=0):
+    """Gera a árvore completa; retorna (n_arquivos, bytes)."""
+    rng = np.random.default_rng(seed)
+    root = Path(root)
+    for k in range(patients):
+        sex = "F" if k % 2 == 0 else "M"
+        pdir = root / ("Feminino" if sex == "F" else "Masculino") / f"{k+1}{sex}"
+        study_uid = generate_uid()
+        write_localizer(pdir / "00010000", study_uid, sex, size, rng)
+        write_ct_series(pdir / "00020000", study_uid, sex, slices, size, rng)
+        write_mono1(pdir / "00030000", study_uid, sex, size, rng)
+        write_vrt(pdir / "00040000", study_uid, sex, vrt_frames, size, rng)
+        write_sr(pdir / "00990000", study_uid, sex)
+    files = [p for p in root.rglob("*") if p.is_file()]
+    return len(files), sum(p.stat().st_size for p in files)
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera uma árvore DICOM sintética (Feminino/Masculino).")
+    ap.add_argument("output", type=Path)
+    ap.add_argument("--patients", type=int, default=4)
+    ap.add_argument("--slices", type=int, default=60, help="Fatias da série CT axial.")
+    ap.add_argument("--size", type=int, default=512)
+    ap.add_argument("--vrt-frames", type=int, default=72, help="Quadros do objeto VRT multi-frame.")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    n, nbytes = generate_tree(args.output, args.patients, args.slices, args.size, args.vrt_frames, args.seed)
+    print(f"[OK] {n} arquivos ({nbytes/1e6:.1f} MB) gerados em {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Os scripts importam os módulos vizinhos pelo nome (ex.: from file_placement import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+import numpy as np
+import cv2
+import pydicom
+from PIL import Image
+from pydicom.uid import generate_uid
+from synthetic_dicom import write_ct_series, write_mono1, write_vrt
+from volume_store import iter_volumes, open_volume
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "3d"))
+import dicom2png as d
+
+def _args(src, dst, **opts):
+    saved = dict(d.CODED_OPTIONS)
+    d.CODED_OPTIONS.update(opts)
+    d.CODED_INPUT_PATH, d.CODED_OUTPUT_PATH = str(src), str(dst)
+    try:
+        return d.parse_args()
+    finally:
+        d.CODED_OPTIONS.clear()
+        d.CODED_OPTIONS.update(saved)
+
+def _main(monkeypatch, src, dst, **opts):
+    monkeypatch.setattr(d, "CODED_OPTIONS", dict(d.CODED_OPTIONS, **opts))
+    monkeypatch.setattr(d, "CODED_INPUT_PATH", str(src))
+    monkeypatch.setattr(d, "CODED_OUTPUT_PATH", str(dst))
+    d.main()
+
+def _pipeline_original(p, args):
+    """Ordem original: RGB antes do CLAHE (via LAB), resize e filtro na imagem RGB."""
+    ds = pydicom.dcmread(str(p), force=True)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    out = []
+    for fr in d.choose_frames(d.load_pixels(ds), args.frames):
+        u8 = d.ensure_rgb(d.to_uint8(fr), args.rgb)
+        if args.clahe:
+            if u8.ndim == 2:
+                u8 = clahe.apply(u8)
+            else:
+                l, a, b = cv2.split(cv2.cvtColor(u8, cv2.COLOR_RGB2LAB))
+                u8 = cv2.cvtColor(cv2.merge([clahe.apply(l), a, b]), cv2.COLOR_LAB2RGB)
+        u8 = d.resize_if_needed(u8, args.max_size)
+        if (d.nonblack(u8) >= args.min_nonblack_pct and d.entropy(u8) >= args.min_entropy
+                and d.contrast(u8) >= args.min_p2p and float(np.var(u8.astype(np.float32))) >= args.min_var):
+            out.append(u8)
+    return out
+
+def _serie(tmp_path):
+    rng = np.random.default_rng(0)
+    study = generate_uid()
+    src = tmp_path / "in" / "1F"
+    write_ct_series(src / "ct", study, "F", 4, 64, rng)
+    write_mono1(src / "cr", study, "F", 64, rng)
+    write_vrt(src / "vrt", study, "F", 3, 64, rng)
+    return sorted(p for p in src.rglob("*") if p.is_file())
+
+def _compara(tmp_path, **opts):
+    args = _args(tmp_path / "in", tmp_path / "out", **opts)
+    n = 0
+    for p in _serie(tmp_path):
+        rec = d.worker(p, Path("."), args, None, False)
+        esperado = _pipeline_original(p, args)
+        assert len(rec["outputs"]) == len(esperado), p
+        for png, ref in zip(rec["outputs"], esperado):
+            assert np.array_equal(np.asarray(Image.open(png)), ref), png
+            n += 1
+    assert n > 0
+
+def test_saida_padrao_igual_ao_pipeline_original(tmp_path):
+    _compara(tmp_path)
+
+def test_saida_igual_com_filtro_e_sem_rgb(tmp_path):
+    _compara(tmp_path, min_entropy=4.0, max_size=32)
+    _compara(tmp_path / "cinza", rgb=False)
+
+def test_volume_por_serie_com_split_por_estudo(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    study = generate_uid()
+    paciente = tmp_path / "in" / "Feminino" / "1F"
+    write_ct_series(paciente / "ct_a", study, "F", 3, 32, rng)
+    write_ct_series(paciente / "ct_b", study, "F", 4, 32, rng)
+
+    _main(monkeypatch, tmp_path / "in", tmp_path / "out", output_format="volume",
+          split_by="study", workers=1, min_entropy=0.0)
+
+    vols = list(iter_volumes(tmp_path / "out"))
+    assert len(vols) == 2
+    assert len({v.parent for v in vols}) == 1          # mesma pasta do estudo
+    series = {}
+    for base in vols:
+        vol, index = open_volume(base)
+        series[index["meta"]["SeriesInstanceUID"]] = vol.shape[0]
+    assert sorted(series.values()) == [3, 4]
@@ -0,0 +1,32 @@
+from pydicom.uid import generate_uid
+import numpy as np
+import dicom_index
+from synthetic_dicom import write_ct_series, write_sr
+
+def test_group_series_ignora_sop_sem_imagem(tmp_path):
+    rng = np.random.default_rng(0)
+    study = generate_uid()
+    serie = tmp_path / "serie"
+    write_ct_series(serie, study, "F", 4, 16, rng)
+    write_sr(serie, study, "F")              # documento SR na mesma pasta
+
+    series = dicom_index.group_series(dicom_index.read_dir_rows(serie))
+    assert len(series) == 1
+    (paths,) = series.values()
+    assert [p.rsplit("/", 1)[1] for p in paths] == ["IM0000", "IM0001", "IM0002", "IM0003"]
+
+def test_pasta_so_com_sr_nao_tem_series(tmp_path):
+    write_sr(tmp_path / "sr", generate_uid(), "M")
+    assert dicom_index.group_series(dicom_index.read_dir_rows(tmp_path / "sr")) == {}
+
+def test_series_by_dir_pelo_indice(tmp_path):
+    rng = np.random.default_rng(0)
+    study = generate_uid()
+    write_ct_series(tmp_path / "acervo" / "ct", study, "F", 3, 16, rng)
+    write_sr(tmp_path / "acervo" / "ct", study, "F")
+    write_sr(tmp_path / "acervo" / "sr", study, "F")
+    db = tmp_path / "idx.sqlite"
+    dicom_index.update_index(db, tmp_path / "acervo", workers=1)
+    by_dir = dicom_index.series_by_dir(db, tmp_path / "acervo")
+    assert len(by_dir[str(tmp_path / "acervo" / "ct")]) == 1
+    assert by_dir.get(str(tmp_path / "acervo" / "sr"), {}) == {}
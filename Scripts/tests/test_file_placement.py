@@ -0,0 +1,36 @@
+import pytest
+from file_placement import Placer
+
+@pytest.mark.parametrize("mode", ["copy", "hardlink", "symlink"])
+def test_destino_repetido_ultima_entrada_vence(tmp_path, mode):
+    srcs = []
+    for k in range(40):
+        p = tmp_path / "in" / f"d{k}" / "img.png"   # mesmo basename, como nas consolidações achatadas
+        p.parent.mkdir(parents=True)
+        p.write_text(f"conteudo {k}")
+        srcs.append(p)
+    dst = tmp_path / "out" / "img.png"
+    other = tmp_path / "out" / "outra.png"
+
+    placer = Placer(mode, workers=8)
+    for p in srcs:
+        placer.add(p, dst)
+        placer.add(p, tmp_path / "out" / "." / "img.png")   # mesmo destino escrito de outra forma
+    placer.add(srcs[0], other)
+    assert len(placer) == 2
+
+    counts, errors = placer.run(chunk_size=1)
+    assert errors == []
+    assert sum(counts.values()) == 2
+    assert dst.read_text() == "conteudo 39"
+    assert other.read_text() == "conteudo 0"
+
+def test_plano_salvo_sem_duplicatas(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    a.write_text("a"); b.write_text("b")
+    placer = Placer("copy")
+    placer.add(a, tmp_path / "x")
+    placer.add(b, tmp_path / "x")
+    placer.save_plan(tmp_path / "plano.jsonl")
+    again = Placer.from_plan(tmp_path / "plano.jsonl")
+    assert again.plan == [(str(b), str(tmp_path / "x"))]
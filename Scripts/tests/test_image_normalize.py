@@ -0,0 +1,21 @@
+import numpy as np
+from image_normalize import normalize
+
+def test_zoom_menor_que_um_mantem_proporcao_com_borda():
+    img = np.full((100, 200), 255, dtype=np.uint8)
+    # escala de cobertura 2.0 x 0.5 = 1.0: a imagem entra inteira, sem distorção
+    out = normalize(img, (200, 200), "zoom", extra_zoom=0.5)
+    linhas = np.flatnonzero(out.any(axis=1))
+    assert (linhas[0], linhas[-1]) == (50, 149)
+    assert out[50:150].min() == 255 and out[:50].max() == 0 and out[150:].max() == 0
+
+def test_zoom_menor_que_um_usa_a_cor_de_fundo():
+    img = np.full((40, 40, 3), 200, dtype=np.uint8)
+    out = normalize(img, (80, 80), "zoom", color=(10, 20, 30), extra_zoom=0.5)
+    assert out[0, 0].tolist() == [30, 20, 10]           # RGB -> BGR
+    assert out[20:60, 20:60].min() == 200
+
+def test_zoom_cobre_o_alvo_sem_borda():
+    img = np.full((100, 300), 255, dtype=np.uint8)
+    out = normalize(img, (128, 128), "zoom", extra_zoom=1.2)
+    assert out.min() == 255
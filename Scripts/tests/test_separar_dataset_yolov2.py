@@ -0,0 +1,28 @@
+import subprocess, sys
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "separar_dataset_yolov2.py"
+
+def _run(*args):
+    subprocess.run([sys.executable, str(SCRIPT), *map(str, args)], check=True, capture_output=True)
+
+def test_incremental_remove_copias_em_outros_splits(tmp_path):
+    root, out = tmp_path / "in", tmp_path / "out"
+    for cls in ("feminino", "masculino"):
+        for p in range(6):
+            d = root / cls / f"P{cls[0]}{p}" / "cranio"
+            d.mkdir(parents=True)
+            for k in range(2):
+                (d / f"im{k}.png").write_bytes(b"png %d %d" % (p, k))
+    _run("--root", root, "--out", out, "--copy")
+
+    # Cópias antigas do mesmo arquivo em dois splits errados
+    img = next((out / "train").rglob("*.png"))
+    cls, name = img.parent.name, img.name
+    wrong = [s for s in ("val", "test", "holdout") if not (out / s / cls / name).exists()][:2]
+    for s in wrong:
+        (out / s / cls / name).write_bytes(img.read_bytes())
+
+    _run("--root", root, "--out", out, "--incremental")
+    copies = sorted(p.parent.parent.name for p in out.rglob(name))
+    assert copies == ["train"]
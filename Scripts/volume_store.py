@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+volume_store.py — Formato de volume por série (alternativa às árvores de PNG)
+
+Cada série vira dois arquivos lado a lado:
+  <serie>.npy   pilha uint8 (N,H,W) ou (N,H,W,3), mapeável em memória
+  <serie>.json  índice: forma, dtype e metadados de cada fatia (nome, origem,
+                InstanceNumber, posição, tamanho real)
+
+Fatias de tamanhos diferentes são alinhadas no canto superior esquerdo de um
+quadro com o maior H/W da série; o tamanho real fica no índice e o leitor
+devolve a fatia já recortada (view, sem cópia). O .json é gravado por último
+e funciona como marca de volume completo.
+
+Uso (conversor, para manter as ferramentas baseadas em PNG funcionando):
+  python volume_store.py to-png   <raiz_volumes> <raiz_png>
+  python volume_store.py from-png <raiz_png> <raiz_volumes>
+"""
+
+import argparse, json, os, sys
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+INDEX_VERSION = 1
+
+def volume_paths(base):
+    """Caminhos (.npy, .json) de um volume a partir do nome-base (sem extensão)."""
+    base = Path(base)
+    return base.with_name(base.name + ".npy"), base.with_name(base.name + ".json")
+
+def write_volume(base, images, slices, meta=None):
+    """
+    Grava uma série como um único .npy + índice .json.
+    images: lista de arrays uint8 (H,W) ou (H,W,3); slices: lista de dicts com
+    os metadados de cada fatia (ao menos "name"), na mesma ordem.
+    Retorna o caminho do .npy.
+    """
+    if not images:
+        raise ValueError("Volume sem fatias")
+    npy, idx = volume_paths(base)
+    npy.parent.mkdir(parents=True, exist_ok=True)
+
+    ndim = max(im.ndim for im in images)
+    H = max(im.shape[0] for im in images)
+    W = max(im.shape[1] for im in images)
+    shape = (len(images), H, W) + ((3,) if ndim == 3 else ())
+
+    tmp_npy = npy.with_name(npy.name + ".tmp.npy")
+    vol = np.lib.format.open_memmap(tmp_npy, mode="w+", dtype=np.uint8, shape=shape)
+    entries = []
+    for k, (im, sl) in enumerate(zip(images, slices)):
+        if ndim == 3 and im.ndim == 2:
+            im = np.stack([im, im, im], axis=2)
+        h, w = im.shape[:2]
+        vol[k, :h, :w] = im[..., :3] if im.ndim == 3 else im
+        entries.append(dict(sl, shape=[h, w]))
+    vol.flush()
+    del vol
+    os.replace(tmp_npy, npy)
+
+    index = {"version": INDEX_VERSION, "shape": list(shape), "dtype": "uint8",
+             "meta": meta or {}, "slices": entries}
+    tmp_idx = idx.with_name(idx.name + ".tmp")
+    tmp_idx.write_text(json.dumps(index, indent=1, default=str), encoding="utf-8")
+    os.replace(tmp_idx, idx)
+    return npy
+
+def open_volume(base):
+    """Abre um volume em modo somente leitura: (memmap, índice)."""
+    npy, idx = volume_paths(base)
+    index = json.loads(idx.read_text(encoding="utf-8"))
+    return np.load(npy, mmap_mode="r"), index
+
+def get_slice(vol, index, k):
+    """Fatia k como view do memmap (sem cópia), recortada ao tamanho real."""
+    h, w = index["slices"][k]["shape"]
+    return vol[k, :h, :w]
+
+def iter_volumes(root):
+    """Nomes-base de todos os volumes completos (com índice) sob root."""
+    for idx in sorted(Path(root).rglob("*.json")):
+        base = idx.with_suffix("")
+        if base.with_name(base.name + ".npy").exists():
+            yield base
+
+# ---------- conversores PNG <-> volume ----------
+def volume_to_pngs(base, out_dir):
+    vol, index = open_volume(base)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for k, sl in enumerate(index["slices"]):
+        Image.fromarray(np.ascontiguousarray(get_slice(vol, index, k))).save(out_dir / f"{sl['name']}.png")
+    return len(index["slices"])
+
+def pngs_to_volume(png_dir, base):
+    files = sorted(Path(png_dir).glob("*.png"))
+    if not files:
+        return 0
+    images = [np.asarray(Image.open(f)) for f in files]
+    write_volume(base, images, [{"name": f.stem} for f in files])
+    return len(files)
+
+def main():
+    ap = argparse.ArgumentParser(description="Converte entre volumes .npy/.json por série e pastas de PNG.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("to-png", help="Volumes -> uma pasta de PNGs por série (mesma estrutura).")
+    a.add_argument("src"); a.add_argument("dst")
+    b = sub.add_parser("from-png", help="Cada pasta com PNGs -> um volume por série.")
+    b.add_argument("src"); b.add_argument("dst")
+    args = ap.parse_args()
+
+    src, dst = Path(args.src).resolve(), Path(args.dst).resolve()
+    if not src.is_dir():
+        print(f"[ERRO] Entrada não existe: {src}", file=sys.stderr); sys.exit(1)
+
+    n_series = n_slices = 0
+    if args.cmd == "to-png":
+        for base in iter_volumes(src):
+            n_slices += volume_to_pngs(base, dst / base.relative_to(src))
+            n_series += 1
+    else:
+        dirs = {p.parent for p in src.rglob("*.png")}
+        for d in sorted(dirs):
+            rel = d.relative_to(src)
+            n_slices += pngs_to_volume(d, dst / rel if rel.parts else dst / src.name)
+            n_series += 1
+    print(f"[OK] séries={n_series} | fatias={n_slices} | saída={dst}")
+
+if __name__ == "__main__":
+    main()